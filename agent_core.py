@@ -65,6 +65,8 @@ SYSTEM_PROMPT = """
 
     search_facts: Search for external facts using Tavily (e.g. food nutrition data)
 
+    run_trade_study: Sweep life support design parameters over ranges and return the Pareto front of total mass vs. reclaimed O₂ and recovered water
+
     insert_food_ratings: Used as follows:
         insert_food_ratings([
             {"crew_name": "Alexis Lewis", "food_name": "Chicken Biryani", "rating": 5},
@@ -81,7 +83,7 @@ SYSTEM_PROMPT = """
 
     Only call `run_medical_diagnosis` once you have all of that information. If some data is missing, conduct a follow-up conversation until the full symptom+severity list and mission day are known.
 
-    run_medical_diagnosis(symptoms: list, mission_day: int, centrifugal_habitat: bool = False):
+    run_medical_diagnosis(symptoms: list, mission_day: int, centrifugal_habitat: bool = False, crew_name: str = None):
         - Conduct a medical diagnosis using the expert system.
         - You must ask the user for:
             1. A list of symptoms from the set:
@@ -89,6 +91,8 @@ SYSTEM_PROMPT = """
             2. The severity of each symptom (mild, moderate, severe)
             3. The current mission day
             4. Whether the user is in a centrifugal habitat
+            5. Optionally, the crew member's name. With a name the diagnosis is saved to their
+               medical history and escalating symptoms (📈) are reported back.
     
     ONLY SUBMIT ONE SEVERITY PER SYMPTOM MENTIONED.
 
@@ -194,6 +198,11 @@ SYSTEM_PROMPT = """
     def insert_food_rating(crew_name, food_name, rating):
     def insert_beverage_rating(crew_name, beverage_name, rating):
     def insert_meal_schedule(meals, sufficiency_map=None):
+    def run_trade_study(ranges: dict, body_masses="current", limit: int = 20):
+        - ranges maps parameter names (duration, activity, co2_system, co2_scrubber_efficiency, scrubber_weight_per_kg,
+          co2_recycler_efficiency, recycler_weight, oxygen_tank_weight_per_kg, nitrogen_tank_weight_per_kg,
+          hygiene_water_per_day, use_water_recycler, water_recycler_efficiency, water_recycler_weight, weight_limit)
+          to a list of values or {"start": ..., "stop": ..., "num": ...}. co2_system is "scrubber", "recycler" or "none".
     
     Use the above argument names exactly when defining arguments for tool calls.
     When calling generate_gas_budget, you can pass "current" for body_masses and it
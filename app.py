@@ -1,26 +1,33 @@
 # app.py
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, render_template, request, redirect, url_for, Response
 from engine import LifeSupportEngine, LifeSupportFacts
-from db_utils import init_db, insert_or_update, fetch_all_records
+from engine_pool import checkout_engine
+from db_utils import insert_or_update, fetch_all_records, connect, run_migrations
 from planner import MealPlanner
 from db_utils import get_latest_remaining_mass_budget
 from db_utils import fetch_all_records, get_all_nutrition_data  # assume these already exist
-import sqlite3
 import pandas as pd 
-from db_utils import init_nutrition_db, init_beverage_db, insert_daily_meals
+from db_utils import insert_daily_meals, bulk_upsert_nutrition
 from db_utils import get_latest_duration_from_gas_budget, get_cumulative_meal_mass
 from db_utils import get_latest_gas_budget_record
 from db_utils import load_sufficiency_map, get_latest_gas_mass, get_cumulative_meal_mass
+from db_utils import plan_cache_key, get_cached_plan, put_cached_plan, get_crew_meal_preferences
 import openai
 from flask import jsonify
 from dotenv import load_dotenv
 import os
 from openai import OpenAI
 from agent_core import run_agent
-from medical_expert import SpaceMedicalExpertSystem
-from experta import Fact
+from medical_expert import RULE_BOOK, diagnose, run_expert_system, validate_triage_records, triage_batch, mission_phase_for_day
+from medical_history import record_diagnosis, get_medical_timeline, get_medical_trends
+from trade_study import study_axes, sweep_pareto_front, front_records, iter_ndjson
+from consumables import STOCK_KEYS, facts_from_gas_record, simulate_consumables, margin_summary, save_timeline
+from log_config import configure_logging, get_logger
 
 load_dotenv()
+configure_logging()
+log = get_logger('app')
+ration_log = get_logger('ration')
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # Call this early in app.py (e.g., after defining your app object)
@@ -30,13 +37,21 @@ TABLE_NAME = 'crew'
 SCHEMA = {'name': 'TEXT', 'mass': 'TEXT'}
 PRIMARY_KEY = 'name'
 
+# 'experta' runs the rule engine, 'direct' fills slots in a single pass
+PLANNER_BACKEND = os.getenv('PLANNER_BACKEND', 'experta')
+# 'estimate' sizes rations from average densities, 'solve' runs the knapsack solver
+PLAN_MODE = os.getenv('PLAN_MODE', 'estimate')
+# > 1 plans /meal_log chunks in a process pool with that many workers
+MEAL_PLAN_WORKERS = int(os.getenv('MEAL_PLAN_WORKERS', '0'))
+# 'compiled' answers /medical_diagnosis from the rule table, 'experta' runs the rule engine
+MEDICAL_BACKEND = os.getenv('MEDICAL_BACKEND', 'compiled')
+# Where /consumables_timeline?save=1 writes the timeline .npz
+CONSUMABLES_TIMELINE_PATH = os.getenv('CONSUMABLES_TIMELINE_PATH', 'consumables_timeline.npz')
+
 app = Flask(__name__)
-init_db(DB_PATH, TABLE_NAME, SCHEMA, PRIMARY_KEY)
-init_nutrition_db('nutrition.db')
-init_beverage_db('beverage.db')
+run_migrations()
 
 from flask import Flask, redirect, url_for
-import sqlite3
 
 app = Flask(__name__)
 
@@ -58,11 +73,11 @@ def chat_api():
 
 @app.route('/medical_assistant', methods=['GET'])
 def medical_assistant_page():
-    symptoms = [
-        'muscle_pain', 'vision_issue', 'stress', 'back_pain',
-        'insomnia', 'headache', 'dizziness', 'appetite_loss', 'motion_sickness'
-    ]
+    # Built-in symptoms first, then anything a rule pack adds
+    rules = RULE_BOOK.current()
+    symptoms = list(rules.symptoms)
     severities = ['mild', 'moderate', 'severe']
+    severities += [s for s in rules.severities if s not in severities]
     mission_phases = [
         {'value': 'early', 'label': 'Early (Days 0–14)'},
         {'value': 'mid', 'label': 'Mid (Days 15–89)'},
@@ -70,6 +85,10 @@ def medical_assistant_page():
     ]
     return render_template('medical_assistant.html', symptoms=symptoms, severities=severities, mission_phases=mission_phases)
 
+@app.route('/medical_rules', methods=['GET'])
+def medical_rules_status():
+    return jsonify(RULE_BOOK.status())
+
 @app.route("/clear_memory", methods=["POST"])
 def clear_memory():
     from agent_core import save_memory
@@ -85,163 +104,78 @@ def clear_memory():
 @app.route('/medical_diagnosis', methods=['POST'])
 def medical_diagnosis_api():
     data = request.get_json()
-    engine = SpaceMedicalExpertSystem()
-    engine.reset()
-
-    for entry in data.get('symptoms', []):
-        engine.declare(Fact(symptom=entry['symptom'], severity=entry['severity']))
-
-    if 'mission_phase' in data:
-        engine.declare(Fact(mission_phase=data['mission_phase']))
-
+    symptoms = data.get('symptoms', [])
+    mission_phase = data.get('mission_phase')
     # If JS sends `true` as a literal boolean, this is fine:
-    if data.get("centrifugal_habitat") is True:
-        engine.declare(Fact(centrifugal_habitat=True))
+    centrifugal_habitat = data.get("centrifugal_habitat") is True
 
+    mission_day = data.get('mission_day')
+    if mission_phase is None and isinstance(mission_day, int):
+        mission_phase = mission_phase_for_day(mission_day)
 
-    engine.run()
-    return jsonify({'recommendations': engine.get_results().split('\n')})
+    run = diagnose if MEDICAL_BACKEND == 'compiled' else run_expert_system
+    recommendations = run(symptoms, mission_phase, centrifugal_habitat)
+    response = {'recommendations': recommendations}
 
+    # 🗂️ With a crew member and mission day, keep the diagnosis in their medical history
+    crew_name = data.get('crew')
+    if crew_name and mission_day is not None:
+        try:
+            response['trends'] = record_diagnosis(
+                crew_name, mission_day, symptoms, recommendations,
+                mission_phase=mission_phase, centrifugal_habitat=centrifugal_habitat
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    return jsonify(response)
+
+
+@app.route('/medical_history/<crew_name>', methods=['GET'])
+def medical_history(crew_name):
+    start_day = request.args.get('start_day', type=int)
+    end_day = request.args.get('end_day', type=int)
+    return jsonify({
+        'crew': crew_name,
+        'timeline': get_medical_timeline(crew_name, start_day, end_day),
+        'trends': get_medical_trends(crew_name),
+    })
 
-@app.route('/clear_all_databases', methods=['POST'])
-def clear_all_databases():
-    def reset_db(path, commands):
-        conn = sqlite3.connect(path)
-        cursor = conn.cursor()
-        for cmd in commands:
-            cursor.execute(cmd)
-        conn.commit()
-        conn.close()
 
-    # === nutrition.db ===
-    reset_db('nutrition.db', [
-        "DROP TABLE IF EXISTS foods;",
-        "DROP TABLE IF EXISTS food_ratings;",
-        """
-        CREATE TABLE foods (
-            name TEXT PRIMARY KEY,
-            calories_per_gram REAL,
-            fat_per_gram REAL,
-            sugar_per_gram REAL,
-            protein_per_gram REAL
-        );
-        """,
-        """
-        CREATE TABLE food_ratings (
-            crew_name TEXT,
-            food_name TEXT,
-            rating INTEGER
-        );
-        """
-    ])
+@app.route('/medical_diagnosis/batch', methods=['POST'])
+def medical_triage_batch():
+    """
+    Triage many (crew, mission_day, symptoms, centrifugal_habitat) records at once.
+    Accepts a JSON list, {"records": [...]}, or an NDJSON body; streams NDJSON back.
+    """
+    import json
 
-    # === beverage.db ===
-    reset_db('beverage.db', [
-        "DROP TABLE IF EXISTS beverages;",
-        "DROP TABLE IF EXISTS beverage_ratings;",
-        """
-        CREATE TABLE beverages (
-            name TEXT PRIMARY KEY,
-            calories_per_gram REAL,
-            fat_per_gram REAL,
-            sugar_per_gram REAL,
-            protein_per_gram REAL
-        );
-        """,
-        """
-        CREATE TABLE beverage_ratings (
-            crew_name TEXT,
-            beverage_name TEXT,
-            rating INTEGER
-        );
-        """
-    ])
+    try:
+        if request.mimetype == 'application/x-ndjson':
+            records = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        else:
+            records = request.get_json(silent=True)
+            if isinstance(records, dict):
+                records = records.get('records')
+        validate_triage_records(records)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    # === astronauts.db ===
-    reset_db('astronauts.db', [
-        "DROP TABLE IF EXISTS crew;",
-        """
-        CREATE TABLE crew (
-            name TEXT PRIMARY KEY,
-            mass REAL
-        );
-        """
-    ])
+    log.info("🩺 Batch triage of %d records", len(records))
+    return Response(iter_ndjson(triage_batch(records)), mimetype='application/x-ndjson')
 
-    # === meal_schedule.db ===
-    reset_db('meal_schedule.db', [
-        "DROP TABLE IF EXISTS daily_meals;",
-        "DROP TABLE IF EXISTS crew_sufficiency;",
-        """
-        CREATE TABLE daily_meals (
-            crew_name TEXT,
-            day INTEGER,
-            meal INTEGER,
-            food_name TEXT,
-            food_grams REAL,
-            food_rating TEXT,
-            beverage_name TEXT,
-            beverage_grams REAL,
-            beverage_rating TEXT,
-            PRIMARY KEY (crew_name, day, meal)
-        );
-        """,
-        """
-        CREATE TABLE crew_sufficiency (
-            crew_name TEXT PRIMARY KEY,
-            sufficiency_status TEXT,
-            intake_ratio REAL
-        );
-        """
-    ])
 
-    # === gas_budget.db ===
-    reset_db('gas_budget.db', [
-        "DROP TABLE IF EXISTS gas_masses;",
-        """
-        CREATE TABLE gas_masses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            duration INTEGER,
-            crew_count INTEGER,
-            body_masses TEXT,
-            activity TEXT,
-            oxygen_tank_weight_per_kg REAL,
-            co2_generated REAL,
-            o2_required_kg REAL,
-            o2_reclaimed REAL,
-            o2_tank_mass REAL,
-            scrubber_mass REAL,
-            recycler_mass REAL,
-            total_gas_mass REAL,
-            use_scrubber BOOLEAN,
-            use_recycler BOOLEAN,
-            co2_scrubber_efficiency REAL,
-            scrubber_weight_per_kg REAL,
-            co2_recycler_efficiency REAL,
-            recycler_weight REAL,
-            within_limit BOOLEAN,
-            weight_limit REAL,
-            nitrogen_tank_weight_per_kg REAL,
-            n2_required_kg REAL,
-            n2_tank_mass REAL,
-            hygiene_water_per_day REAL,
-            water_hygiene_raw REAL,
-            water_excretion REAL,
-            water_recovered REAL,
-            water_net REAL,
-            use_water_recycler BOOLEAN,
-            water_recycler_efficiency REAL,
-            cumulative_meal_mass REAL,
-            combined_life_support_mass REAL,
-            water_recycler_mass REAL,
-            total_life_support_mass REAL,
-            base_weight_limit REAL
-        );
-        """
-    ])
+@app.route('/clear_all_databases', methods=['POST'])
+def clear_all_databases():
+    from db_utils import reset_db
+
+    # 🧼 Drop only; reset_db replays migrations.py, which owns every schema
+    reset_db('nutrition.db', ["DROP TABLE IF EXISTS foods;", "DROP TABLE IF EXISTS food_ratings;"])
+    reset_db('beverage.db', ["DROP TABLE IF EXISTS beverages;", "DROP TABLE IF EXISTS beverage_ratings;"])
+    reset_db('astronauts.db', ["DROP TABLE IF EXISTS crew;"])
+    reset_db('meal_schedule.db', ["DROP TABLE IF EXISTS daily_meals;", "DROP TABLE IF EXISTS crew_sufficiency;"])
+    reset_db('gas_budget.db', ["DROP TABLE IF EXISTS gas_masses;"])
 
-    print("🧼 All databases cleared and schemas recreated.")
+    log.info("🧼 All databases cleared and schemas recreated.")
     return redirect(url_for('index'))
 
 @app.route('/', methods=['GET', 'POST'])
@@ -420,39 +354,38 @@ def index():
             if crew_count == 0:
                 raise ValueError("No crew members found in the database.")
 
-            engine = LifeSupportEngine()
-            engine.reset()
-            engine.declare(LifeSupportFacts(
-                duration=duration,
-                crew_count=crew_count,
-                body_masses=body_masses,
-                activity=activity,
-                oxygen_tank_weight_per_kg=oxygen_tank_weight_per_kg,
-                weight_limit=weight_limit,
-                use_scrubber=use_scrubber,
-                use_recycler=use_recycler,
-                co2_scrubber_efficiency=co2_scrubber_efficiency,
-                scrubber_weight_per_kg=scrubber_weight_per_kg,
-                co2_recycler_efficiency=co2_recycler_efficiency,
-                recycler_weight=recycler_weight,
-                nitrogen_tank_weight_per_kg=nitrogen_tank_weight_per_kg,
-                hygiene_water_per_day=hygiene_water_per_day,
-                use_water_recycler=use_water_recycler,
-                water_recycler_efficiency=water_recycler_efficiency,
-                water_recycler_weight=water_recycler_weight
-            ))
-
-            print("FACTS BEING DECLARED:")
-            print(engine.facts)
-
-            engine.run()
-            results.update(engine.results)
-
-            # Add DB insertion call with all fields (including o2/n2 required)
-            from db_utils import insert_gas_budget
+            with checkout_engine(LifeSupportEngine) as engine:
+                engine.reset()
+                engine.declare(LifeSupportFacts(
+                    duration=duration,
+                    crew_count=crew_count,
+                    body_masses=body_masses,
+                    activity=activity,
+                    oxygen_tank_weight_per_kg=oxygen_tank_weight_per_kg,
+                    weight_limit=weight_limit,
+                    use_scrubber=use_scrubber,
+                    use_recycler=use_recycler,
+                    co2_scrubber_efficiency=co2_scrubber_efficiency,
+                    scrubber_weight_per_kg=scrubber_weight_per_kg,
+                    co2_recycler_efficiency=co2_recycler_efficiency,
+                    recycler_weight=recycler_weight,
+                    nitrogen_tank_weight_per_kg=nitrogen_tank_weight_per_kg,
+                    hygiene_water_per_day=hygiene_water_per_day,
+                    use_water_recycler=use_water_recycler,
+                    water_recycler_efficiency=water_recycler_efficiency,
+                    water_recycler_weight=water_recycler_weight
+                ))
+
+                get_logger('engine').debug("FACTS BEING DECLARED: %s", engine.facts)
+
+                engine.run()
+                results.update(engine.results)
+
+            # Queue the one gas_masses row for this budget (written behind the request)
+            from db_utils import queue_gas_budget
             from datetime import datetime
 
-            insert_gas_budget("gas_budget.db", {
+            queue_gas_budget("gas_budget.db", {
                 'timestamp': datetime.now().isoformat(),
                 'duration': duration,
                 'crew_count': crew_count,
@@ -495,7 +428,7 @@ def index():
             })
 
 
-            gas_mass, _, _ = get_latest_gas_mass()
+            gas_mass = results['total_life_support_mass']
             meal_mass = get_cumulative_meal_mass()
             combined_mass = round(gas_mass + meal_mass, 2)
 
@@ -520,10 +453,67 @@ def index():
 
     return render_template('index.html', results=results, crew=crew_records, status=status, status_color=status_color)
 
+@app.route('/trade_study', methods=['POST'])
+def trade_study():
+    data = request.get_json() or {}
+    body_masses = data.get('body_masses', 'current')
+    if body_masses == 'current':
+        body_masses = [float(m) for m in fetch_all_records(DB_PATH, TABLE_NAME)['mass'].tolist()]
+    if not body_masses:
+        return jsonify({'error': 'No crew members found in the database.'}), 400
+
+    # Validate the ranges before the response starts streaming
+    ranges = data.get('ranges', {})
+    try:
+        study_axes(ranges)
+    except (ValueError, KeyError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        front, _ = sweep_pareto_front(ranges, body_masses)
+        yield from iter_ndjson(front_records(front))
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/consumables_timeline', methods=['GET'])
+def consumables_timeline():
+    record = get_latest_gas_budget_record()
+    if not record:
+        return jsonify({'error': 'No gas budget record found. Run the life support calculator first.'}), 400
+
+    facts = facts_from_gas_record(record)
+    if request.args.get('duration', type=int):
+        facts['duration'] = request.args.get('duration', type=int)
+
+    # 📦 Launch inventory from the query string; anything left out defaults to
+    # what the engine provisions for the mission, which never runs short
+    stocks = {}
+    for key in STOCK_KEYS:
+        value = request.args.get(key)
+        if value is None:
+            continue
+        try:
+            stocks[key] = float(value)
+        except ValueError:
+            return jsonify({'error': f'{key} must be a number of kg.'}), 400
+
+    timeline = simulate_consumables(facts, stocks=stocks)
+
+    response = {'duration': facts['duration'], 'stocks': stocks, 'margins': margin_summary(timeline)}
+    if request.args.get('save') == '1':
+        response['saved_to'] = save_timeline(timeline, CONSUMABLES_TIMELINE_PATH)
+    if request.args.get('series') == '1':
+        response['series'] = {name: values.tolist() for name, values in timeline.items()}
+    return jsonify(response)
+
 @app.route('/clear_gas_database')
 def clear_database():
-    import sqlite3
-    conn = sqlite3.connect("gas_budget.db")
+    from db_utils import flush_gas_budget_writes
+    try:
+        flush_gas_budget_writes("gas_budget.db")
+    except ValueError as e:
+        log.warning("%s (discarded by the clear)", e)
+    conn = connect("gas_budget.db")
     cursor = conn.cursor()
     cursor.execute("DELETE FROM gas_masses")
     conn.commit()
@@ -548,7 +538,7 @@ def add_or_edit_crew():
 
 
 def get_last_meal_day(db_path, crew_name):
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cursor = conn.cursor()
     cursor.execute("""
         SELECT MAX(day) FROM daily_meals WHERE crew_name = ?
@@ -559,157 +549,66 @@ def get_last_meal_day(db_path, crew_name):
 
 @app.route('/clear_meals', methods=['POST'])
 def clear_meals():
-    import sqlite3
-    conn = sqlite3.connect('meal_schedule.db')
-    cursor = conn.cursor()
-    cursor.execute("DROP TABLE IF EXISTS daily_meals;")
-    cursor.execute("DROP TABLE IF EXISTS crew_sufficiency;")
-    conn.commit()
-    conn.close()
-    print("🧼 Meal database cleared.")
+    from db_utils import reset_db
+
+    # reset_db replays the migrations, so the tables come back empty
+    reset_db('meal_schedule.db', [
+        "DROP TABLE IF EXISTS daily_meals;",
+        "DROP TABLE IF EXISTS crew_sufficiency;",
+    ])
+    log.info("🧼 Meal database cleared.")
     return redirect(url_for('meal_log'))  # or another relevant page
 
 @app.route('/ration', methods=['POST'], endpoint='ration_meal_database')
 def ration_meal_database():
-    print("🚨 /ration endpoint called!")
+    log.info("🚨 /ration endpoint called!")
 
-    import sqlite3
     import pandas as pd
     from db_utils import (
-        get_cumulative_meal_mass,
         fetch_all_records,
         get_all_nutrition_data,
-        insert_daily_meals,
+        update_rationed_meals,
         get_latest_remaining_mass_budget
     )
+    from ration import ration_schedule
 
     MEAL_DB = 'meal_schedule.db'
     CREW_DB = 'astronauts.db'
 
     # 🍱 Load meals and crew info
-    conn = sqlite3.connect(MEAL_DB)
+    conn = connect(MEAL_DB)
     df = pd.read_sql("SELECT * FROM daily_meals", conn)
     conn.close()
 
     crew_df = fetch_all_records(CREW_DB, 'crew')
     crew_mass_map = dict(zip(crew_df['name'], crew_df['mass']))
 
-    # 🔍 Get nutrition info and lowercase the maps
     food_df, beverage_df, _, _ = get_all_nutrition_data()
-    food_cpg_map = {
-        row['name'].strip().lower(): row['calories_per_gram']
-        for _, row in food_df.iterrows()
-    }
-    bev_cpg_map = {
-        row['name'].strip().lower(): row['calories_per_gram']
-        for _, row in beverage_df.iterrows()
-    }
 
-    # 🚀 Get total allowed mass per person
+    # 🚀 Scale every crew member's food to an equal share of the remaining budget
     total_budget = get_latest_remaining_mass_budget()
-    crew_names = df['crew_name'].unique().tolist()
-    per_crew_budget = total_budget / len(crew_names)
-
-    final_meals = []
-    sufficiency_map = {}
-
-    for name in crew_names:
-        crew_meals = df[df['crew_name'] == name].copy()
-        total_food_mass = crew_meals['food_grams'].sum()
-        total_bev_mass = crew_meals['beverage_grams'].sum()
-        scaling_ratio = min(1.0, (per_crew_budget - total_bev_mass / 1000.0) / (total_food_mass / 1000.0))
-        print(f"\n🔍 {name} — Food Mass: {round(total_food_mass, 1)}g, Bev Mass: {round(total_bev_mass,1)}g, Budget: {round(per_crew_budget,2)}kg, Scaling Ratio: {round(scaling_ratio, 3)}")
-
-        scaled_kcal = 0.0
-        for _, row in crew_meals.iterrows():
-            food_name = row['food_name']
-            bev_name = row['beverage_name']
-            normalized_food = food_name.strip().lower()
-            normalized_bev = bev_name.strip().lower()
-
-            food_cpg = food_cpg_map.get(normalized_food, 0)
-            bev_cpg = bev_cpg_map.get(normalized_bev, 0)
-            food_cpg = food_cpg_map.get(normalized_food, 0)
-
-            scaled_food_grams = round(row['food_grams'] * scaling_ratio, 2)
-            food_kcal = scaled_food_grams * food_cpg
-            scaled_kcal += food_kcal
-
-            print(f"🧪 Scaling ratio for {name}: {scaling_ratio} | Old: {row['food_grams']}g → New: {scaled_food_grams}g")
-
-            print(f"  🍽️ {food_name}: {scaled_food_grams}g × {food_cpg} kcal/g = {round(food_kcal, 2)} kcal")
-
-            final_meals.append({
-                'crew_name': name,
-                'day': row['day'],
-                'meal': row['meal'],
-                'food_name': food_name,
-                'food_grams': scaled_food_grams,
-                'food_rating': row['food_rating'],
-                'beverage_name': bev_name,
-                'beverage_grams': row['beverage_grams'],
-                'beverage_rating': row['beverage_rating'],
-            })
-
-        # 🔁 Compute sufficiency
-        body_mass = float(crew_mass_map[name])
-        unique_days = len(set(m['day'] for m in final_meals if m['crew_name'] == name))
-        baseline_target = body_mass * 40  # kcal/day
-        avg_food_cpg = sum(food_cpg_map.values()) / len(food_cpg_map) if food_cpg_map else 1.5
-        avg_bev_cpg = sum(bev_cpg_map.values()) / len(bev_cpg_map) if bev_cpg_map else 0.5
-        avg_kcal_per_gram = (avg_food_cpg + avg_bev_cpg) / 2
-
-        per_person_mass_budget = total_budget / len(crew_names)
-        water_mass_per_day = 3 * 250 / 1000  # 750g
-        food_mass_limit = max(per_person_mass_budget - water_mass_per_day, 0.01)
-        estimated_max_kcal = food_mass_limit * avg_kcal_per_gram
-
-        adjusted_target = max(min(baseline_target, estimated_max_kcal), 1200)  # 400×3 min
-        target_kcal = adjusted_target * unique_days
-
-
-        intake_ratio = scaled_kcal / target_kcal if target_kcal > 0 else 0
+    rationed, sufficiency_map = ration_schedule(df, food_df, beverage_df, crew_mass_map, total_budget)
+    ration_log.debug("🧪 Rationed %d meals for %d crew", len(rationed), len(sufficiency_map))
 
-        if intake_ratio < 0.85:
-            suff_status = 'insufficient'
-        elif intake_ratio < 0.95:
-            suff_status = 'moderate'
-        else:
-            suff_status = 'sufficient'
-
-        sufficiency_map[name] = {
-            'status': suff_status,
-            'intake_ratio': round(intake_ratio, 3)
-        }
-
-        print(f"📊 {name} target kcal = {round(target_kcal, 1)} | intake = {round(scaled_kcal, 1)} | ratio = {round(intake_ratio, 3)} → {suff_status}")
-
-    # 💥 Overwrite meal DB
-    conn = sqlite3.connect(MEAL_DB)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM daily_meals")
-    cursor.execute("DELETE FROM crew_sufficiency")
-    conn.commit()
-    conn.close()
-
-    # 💾 Save new meals and sufficiency map
-    insert_daily_meals(MEAL_DB, final_meals, sufficiency_map)
+    # 💾 Write back only the rows that were scaled, and replace the sufficiency map
+    changed = rationed[rationed['food_grams'].ne(df['food_grams'])]
+    update_rationed_meals(MEAL_DB, changed, sufficiency_map)
     referer = request.referrer or url_for('index')
     return redirect(referer)
 
 @app.route('/meal_log')
 def meal_log():
-    import sqlite3
     import pandas as pd
     from db_utils import (
         fetch_all_records,
-        get_all_nutrition_data,
         get_latest_remaining_mass_budget,
         insert_daily_meals,
         get_last_meal_day,
-        load_sufficiency_map
+        load_sufficiency_map,
+        get_catalog_records,
+        get_crew_meal_preferences
     )
-    from planner import MealPlanner
+    from planner import plan_meal_chunks
 
     DB_PATH = 'astronauts.db'
     MEAL_DB = 'meal_schedule.db'
@@ -718,24 +617,9 @@ def meal_log():
     min_kcal_per_meal = 400
     min_kcal_per_day = min_kcal_per_meal * meals_per_day
 
-    # Check if daily_meals table exists and needs to be filled
-    conn = sqlite3.connect(MEAL_DB)
+    # Check whether daily_meals needs to be filled
+    conn = connect(MEAL_DB)
     cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS daily_meals (
-            crew_name TEXT,
-            day INTEGER,
-            meal INTEGER,
-            food_name TEXT,
-            food_grams REAL,
-            food_rating TEXT,
-            beverage_name TEXT,
-            beverage_grams REAL,
-            beverage_rating TEXT,
-            PRIMARY KEY (crew_name, day, meal)
-        );
-    """)
-    conn.commit()
     cursor.execute("SELECT COUNT(*) FROM daily_meals")
     current_rows = cursor.fetchone()[0]
     conn.close()
@@ -748,12 +632,11 @@ def meal_log():
     sufficiency_map = None
 
     if current_rows < total_meals_expected:
-        print("📅 Generating missing meal plans...")
-        food_df, beverage_df, food_ratings, beverage_ratings = get_all_nutrition_data()
+        log.info("📅 Generating missing meal plans...")
         try:
             mass_budget = get_latest_remaining_mass_budget()
         except ValueError as e:
-            print(str(e))
+            log.warning("%s", e)
             # Option 1: Render a friendly template with no meals
             return render_template('meal_calendar.html', calendar_data=[], sufficiency_map={})
             
@@ -762,24 +645,22 @@ def meal_log():
 
         all_meals = []
         sufficiency_map = {}
+        tasks = []
+        # Catalog once; ratings and rating > 1 averages per crew come from one SQL pass
+        food_records, beverage_records = get_catalog_records()
+        preferences = get_crew_meal_preferences(crew_names)
+        seed = request.args.get('seed', type=int)
 
         for name, mass in zip(crew_names, body_masses):
             baseline_target = round(mass * 40, 2)  # ✅ daily need (e.g., 2400 kcal)
             last_day = get_last_meal_day(MEAL_DB, name)
 
-            crew_food_ratings = food_ratings[food_ratings['crew_name'] == name].set_index('food_name')['rating'].to_dict()
-            crew_bev_ratings = beverage_ratings[beverage_ratings['crew_name'] == name].set_index('beverage_name')['rating'].to_dict()
-
-            crew_foods = food_df.copy()
-            crew_foods['rating'] = crew_foods['name'].str.lower().map(lambda x: crew_food_ratings.get(x, 0))
-            eligible_foods = crew_foods[crew_foods['rating'] > 1]
+            crew_prefs = preferences[name]
+            crew_food_ratings = crew_prefs['food_ratings']
+            crew_bev_ratings = crew_prefs['beverage_ratings']
 
-            crew_bevs = beverage_df.copy()
-            crew_bevs['rating'] = crew_bevs['name'].str.lower().map(lambda x: crew_bev_ratings.get(x, 0))
-            eligible_bevs = crew_bevs[crew_bevs['rating'] > 1]
-
-            avg_food_cpg = eligible_foods['calories_per_gram'].mean() if not eligible_foods.empty else 1.5
-            avg_bev_cpg = eligible_bevs['calories_per_gram'].mean() if not eligible_bevs.empty else 0.5
+            avg_food_cpg = crew_prefs['avg_food_cpg'] if crew_prefs['avg_food_cpg'] is not None else 1.5
+            avg_bev_cpg = crew_prefs['avg_bev_cpg'] if crew_prefs['avg_bev_cpg'] is not None else 0.5
             avg_kcal_per_gram = (avg_food_cpg + avg_bev_cpg) / 2
 
             # Estimate how many kcal we can reasonably support
@@ -791,38 +672,35 @@ def meal_log():
             adjusted_target = max(min(baseline_target, estimated_max_kcal), min_kcal_per_day)
 
             for start_day in range(last_day + 1, duration + 1, 7):
-                planner = MealPlanner(
-                    name=name,
-                    calorie_target=adjusted_target,  # ✅ per-day target, not total
-                    food_list=food_df.to_dict('records'),
-                    beverage_list=beverage_df.to_dict('records'),
-                    food_ratings=crew_food_ratings,
-                    beverage_ratings=crew_bev_ratings,
-                    duration=min(7, duration - start_day + 1),
-                    start_day=start_day
-                )
-
-                result = planner.plan_within_mass_budget(mass_budget)
-
-                sufficiency_map[name] = {
-                    'status': result['sufficiency_status'],
-                    'intake_ratio': result['intake_ratio']
-                }
-
-                for meal in result['schedule']:
-                    meal['crew_name'] = name
-                    meal['food_name'] = meal.pop('food')
-                    meal['beverage_name'] = meal.pop('beverage')
-                    meal['food_rating'] = planner.food_ratings.get(meal['food_name'].lower(), '–')
-                    meal['beverage_rating'] = planner.beverage_ratings.get(meal['beverage_name'].lower(), '–')
-
-                all_meals.extend(result['schedule'])
-
-        print(f"✅ Inserting {len(all_meals)} total meals for all crew")
+                tasks.append({
+                    'name': name,
+                    'calorie_target': adjusted_target,  # ✅ per-day target, not total
+                    'food_list': food_records,
+                    'beverage_list': beverage_records,
+                    'food_ratings': crew_food_ratings,
+                    'beverage_ratings': crew_bev_ratings,
+                    'duration': min(7, duration - start_day + 1),
+                    'start_day': start_day,
+                    'backend': PLANNER_BACKEND,
+                    'mode': PLAN_MODE,
+                    'mass_budget': mass_budget,
+                    'seed': seed
+                })
+
+        # Results come back in task order, so the last chunk per crew sets sufficiency
+        for result in plan_meal_chunks(tasks, max_workers=MEAL_PLAN_WORKERS):
+            name = result['crew_member']
+            sufficiency_map[name] = {
+                'status': result['sufficiency_status'],
+                'intake_ratio': result['intake_ratio']
+            }
+            all_meals.extend(result['schedule'])
+
+        log.info("✅ Inserting %d total meals for all crew", len(all_meals))
         insert_daily_meals(MEAL_DB, all_meals, sufficiency_map)
 
     # Load for display
-    conn = sqlite3.connect(MEAL_DB)
+    conn = connect(MEAL_DB)
     df = pd.read_sql("SELECT * FROM daily_meals ORDER BY crew_name, day, meal", conn)
     conn.close()
 
@@ -833,7 +711,7 @@ def meal_log():
     calendar_data = [{'crew': crew, 'schedule': meals} for crew, meals in grouped.items()]
 
     if sufficiency_map is None:
-        conn = sqlite3.connect(MEAL_DB)
+        conn = connect(MEAL_DB)
         sufficiency_map = load_sufficiency_map(conn)
         conn.close()
 
@@ -841,26 +719,23 @@ def meal_log():
 
 @app.route('/regenerate_meals', methods=['POST'])
 def regenerate_meals():
-    import sqlite3
+    from db_utils import reset_db
 
-    # Wipe existing meals
-    conn = sqlite3.connect('meal_schedule.db')
-    cursor = conn.cursor()
-    cursor.execute("DROP TABLE IF EXISTS daily_meals;")
-    conn.commit()
-    conn.close()
+    # Wipe existing meals (the migrations recreate the empty table)
+    reset_db('meal_schedule.db', ["DROP TABLE IF EXISTS daily_meals;"])
 
-    print("🧼 Meal schedule wiped. Redirecting to /meal_log to regenerate.")
+    log.info("🧼 Meal schedule wiped. Redirecting to /meal_log to regenerate.")
     return redirect('/meal_log')
 
 
 
 @app.route('/clear_crew', methods=['POST'])
 def clear_crew():
-    from sqlite3 import connect
-    with connect(DB_PATH) as conn:
-        conn.execute(f"DELETE FROM {TABLE_NAME}")
-        conn.commit()
+    conn = connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(f"DELETE FROM {TABLE_NAME}")
+    conn.commit()
+    conn.close()
     return redirect(url_for('index'))
 
 
@@ -878,26 +753,44 @@ def meal_plan():
         calorie_targets[name] = round(mass * kcal_per_kg[activity], 2)
 
     mass_budget = get_latest_remaining_mass_budget()
+    seed = request.args.get('seed', type=int)
 
     food_df, beverage_df, food_ratings, beverage_ratings = get_all_nutrition_data()
     if 'name' in food_df.columns:
         food_df = food_df.rename(columns={'name': 'food_name'})
     if 'name' in beverage_df.columns:
         beverage_df = beverage_df.rename(columns={'name': 'beverage_name'})
+
+    # ♻️ Serve repeated views from the plan cache
+    cache_key = plan_cache_key(
+        'meal_plan', crew_df, food_df, beverage_df, food_ratings, beverage_ratings,
+        mass_budget, 7, seed, PLANNER_BACKEND, PLAN_MODE
+    )
+    results = get_cached_plan(cache_key)
+    if results is not None:
+        return render_template('meal_plan.html', results=results, total_mass_budget=mass_budget)
+
     results = []
+    preferences = get_crew_meal_preferences(crew_names)
 
     for name in crew_names:
-        planner = MealPlanner(
+        with checkout_engine(
+            MealPlanner,
             name=name,
             calorie_target=calorie_targets[name],
             food_list=food_df.to_dict('records'),
             beverage_list=beverage_df.to_dict('records'),
-            food_ratings=food_ratings[food_ratings['crew_name'] == name].set_index('food_name')['rating'].to_dict(),
-            beverage_ratings=beverage_ratings[beverage_ratings['crew_name'] == name].set_index('beverage_name')['rating'].to_dict(),
-            duration=7
-        )
-        result = planner.plan_within_mass_budget(mass_budget)
-        results.append(result)
+            food_ratings=preferences[name]['food_ratings'],
+            beverage_ratings=preferences[name]['beverage_ratings'],
+            duration=7,
+            start_day=1,
+            backend=PLANNER_BACKEND,
+            seed=f"{seed}:{name}" if seed is not None else None
+        ) as planner:
+            result = planner.plan_within_mass_budget(mass_budget, mode=PLAN_MODE)
+            results.append(result)
+
+    put_cached_plan(cache_key, results)
 
     return render_template('meal_plan.html', results=results, total_mass_budget=mass_budget)
 
@@ -907,13 +800,13 @@ def setup_foods():
     crew = fetch_all_records(DB_PATH, TABLE_NAME)['name'].tolist()
     
     # Foods from nutrition.db
-    food_conn = sqlite3.connect('nutrition.db')
+    food_conn = connect('nutrition.db')
     food_df = pd.read_sql("SELECT * FROM foods", food_conn)
     food_ratings = pd.read_sql("SELECT * FROM food_ratings", food_conn)
     food_conn.close()
 
     # Beverages from beverage.db
-    bev_conn = sqlite3.connect('beverage.db')
+    bev_conn = connect('beverage.db')
     beverage_df = pd.read_sql("SELECT * FROM beverages", bev_conn)
     beverage_ratings = pd.read_sql("SELECT * FROM beverage_ratings", bev_conn)
     bev_conn.close()
@@ -935,7 +828,7 @@ def add_beverage():
         'sugar_per_gram': float(request.form.get('sugar', 0) or 0),
         'protein_per_gram': float(request.form.get('protein', 0) or 0)
     }
-    conn = sqlite3.connect('beverage.db')
+    conn = connect('beverage.db')
     cursor = conn.cursor()
     cursor.execute("""
         INSERT INTO beverages (name, calories_per_gram, fat_per_gram, sugar_per_gram, protein_per_gram)
@@ -956,7 +849,7 @@ def rate_beverage():
     bev_name = request.form['beverage_name']
     rating = int(request.form['rating'])
 
-    conn = sqlite3.connect('beverage.db')
+    conn = connect('beverage.db')
     cursor = conn.cursor()
     cursor.execute("""
         INSERT INTO beverage_ratings (crew_name, beverage_name, rating)
@@ -988,39 +881,9 @@ def upload_beverage_csv():
         if not required_cols.issubset(df.columns):
             raise ValueError("CSV must include at least 'name' and 'calories_per_gram' columns.")
 
-        conn = sqlite3.connect('beverage.db')
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS beverages (
-                name TEXT PRIMARY KEY,
-                calories_per_gram REAL NOT NULL,
-                fat_per_gram REAL DEFAULT 0,
-                sugar_per_gram REAL DEFAULT 0,
-                protein_per_gram REAL DEFAULT 0
-            );
-        """)
-
-        for _, row in df.iterrows():
-            cursor.execute("""
-                INSERT INTO beverages (name, calories_per_gram, fat_per_gram, sugar_per_gram, protein_per_gram)
-                VALUES (?, ?, ?, ?, ?)
-                ON CONFLICT(name) DO UPDATE SET
-                    calories_per_gram=excluded.calories_per_gram,
-                    fat_per_gram=excluded.fat_per_gram,
-                    sugar_per_gram=excluded.sugar_per_gram,
-                    protein_per_gram=excluded.protein_per_gram;
-            """, (
-                row['name'],
-                float(row['calories_per_gram']),
-                float(row.get('fat_per_gram', 0) or 0),
-                float(row.get('sugar_per_gram', 0) or 0),
-                float(row.get('protein_per_gram', 0) or 0)
-            ))
-
-        conn.commit()
-        conn.close()
+        bulk_upsert_nutrition('beverage.db', 'beverages', df)
     except Exception as e:
-        print(f"Upload error: {e}")
+        log.warning("Upload error: %s", e)
     return redirect(url_for('setup_foods'))
 
 def safe_float(val, default=0.0):
@@ -1038,7 +901,7 @@ def add_food():
         'sugar_per_gram': safe_float(request.form.get('sugar')),
         'protein_per_gram': safe_float(request.form.get('protein'))
     }
-    conn = sqlite3.connect('nutrition.db')
+    conn = connect('nutrition.db')
     cursor = conn.cursor()
     cursor.execute("""
         INSERT INTO foods (name, calories_per_gram, fat_per_gram, sugar_per_gram, protein_per_gram)
@@ -1058,7 +921,7 @@ def rate_food():
     crew_name = request.form['crew_name']
     food_name = request.form['food_name']
     rating = int(request.form['rating'])
-    conn = sqlite3.connect('nutrition.db')
+    conn = connect('nutrition.db')
     cursor = conn.cursor()
     cursor.execute("""
         INSERT INTO food_ratings (crew_name, food_name, rating)
@@ -1090,36 +953,29 @@ def upload_food_csv():
 
         df = pd.read_csv(filepath)
 
-        conn = sqlite3.connect('nutrition.db')
-        cursor = conn.cursor()
-        for _, row in df.iterrows():
-            try:
-                cursor.execute("""
-                    INSERT INTO foods (name, calories_per_gram, fat_per_gram, sugar_per_gram, protein_per_gram)
-                    VALUES (?, ?, ?, ?, ?)
-                    ON CONFLICT(name) DO UPDATE SET
-                        calories_per_gram=excluded.calories_per_gram,
-                        fat_per_gram=excluded.fat_per_gram,
-                        sugar_per_gram=excluded.sugar_per_gram,
-                        protein_per_gram=excluded.protein_per_gram;
-                """, (
-                    row['name'].strip(),
-                    float(row['calories_per_gram']),
-                    float(row.get('fat_per_gram', 0) or 0),
-                    float(row.get('sugar_per_gram', 0) or 0),
-                    float(row.get('protein_per_gram', 0) or 0)
-                ))
-            except Exception as e:
-                print(f"Skipping row due to error: {e}")
-                continue
-        conn.commit()
-        conn.close()
+        bulk_upsert_nutrition('nutrition.db', 'foods', df, strip_names=True, skip_invalid=True)
 
         return redirect(url_for('setup_foods'))  # ✅ SUCCESSFUL POST
 
     # ✅ ENSURE GET REQUEST RETURNS A RESPONSE
     return render_template('upload_food_csv.html')
 
+def store_calendar_meals(calendar_data):
+    """Write every crew member's calendar schedule into daily_meals."""
+    insert_daily_meals('meal_schedule.db', [
+        dict(meal, food_name=meal['food'], beverage_name=meal['beverage'])
+        for entry in calendar_data
+        for meal in entry['schedule']
+    ], {})
+
+
+def render_meal_calendar(calendar_data):
+    conn = connect('meal_schedule.db')
+    sufficiency_map = load_sufficiency_map(conn)
+    conn.close()
+    return render_template('meal_calendar.html', calendar_data=calendar_data, sufficiency_map=sufficiency_map)
+
+
 @app.route('/meal_calendar', methods=['GET'])
 def meal_calendar():
     crew_df = fetch_all_records(DB_PATH, TABLE_NAME)
@@ -1132,40 +988,57 @@ def meal_calendar():
 
     food_df, beverage_df, food_ratings, beverage_ratings = get_all_nutrition_data()
     mass_budget = get_latest_remaining_mass_budget()
+    seed = request.args.get('seed', type=int)
+
+    # ♻️ A cache hit skips planning, but daily_meals may have been cleared or
+    # overwritten since, so the cached schedule is written back either way
+    cache_key = plan_cache_key(
+        'meal_calendar', crew_df, food_df, beverage_df, food_ratings, beverage_ratings,
+        mass_budget, 7, seed, PLANNER_BACKEND, PLAN_MODE
+    )
+    calendar_data = get_cached_plan(cache_key)
+    if calendar_data is not None:
+        store_calendar_meals(calendar_data)
+        return render_meal_calendar(calendar_data)
 
     calendar_data = []
+    preferences = get_crew_meal_preferences(crew_names)
 
     for name in crew_names:
-        planner = MealPlanner(
+        with checkout_engine(
+            MealPlanner,
             name=name,
             calorie_target=calorie_targets[name],
             food_list=food_df.to_dict('records'),
             beverage_list=beverage_df.to_dict('records'),
-            food_ratings=food_ratings[food_ratings['crew_name'] == name].set_index('food_name')['rating'].to_dict(),
-            beverage_ratings=beverage_ratings[beverage_ratings['crew_name'] == name].set_index('beverage_name')['rating'].to_dict(),
-            duration=7
-        )
-        result = planner.plan_within_mass_budget(mass_budget)
-        for meal in result['schedule']:
-            meal['crew_name'] = name
-            meal['food_rating'] = planner.food_ratings.get(meal['food'])
-            meal['beverage_rating'] = planner.beverage_ratings.get(meal['beverage'])
-
-        insert_daily_meals('meal_schedule.db', result['schedule'])
-
-
-        # Add preference rating to each food entry
-        for meal in result['schedule']:
-            meal['rating'] = planner.food_ratings.get(meal['food'], '-')
-
-        calendar_data.append({
-            'crew': name,
-            'schedule': result['schedule'],
-            'duration': planner.duration,
-            'meals_per_day': planner.meals_per_day
-        })
+            food_ratings=preferences[name]['food_ratings'],
+            beverage_ratings=preferences[name]['beverage_ratings'],
+            duration=7,
+            start_day=1,
+            backend=PLANNER_BACKEND,
+            seed=f"{seed}:{name}" if seed is not None else None
+        ) as planner:
+            result = planner.plan_within_mass_budget(mass_budget, mode=PLAN_MODE)
+            for meal in result['schedule']:
+                meal['crew_name'] = name
+                meal['food_rating'] = planner.food_ratings.get(meal['food'])
+                meal['beverage_rating'] = planner.beverage_ratings.get(meal['beverage'])
+
+            # Add preference rating to each food entry
+            for meal in result['schedule']:
+                meal['rating'] = planner.food_ratings.get(meal['food'], '-')
+
+            calendar_data.append({
+                'crew': name,
+                'schedule': result['schedule'],
+                'duration': planner.duration,
+                'meals_per_day': planner.meals_per_day
+            })
+
+    store_calendar_meals(calendar_data)
+    put_cached_plan(cache_key, calendar_data)
 
-    return render_template('meal_calendar.html', calendar_data=calendar_data)
+    return render_meal_calendar(calendar_data)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,380 @@
+# benchmarks.py
+"""
+Micro-benchmarks for the planning and life support hot paths.
+
+Run with:  python benchmarks.py
+"""
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import db_utils
+from consumables import simulate_consumables
+from engine import LifeSupportEngine, LifeSupportFacts, compute_life_support_arrays, simulate_life_support_mass
+from engine_pool import EnginePool
+from log_config import LOGGER_ROOT, get_logger
+from medical_expert import SpaceMedicalExpertSystem, diagnose, run_expert_system
+from planner import MealPlanner
+
+
+def synthetic_catalog(n_foods=12, n_beverages=8):
+    """Build food/beverage lists and ratings shaped like the nutrition.db rows."""
+    foods = [{'name': f'food_{i}', 'calories_per_gram': 1.0 + (i % 10) * 0.25} for i in range(n_foods)]
+    beverages = [{'name': f'bev_{i}', 'calories_per_gram': 0.1 + (i % 5) * 0.1} for i in range(n_beverages)]
+    food_ratings = {f['name']: 2 + i % 4 for i, f in enumerate(foods)}
+    beverage_ratings = {b['name']: 2 + i % 4 for i, b in enumerate(beverages)}
+    return foods, beverages, food_ratings, beverage_ratings
+
+
+def time_call(fn, repeat=3):
+    """Best-of-N wall time in seconds, with stdout from the call discarded."""
+    best = float('inf')
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_planner_durations(durations=(7, 14, 28, 56), backend='experta', n_foods=12, n_beverages=8):
+    """Planning time for one crew member as the mission duration grows."""
+    foods, beverages, food_ratings, beverage_ratings = synthetic_catalog(n_foods, n_beverages)
+
+    def plan(duration):
+        planner = MealPlanner(
+            name='bench',
+            calorie_target=2400,
+            food_list=[dict(f) for f in foods],
+            beverage_list=[dict(b) for b in beverages],
+            start_day=1,
+            food_ratings=food_ratings,
+            beverage_ratings=beverage_ratings,
+            duration=duration,
+            backend=backend
+        )
+        planner.run_planner()
+
+    print(f"📈 MealPlanner [{backend}] — {n_foods} foods, {n_beverages} beverages")
+    timings = {}
+    for duration in durations:
+        timings[duration] = time_call(lambda: plan(duration))
+        print(f"   {duration:>4} days: {timings[duration] * 1000:9.1f} ms")
+    return timings
+
+
+def random_scenarios(n, seed=0):
+    """n random life support configurations as compute_life_support_arrays kwargs."""
+    rng = np.random.default_rng(seed)
+    crew_count = rng.integers(1, 13, n)
+    use_scrubber = rng.random(n) < 0.5
+    return {
+        'duration': rng.integers(7, 1000, n),
+        'crew_count': crew_count,
+        'body_mass_total': crew_count * rng.uniform(55, 95, n),
+        'activity': rng.integers(0, 3, n),
+        'oxygen_tank_weight_per_kg': rng.uniform(0.5, 2.0, n),
+        'weight_limit': rng.uniform(1000, 50000, n),
+        'use_scrubber': use_scrubber,
+        'use_recycler': ~use_scrubber,
+        'co2_scrubber_efficiency': rng.uniform(50, 100, n),
+        'scrubber_weight_per_kg': rng.uniform(0.1, 1.0, n),
+        'co2_recycler_efficiency': rng.uniform(30, 90, n),
+        'recycler_weight': rng.uniform(100, 800, n),
+        'nitrogen_tank_weight_per_kg': rng.uniform(0.5, 2.0, n),
+        'hygiene_water_per_day': rng.uniform(500, 3000, n),
+        'use_water_recycler': rng.random(n) < 0.8,
+        'water_recycler_efficiency': rng.uniform(50, 98, n),
+        'water_recycler_weight': rng.uniform(100, 600, n),
+    }
+
+
+def bench_life_support_batch(sizes=(1_000, 100_000, 1_000_000)):
+    """Throughput of the vectorized life support model."""
+    print("📈 compute_life_support_arrays")
+    timings = {}
+    for n in sizes:
+        scenarios = random_scenarios(n)
+        timings[n] = time_call(lambda: compute_life_support_arrays(**scenarios))
+        print(f"   {n:>9,} scenarios: {timings[n] * 1000:9.1f} ms")
+    return timings
+
+
+def bench_monte_carlo(samples=100_000, workers=0):
+    """Wall time of a Monte Carlo mass budget with five uncertain inputs."""
+    facts = {
+        'duration': 180, 'body_masses': [70, 82, 65, 90], 'activity': 'moderate',
+        'oxygen_tank_weight_per_kg': 1.2, 'weight_limit': 12000,
+        'use_scrubber': False, 'use_recycler': True,
+        'co2_scrubber_efficiency': 0, 'scrubber_weight_per_kg': 0,
+        'co2_recycler_efficiency': 70, 'recycler_weight': 400,
+        'nitrogen_tank_weight_per_kg': 1.2, 'hygiene_water_per_day': 1500,
+        'use_water_recycler': True, 'water_recycler_efficiency': 85, 'water_recycler_weight': 450,
+    }
+    distributions = {
+        'co2_recycler_efficiency': {'dist': 'normal', 'mean': 70, 'std': 8, 'min': 0, 'max': 100},
+        'water_recycler_efficiency': {'dist': 'triangular', 'left': 70, 'mode': 85, 'right': 93},
+        'hygiene_water_per_day': {'dist': 'uniform', 'low': 1000, 'high': 2500},
+        'activity': {'dist': 'choice', 'values': ['low', 'moderate', 'daily'], 'p': [0.2, 0.6, 0.2]},
+        'oxygen_tank_weight_per_kg': {'dist': 'normal', 'mean': 1.2, 'std': 0.1, 'min': 0},
+    }
+    result = {}
+    elapsed = time_call(lambda: result.update(
+        simulate_life_support_mass(facts, distributions, samples=samples, seed=0, workers=workers)
+    ))
+    print(f"📈 simulate_life_support_mass — {samples:,} samples, workers={workers}: {elapsed * 1000:.1f} ms")
+    print(f"   {result['percentiles']} | P(exceed) = {result['prob_exceed_limit']}")
+    return elapsed
+
+
+def bench_consumables_timeline(duration=3650, crew_count=50):
+    """Day-by-day consumables simulation for a long mission with a full meal schedule."""
+    facts = {
+        'duration': duration, 'body_masses': [75.0] * crew_count, 'activity': 'moderate',
+        'oxygen_tank_weight_per_kg': 1.2, 'weight_limit': 1e7,
+        'use_scrubber': True, 'use_recycler': False,
+        'co2_scrubber_efficiency': 95, 'scrubber_weight_per_kg': 0.4,
+        'co2_recycler_efficiency': 0, 'recycler_weight': 0,
+        'nitrogen_tank_weight_per_kg': 1.2, 'hygiene_water_per_day': 1500,
+        'use_water_recycler': True, 'water_recycler_efficiency': 85, 'water_recycler_weight': 450,
+    }
+    daily_meal_kg = np.full(duration, crew_count * 1.8)
+    elapsed = time_call(lambda: simulate_consumables(facts, daily_meal_kg=daily_meal_kg))
+    print(f"📈 simulate_consumables — {duration} days, {crew_count} crew: {elapsed * 1000:.2f} ms")
+    return elapsed
+
+
+def bench_logging_overhead(runs=200):
+    """
+    Engine evaluations and 7-day plans per second with DEBUG logging written to a
+    real file handle (the old print-every-line behaviour) against the default levels.
+    """
+    facts = dict(
+        duration=180, crew_count=4, body_masses=[70, 82, 65, 90], activity='moderate',
+        oxygen_tank_weight_per_kg=1.2, weight_limit=12000,
+        use_scrubber=True, use_recycler=False, co2_scrubber_efficiency=95, scrubber_weight_per_kg=0.4,
+        co2_recycler_efficiency=0, recycler_weight=0, nitrogen_tank_weight_per_kg=1.2,
+        hygiene_water_per_day=1500, use_water_recycler=True, water_recycler_efficiency=85,
+        water_recycler_weight=450,
+    )
+    foods, beverages, food_ratings, beverage_ratings = synthetic_catalog()
+
+    def evaluate():
+        for _ in range(runs):
+            engine = LifeSupportEngine()
+            engine.reset()
+            engine.declare(LifeSupportFacts(**facts))
+            engine.run()
+
+    def plan():
+        MealPlanner(
+            name='bench', calorie_target=2400,
+            food_list=[dict(f) for f in foods], beverage_list=[dict(b) for b in beverages],
+            start_day=1, food_ratings=food_ratings, beverage_ratings=beverage_ratings, duration=7
+        ).run_planner()
+
+    root = logging.getLogger(LOGGER_ROOT)
+    root.propagate = False  # experta calls logging.basicConfig(); keep records off its stderr handler
+    print(f"📈 Logging overhead — {runs} engine runs, one 7-day plan")
+    timings = {}
+    with open(os.devnull, 'w') as sink:
+        for label, level in (('debug', logging.DEBUG), ('default', logging.NOTSET)):
+            handler = logging.StreamHandler(sink)
+            root.addHandler(handler)
+            for subsystem in ('engine', 'planner'):
+                get_logger(subsystem).setLevel(level)
+            try:
+                timings[label] = (time_call(evaluate), time_call(plan))
+            finally:
+                root.removeHandler(handler)
+                for subsystem in ('engine', 'planner'):
+                    get_logger(subsystem).setLevel(logging.NOTSET)
+            engine_s, plan_s = timings[label]
+            print(f"   {label:>7}: {runs / engine_s:8.0f} engine runs/s | plan {plan_s * 1000:7.1f} ms")
+    return timings
+
+
+def bench_db_pool(requests=300):
+    """
+    Latency of the database reads behind one render of / (crew list, latest gas
+    budget, live gas mass, cumulative meal mass), with plain sqlite3.connect per
+    call versus the pooled WAL connections.
+    """
+    def render():
+        for _ in range(requests):
+            db_utils.fetch_all_records('astronauts.db', 'crew')
+            db_utils.get_latest_gas_budget_record()
+            db_utils.get_latest_gas_mass()
+            db_utils.get_cumulative_meal_mass()
+
+    print(f"📈 / database reads — {requests} renders")
+    timings = {}
+    enabled = db_utils.DB_POOL_ENABLED
+    try:
+        for label, pooled in (('connect', False), ('pooled', True)):
+            db_utils.DB_POOL_ENABLED = pooled
+            timings[label] = time_call(render) / requests
+            print(f"   {label:>7}: {timings[label] * 1000:7.3f} ms per render")
+    finally:
+        db_utils.DB_POOL_ENABLED = enabled
+        db_utils.close_all_pools()
+    return timings
+
+
+def synthetic_meals(n_rows, n_crew=20):
+    """n_rows daily_meals dicts spread over n_crew crew members, three meals a day."""
+    return [
+        {
+            'crew_name': f'crew_{i % n_crew}', 'day': i // (n_crew * 3) + 1, 'meal': (i // n_crew) % 3 + 1,
+            'food_name': f'food_{i % 40}', 'food_grams': 250.0 + i % 50, 'food_rating': '4',
+            'beverage_name': f'bev_{i % 12}', 'beverage_grams': 300.0, 'beverage_rating': '3',
+        }
+        for i in range(n_rows)
+    ]
+
+
+def bench_bulk_writes(n_rows=100_000):
+    """One execute per row (the old loops) against the executemany bulk writers."""
+    meals = synthetic_meals(n_rows)
+    foods = pd.DataFrame({
+        'name': [f'food_{i}' for i in range(n_rows)],
+        'calories_per_gram': np.linspace(0.5, 5.0, n_rows),
+        'fat_per_gram': 0.1, 'sugar_per_gram': 0.05, 'protein_per_gram': 0.2,
+    })
+
+    def meals_row_by_row(db_path):
+        conn = db_utils.connect(db_path)
+        cursor = conn.cursor()
+        for m in meals:
+            cursor.execute(
+                "INSERT OR REPLACE INTO daily_meals VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                tuple(m[col] for col in db_utils.DAILY_MEAL_COLUMNS)
+            )
+        conn.commit()
+        conn.close()
+
+    def foods_row_by_row(db_path):
+        conn = db_utils.connect(db_path)
+        cursor = conn.cursor()
+        for _, row in foods.iterrows():
+            cursor.execute("""
+                INSERT INTO foods (name, calories_per_gram, fat_per_gram, sugar_per_gram, protein_per_gram)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET calories_per_gram=excluded.calories_per_gram
+            """, (row['name'].strip(), float(row['calories_per_gram']), float(row['fat_per_gram']),
+                  float(row['sugar_per_gram']), float(row['protein_per_gram'])))
+        conn.commit()
+        conn.close()
+
+    cases = (
+        ('daily_meals row-by-row', 'meal_schedule.db', meals_row_by_row),
+        ('daily_meals executemany', 'meal_schedule.db', lambda db: db_utils.insert_daily_meals(db, meals, {})),
+        ('foods iterrows', 'nutrition.db', foods_row_by_row),
+        ('foods executemany', 'nutrition.db',
+         lambda db: db_utils.bulk_upsert_nutrition(db, 'foods', foods, strip_names=True)),
+    )
+
+    print(f"📈 Bulk writes — {n_rows:,} rows")
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, (label, name, write) in enumerate(cases):
+            # Each case writes into its own empty database
+            os.makedirs(os.path.join(tmp, str(i)))
+            db_path = os.path.join(tmp, str(i), name)
+            timings[label] = time_call(lambda: write(db_path), repeat=1)
+            print(f"   {label:>24}: {timings[label] * 1000:8.1f} ms")
+        db_utils.close_all_pools()
+    return timings
+
+
+
+def bench_medical_diagnosis(runs=200):
+    """Compiled rule table vs a fresh experta engine per /medical_diagnosis request."""
+    symptoms = [
+        {'symptom': 'dizziness', 'severity': 'moderate'},
+        {'symptom': 'headache', 'severity': 'severe'},
+        {'symptom': 'insomnia', 'severity': 'mild'},
+    ]
+    for label, fn in (('experta', run_expert_system), ('compiled', diagnose)):
+        elapsed = time_call(lambda: [fn(symptoms, 'late', True) for _ in range(runs)]) / runs
+        print(f"🩺 {label:>8} diagnosis: {elapsed * 1e6:.1f} µs/request")
+
+
+
+def bench_engine_pool(runs=100, threads=8):
+    """
+    Building each experta engine (startup and per request) vs checking one out
+    of a warm EnginePool, plus a threaded run that checks no engine is shared.
+    """
+    foods, beverages, food_ratings, beverage_ratings = synthetic_catalog()
+    planner_args = dict(
+        name='bench', calorie_target=2400, food_list=foods, beverage_list=beverages,
+        start_day=1, food_ratings=food_ratings, beverage_ratings=beverage_ratings, duration=7
+    )
+    for engine_cls, kwargs in (
+        (LifeSupportEngine, {}),
+        (SpaceMedicalExpertSystem, {}),
+        (MealPlanner, planner_args),
+    ):
+        start = time.perf_counter()
+        engine_cls(**kwargs)
+        startup = time.perf_counter() - start
+
+        def fresh():
+            engine_cls(**kwargs).reset()
+
+        pool = EnginePool(engine_cls)
+        pool.prewarm(1, **kwargs)
+
+        def pooled():
+            with pool.checkout(**kwargs) as engine:
+                engine.reset()
+
+        build = time_call(lambda: [fresh() for _ in range(runs)]) / runs
+        reuse = time_call(lambda: [pooled() for _ in range(runs)]) / runs
+        print(f"♻️ {engine_cls.__name__:>24}: startup {startup * 1000:.2f} ms | "
+              f"new per request {build * 1000:.3f} ms | pooled {reuse * 1000:.3f} ms")
+
+    # Threaded checkouts: an engine must never be handed to two threads at once
+    import threading
+    pool = EnginePool(LifeSupportEngine, max_idle=threads)
+    in_use, lock, errors = set(), threading.Lock(), []
+
+    def worker():
+        for _ in range(runs):
+            with pool.checkout() as engine:
+                with lock:
+                    if id(engine) in in_use:
+                        errors.append(id(engine))
+                    in_use.add(id(engine))
+                engine.reset()
+                with lock:
+                    in_use.discard(id(engine))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    if errors:
+        raise AssertionError(f"{len(errors)} engines were checked out twice at once")
+    print(f"♻️ {threads} threads × {runs} checkouts: {len(pool.idle)} engines built, none shared")
+
+
+if __name__ == '__main__':
+    bench_planner_durations()
+    bench_planner_durations(durations=(7, 28, 180, 365), backend='direct', n_foods=300, n_beverages=50)
+    bench_life_support_batch()
+    bench_monte_carlo()
+    bench_consumables_timeline()
+    bench_logging_overhead()
+    bench_db_pool()
+    bench_bulk_writes()
+    bench_medical_diagnosis()
+    bench_engine_pool()
@@ -0,0 +1,159 @@
+# consumables.py
+"""
+Day-by-day consumables simulator.
+
+compute_life_support_arrays gives mission totals. Here the same model is
+evaluated for a single day to get per-day rates. Those rates are stepped across
+the mission alongside the food actually scheduled in daily_meals. The output is
+a dict of columnar NumPy arrays (one entry per day) that can be saved as a
+single .npz file instead of thousands of SQLite rows.
+"""
+import sqlite3
+
+import numpy as np
+
+from db_utils import connect
+from engine import compute_life_support_arrays
+
+TIMELINE_SERIES = ('o2_tank_kg', 'n2_tank_kg', 'scrubber_saturation', 'water_tank_kg', 'food_stock_kg')
+# Launch inventory simulate_consumables accepts in stocks (kg)
+STOCK_KEYS = ('o2_tank_kg', 'n2_tank_kg', 'scrubber_kg', 'water_tank_kg', 'food_stock_kg')
+
+
+def facts_from_gas_record(record):
+    """LifeSupportFacts-style kwargs from a gas_masses row (see get_latest_gas_budget_record)."""
+    body_masses = record['body_masses']
+    if isinstance(body_masses, str):
+        body_masses = [float(m) for m in body_masses.split(',') if m.strip()]
+    return {
+        'duration': int(record['duration']),
+        'body_masses': body_masses,
+        'activity': record['activity'],
+        'oxygen_tank_weight_per_kg': record['oxygen_tank_weight_per_kg'] or 0,
+        'weight_limit': record['weight_limit'] or 0,
+        'use_scrubber': bool(record['use_scrubber']),
+        'use_recycler': bool(record['use_recycler']),
+        'co2_scrubber_efficiency': record['co2_scrubber_efficiency'] or 0,
+        'scrubber_weight_per_kg': record['scrubber_weight_per_kg'] or 0,
+        'co2_recycler_efficiency': record['co2_recycler_efficiency'] or 0,
+        'recycler_weight': record['recycler_weight'] or 0,
+        'nitrogen_tank_weight_per_kg': record['nitrogen_tank_weight_per_kg'] or 0,
+        'hygiene_water_per_day': record['hygiene_water_per_day'] or 0,
+        'use_water_recycler': bool(record['use_water_recycler']),
+        'water_recycler_efficiency': record['water_recycler_efficiency'] or 0,
+        'water_recycler_weight': record['water_recycler_mass'] or 0,
+    }
+
+
+def load_daily_meal_mass(duration, db_path='meal_schedule.db'):
+    """
+    Scheduled food + beverage mass per mission day in kg, summed over the crew.
+    Index 0 is day 1. Days with nothing scheduled are 0.
+    """
+    conn = connect(db_path)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT day, SUM(food_grams + beverage_grams)
+            FROM daily_meals
+            WHERE day BETWEEN 1 AND ?
+            GROUP BY day
+        """, (duration,))
+        rows = cursor.fetchall()
+    except sqlite3.OperationalError:
+        rows = []  # no daily_meals table yet
+    conn.close()
+
+    daily = np.zeros(duration, dtype=np.float64)
+    if rows:
+        days, grams = np.array(rows, dtype=np.float64).T
+        daily[days.astype(np.int64) - 1] = grams / 1000.0
+    return daily
+
+
+def simulate_consumables(facts, daily_meal_kg=None, stocks=None):
+    """
+    Step the mission one day at a time and return the consumables timeline.
+
+    facts are LifeSupportFacts-style kwargs (body_masses as a list). daily_meal_kg
+    is the food eaten each day. By default it comes from load_daily_meal_mass, and
+    days after the last scheduled meal eat the average scheduled day. stocks
+    overrides the launch inventory ('o2_tank_kg', 'n2_tank_kg', 'scrubber_kg',
+    'water_tank_kg', 'food_stock_kg'). Each default is what the engine provisions
+    for the full mission, and the food default is everything in the schedule.
+    """
+    duration = int(facts['duration'])
+    body_masses = facts['body_masses']
+    params = {k: v for k, v in facts.items() if k not in ('body_masses', 'duration')}
+    params.setdefault('crew_count', len(body_masses))
+    params['body_mass_total'] = float(sum(body_masses))
+
+    # === Per-day rates from a one-day run of the engine model ===
+    rate = compute_life_support_arrays(duration=1, **params)
+    o2_from_tanks = float(np.maximum(rate['o2_required_kg'] - rate['o2_reclaimed'], 0))
+    n2_per_day = float(rate['n2_required_kg'])
+    scrubber_per_day = float(rate['scrubber_mass'])
+    water_per_day = float(rate['water_net']) / 1000.0  # g → kg
+
+    if daily_meal_kg is None:
+        daily_meal_kg = load_daily_meal_mass(duration)
+    eaten = np.zeros(duration, dtype=np.float64)
+    scheduled = np.asarray(daily_meal_kg, dtype=np.float64)[:duration]
+    eaten[:len(scheduled)] = scheduled
+    planned_days = np.flatnonzero(scheduled)
+    if planned_days.size:
+        last = planned_days[-1]
+        eaten[last + 1:] = scheduled[:last + 1].mean()
+
+    stocks = dict(stocks or {})
+    o2_stock = stocks.get('o2_tank_kg', o2_from_tanks * duration)
+    n2_stock = stocks.get('n2_tank_kg', n2_per_day * duration)
+    scrubber_stock = stocks.get('scrubber_kg', scrubber_per_day * duration)
+    water_stock = stocks.get('water_tank_kg', water_per_day * duration)
+    food_stock = stocks.get('food_stock_kg', float(scheduled.sum()))
+
+    # === Levels at the end of each day ===
+    days = np.arange(1, duration + 1, dtype=np.int32)
+    elapsed = days.astype(np.float64)
+    if scrubber_stock > 0:
+        saturation = scrubber_per_day * elapsed / scrubber_stock
+    else:
+        saturation = np.zeros(duration)
+
+    timeline = {
+        'day': days,
+        'o2_tank_kg': o2_stock - o2_from_tanks * elapsed,
+        'n2_tank_kg': n2_stock - n2_per_day * elapsed,
+        'scrubber_saturation': saturation,
+        'water_tank_kg': water_stock - water_per_day * elapsed,
+        'food_stock_kg': food_stock - np.cumsum(eaten),
+    }
+    for name in TIMELINE_SERIES:
+        timeline[name] = timeline[name].astype(np.float32)
+    return timeline
+
+
+def margin_summary(timeline):
+    """First day each consumable runs out (None if it lasts the mission) and its final level."""
+    summary = {}
+    for name in TIMELINE_SERIES:
+        values = timeline[name]
+        # Scrubbers are spent at saturation 1.0; everything else at a level below zero
+        spent = values > 1.0 + 1e-6 if name == 'scrubber_saturation' else values < -1e-3
+        first = np.flatnonzero(spent)
+        summary[name] = {
+            'first_negative_day': int(timeline['day'][first[0]]) if first.size else None,
+            'final': round(float(values[-1]), 2) if values.size else None,
+        }
+    return summary
+
+
+def save_timeline(timeline, path='consumables_timeline.npz'):
+    """Write the timeline columns to one compressed .npz file."""
+    np.savez_compressed(path, **timeline)
+    return path
+
+
+def load_timeline(path='consumables_timeline.npz'):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
@@ -1,13 +1,171 @@
 # db_utils.py
 import sqlite3
+import hashlib
+import json
+import atexit
+import os
+import queue
+import threading
+import time
+from itertools import islice
 import pandas as pd
 from datetime import datetime
+from log_config import get_logger
+from migrations import MIGRATIONS, migrate
+
+log = get_logger('db')
+
+# === Connection pool ===
+# One pool per database file. connect() hands out a pooled connection and
+# conn.close() puts it back, so existing connect/execute/close code keeps its
+# shape while skipping the open + PRAGMA cost on every call.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-8000",       # 8 MB page cache
+    "PRAGMA mmap_size=67108864",     # 64 MB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+STATEMENT_CACHE_SIZE = 256
+POOL_MAX_IDLE = int(os.getenv('DB_POOL_MAX_IDLE', '8'))
+# DB_POOL=0 falls back to a plain sqlite3.connect per call
+DB_POOL_ENABLED = os.getenv('DB_POOL', '1') != '0'
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3.Connection whose close() returns it to its pool."""
+    pool = None
+
+    def close(self):
+        if self.pool is None:
+            return super().close()
+        self.pool.release(self)
+
+
+class ConnectionPool:
+    def __init__(self, db_path, max_idle=POOL_MAX_IDLE, attach=None):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.attach = attach or {}  # schema name -> database file
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        conn = sqlite3.connect(
+            self.db_path,
+            factory=PooledConnection,
+            check_same_thread=False,  # each connection is used by one thread at a time
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        for schema, path in self.attach.items():
+            conn.execute("ATTACH DATABASE ? AS " + schema, (path,))
+            conn.execute(f"PRAGMA {schema}.journal_mode=WAL")
+            conn.execute(f"PRAGMA {schema}.synchronous=NORMAL")
+        conn.pool = self
+        return conn
+
+    def release(self, conn):
+        # Same as a real close: anything not committed is discarded
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(conn)
+                return
+        sqlite3.Connection.close(conn)
+
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            sqlite3.Connection.close(conn)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+_migrated = set()
+
+
+def connect(db_path):
+    """Pooled replacement for sqlite3.connect(db_path); call close() as usual."""
+    key = os.path.abspath(db_path)
+    if key not in _migrated:
+        ensure_schema(db_path)
+    if not DB_POOL_ENABLED:
+        return sqlite3.connect(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_path)
+    return pool.acquire()
+
+
+# === Unified storage ===
+# One pooled connection with every database attached, so queries can join across
+# files (crew × ratings × foods) in SQL. meal_schedule.db is the main schema.
+UNIFIED_MAIN = 'meal_schedule.db'
+UNIFIED_ATTACH = {
+    'crew_db': 'astronauts.db',
+    'nutrition': 'nutrition.db',
+    'beverage': 'beverage.db',
+    'gas': 'gas_budget.db',
+}
+
+
+def connect_unified():
+    """Pooled connection to meal_schedule.db with the other databases attached."""
+    for db_path in (UNIFIED_MAIN, *UNIFIED_ATTACH.values()):
+        if os.path.abspath(db_path) not in _migrated:
+            ensure_schema(db_path)
+    with _pools_lock:
+        pool = _pools.get('unified')
+        if pool is None:
+            pool = _pools['unified'] = ConnectionPool(UNIFIED_MAIN, attach=UNIFIED_ATTACH)
+    return pool.acquire()
+
+
+def ensure_schema(db_path):
+    """Bring db_path up to the latest schema version (once per process)."""
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        if key in _migrated:
+            return
+        conn = sqlite3.connect(db_path)
+        try:
+            applied = migrate(conn, db_path)
+        finally:
+            conn.close()
+        _migrated.add(key)
+    if applied:
+        log.info("🗄️ %s migrated to schema version %s", db_path, applied[-1])
+
+
+def run_migrations(db_paths=None):
+    """Startup hook: migrate every known database (or the given ones)."""
+    for db_path in db_paths or MIGRATIONS:
+        ensure_schema(db_path)
+
+
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
 
 def init_db(db_path, table_name, schema: dict, primary_key: str):
     """
     Initialize the student table if it doesn't exist.
     """
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cursor = conn.cursor()
     col_defs = ', '.join([f"{col} TEXT" for col in schema])
     create_stmt = f"""
@@ -25,7 +183,7 @@ def insert_or_update(db_path, table_name, data: dict, primary_key: str):
     """
     Insert a new row or update existing based on the primary key.
     """
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cursor = conn.cursor()
 
     columns = ', '.join(data.keys())
@@ -46,21 +204,22 @@ def fetch_all_records(db_path, table_name):
     """
     Retrieve all records from the student table.
     """
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
     conn.close()
     return df
 
 
 def delete_by_id(db_path, table_name, student_id):
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cursor = conn.cursor()
     cursor.execute(f"DELETE FROM {table_name} WHERE student_id = ?", (student_id,))
     conn.commit()
     conn.close()
 
 def get_latest_remaining_mass_budget(gas_db_path='gas_budget.db'):
-    conn = sqlite3.connect(gas_db_path)
+    flush_gas_budget_writes(gas_db_path)
+    conn = connect(gas_db_path)
     cursor = conn.cursor()
     cursor.execute("""
         SELECT base_weight_limit, total_gas_mass
@@ -87,8 +246,17 @@ def get_latest_remaining_mass_budget(gas_db_path='gas_budget.db'):
 
 def get_all_nutrition_data(food_path='nutrition.db', beverage_path='beverage.db'):
     import pandas as pd
-    food_conn = sqlite3.connect(food_path)
-    bev_conn = sqlite3.connect(beverage_path)
+    if (food_path, beverage_path) == ('nutrition.db', 'beverage.db'):
+        conn = connect_unified()
+        food_df = pd.read_sql("SELECT * FROM nutrition.foods", conn)
+        food_ratings = pd.read_sql("SELECT * FROM nutrition.food_ratings", conn)
+        beverage_df = pd.read_sql("SELECT * FROM beverage.beverages", conn)
+        beverage_ratings = pd.read_sql("SELECT * FROM beverage.beverage_ratings", conn)
+        conn.close()
+        return food_df, beverage_df, food_ratings, beverage_ratings
+
+    food_conn = connect(food_path)
+    bev_conn = connect(beverage_path)
 
     food_df = pd.read_sql("SELECT * FROM foods", food_conn)
     food_ratings = pd.read_sql("SELECT * FROM food_ratings", food_conn)
@@ -101,56 +269,62 @@ def get_all_nutrition_data(food_path='nutrition.db', beverage_path='beverage.db'
 
     return food_df, beverage_df, food_ratings, beverage_ratings
 
-def init_beverage_db(db_path='beverage.db'):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS beverages (
-            name TEXT PRIMARY KEY,
-            calories_per_gram REAL NOT NULL,
-            fat_per_gram REAL DEFAULT 0,
-            sugar_per_gram REAL DEFAULT 0,
-            protein_per_gram REAL DEFAULT 0
-        );
-    """)
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS beverage_ratings (
-            crew_name TEXT,
-            beverage_name TEXT,
-            rating INTEGER,
-            PRIMARY KEY (crew_name, beverage_name)
-        );
-    """)
-
-    conn.commit()
+def get_catalog_records():
+    """(foods, beverages) as lists of dicts, the shape MealPlanner takes."""
+    conn = connect_unified()
+    conn.row_factory = sqlite3.Row
+    foods = [dict(row) for row in conn.execute("SELECT * FROM nutrition.foods")]
+    beverages = [dict(row) for row in conn.execute("SELECT * FROM beverage.beverages")]
     conn.close()
+    return foods, beverages
 
-def init_nutrition_db(db_path='nutrition.db'):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS foods (
-            name TEXT PRIMARY KEY,
-            calories_per_gram REAL NOT NULL,
-            fat_per_gram REAL DEFAULT 0,
-            sugar_per_gram REAL DEFAULT 0,
-            protein_per_gram REAL DEFAULT 0
-        );
-    """)
+def get_crew_meal_preferences(crew_names=None):
+    """
+    Per crew member: their food and beverage rating maps, plus the average
+    calories_per_gram of the items they rate above 1 (None if there are none).
+    Ratings are stored with the name as submitted, so they are matched to catalog
+    items case-insensitively; the eligibility join and averages run in SQL on the
+    unified connection.
+    """
+    conn = connect_unified()
+    if crew_names is None:
+        crew_names = [row[0] for row in conn.execute("SELECT name FROM crew_db.crew")]
+    prefs = {
+        name: {'food_ratings': {}, 'beverage_ratings': {}, 'avg_food_cpg': None, 'avg_bev_cpg': None}
+        for name in crew_names
+    }
+    placeholders = ', '.join(['?'] * len(crew_names))
+
+    for kind, item, catalog, ratings in (
+        ('food', 'food_name', 'nutrition.foods', 'nutrition.food_ratings'),
+        ('beverage', 'beverage_name', 'beverage.beverages', 'beverage.beverage_ratings'),
+    ):
+        for crew_name, name, rating in conn.execute(
+            f"SELECT crew_name, {item}, rating FROM {ratings} WHERE crew_name IN ({placeholders})",
+            crew_names
+        ):
+            prefs[crew_name][f'{kind}_ratings'][name] = rating
+
+        avg_key = 'avg_food_cpg' if kind == 'food' else 'avg_bev_cpg'
+        for crew_name, avg_cpg in conn.execute(f"""
+            SELECT r.crew_name, AVG(c.calories_per_gram)
+            FROM {ratings} r
+            JOIN {catalog} c ON lower(c.name) = lower(r.{item})
+            WHERE r.crew_name IN ({placeholders}) AND r.rating > 1
+            GROUP BY r.crew_name
+        """, crew_names):
+            prefs[crew_name][avg_key] = avg_cpg
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS food_ratings (
-            crew_name TEXT,
-            food_name TEXT,
-            rating INTEGER,
-            PRIMARY KEY (crew_name, food_name)
-        );
-    """)
-    conn.commit()
     conn.close()
+    return prefs
+
+def init_beverage_db(db_path='beverage.db'):
+    ensure_schema(db_path)
+
+def init_nutrition_db(db_path='nutrition.db'):
+    ensure_schema(db_path)
 
 def load_sufficiency_map(conn):
     query = "SELECT crew_name, sufficiency_status, intake_ratio FROM crew_sufficiency"
@@ -167,8 +341,8 @@ def load_sufficiency_map(conn):
 
 
 def get_latest_gas_mass():
-    import sqlite3
-    conn = sqlite3.connect("gas_budget.db")
+    flush_gas_budget_writes("gas_budget.db")
+    conn = connect("gas_budget.db")
     conn.row_factory = sqlite3.Row  # Required for name-based access
     cursor = conn.cursor()
 
@@ -191,24 +365,13 @@ def get_latest_gas_mass():
 
 
 
-def get_cumulative_meal_mass():
-    import sqlite3
-    conn = sqlite3.connect("meal_schedule.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT SUM(food_grams + beverage_grams) FROM daily_meals")
-    row = cursor.fetchone()
-    conn.close()
-    total_grams = row[0] if row and row[0] else 0
-    return round(total_grams / 1000.0, 2)  # convert g to kg
-
 def get_last_meal_day(db_path, crew_name):
     """
     Returns the last day number that has a meal assigned for the given crew member.
     If no meals exist, returns 0.
     """
-    import sqlite3
 
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cursor = conn.cursor()
     cursor.execute("""
         SELECT MAX(day) FROM daily_meals WHERE crew_name = ?
@@ -218,82 +381,180 @@ def get_last_meal_day(db_path, crew_name):
     return result if result is not None else 0
 
 def reset_db(path, commands):
-    import sqlite3
-    conn = sqlite3.connect(path)
+    try:
+        flush_gas_budget_writes(path)  # don't let queued rows land after the reset
+    except ValueError as e:
+        log.warning("%s (discarded by the reset)", e)
+    conn = connect(path)
     cursor = conn.cursor()
     for cmd in commands:
         cursor.execute(cmd)
     conn.commit()
+    # Dropped tables take their indexes and triggers with them; put them back
+    migrate(conn, path, replay=True)
     conn.close()
 
 
-def insert_daily_meals(db_path, meals: list, sufficiency_map: dict):
+DAILY_MEAL_COLUMNS = (
+    'crew_name', 'day', 'meal',
+    'food_name', 'food_grams', 'food_rating',
+    'beverage_name', 'beverage_grams', 'beverage_rating'
+)
+NUTRITION_COLUMNS = ('name', 'calories_per_gram', 'fat_per_gram', 'sugar_per_gram', 'protein_per_gram')
+
+
+def executemany_chunked(cursor, query, rows, chunk_size=None):
+    """
+    cursor.executemany over an iterable of tuples, optionally in chunks of
+    chunk_size rows so a huge generator is never materialized at once.
+    The caller owns the transaction. Returns the number of rows sent.
     """
-    Insert a list of meal dicts into the daily_meals table.
+    if not chunk_size:
+        rows = rows if isinstance(rows, list) else list(rows)
+        cursor.executemany(query, rows)
+        return len(rows)
+
+    total = 0
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return total
+        cursor.executemany(query, chunk)
+        total += len(chunk)
+
+
+def meal_rows(meals):
+    """daily_meals parameter tuples from a list of meal dicts or a DataFrame."""
+    if isinstance(meals, pd.DataFrame):
+        frame = meals.reindex(columns=list(DAILY_MEAL_COLUMNS))
+        frame = frame.astype(object).where(frame.notna(), None)
+        return list(frame.itertuples(index=False, name=None))
+    columns = [
+        [m[col] for m in meals] if col not in ('food_rating', 'beverage_rating')
+        else [m.get(col, None) for m in meals]
+        for col in DAILY_MEAL_COLUMNS
+    ]
+    return list(zip(*columns))
+
+
+def insert_daily_meals(db_path, meals, sufficiency_map: dict, chunk_size=None):
+    """
+    Insert meals (a list of meal dicts, or a DataFrame with the daily_meals
+    columns) into the daily_meals table.
     Also insert sufficiency status and intake ratio into crew_sufficiency.
+    Everything is written with executemany in a single transaction.
     """
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cursor = conn.cursor()
 
-    # Ensure the daily_meals table exists
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS daily_meals (
-            crew_name TEXT,
-            day INTEGER,
-            meal INTEGER,
-            food_name TEXT,
-            food_grams REAL,
-            food_rating TEXT,
-            beverage_name TEXT,
-            beverage_grams REAL,
-            beverage_rating TEXT,
-            PRIMARY KEY (crew_name, day, meal)
-        );
-    """)
-
-    # Ensure the sufficiency table exists
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS crew_sufficiency (
-            crew_name TEXT PRIMARY KEY,
-            sufficiency_status TEXT,
-            intake_ratio REAL
-        );
-    """)
-
     # Insert meals
-    for m in meals:
-        cursor.execute("""
-            INSERT OR REPLACE INTO daily_meals (
-                crew_name, day, meal,
-                food_name, food_grams, food_rating,
-                beverage_name, beverage_grams, beverage_rating
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
-        """, (
-            m['crew_name'], m['day'], m['meal'],
-            m['food_name'], m['food_grams'], m.get('food_rating', None),
-            m['beverage_name'], m['beverage_grams'], m.get('beverage_rating', None)
-        ))
+    executemany_chunked(cursor, f"""
+        INSERT OR REPLACE INTO daily_meals ({', '.join(DAILY_MEAL_COLUMNS)})
+        VALUES ({', '.join(['?'] * len(DAILY_MEAL_COLUMNS))});
+    """, meal_rows(meals), chunk_size)
 
     # Insert sufficiency info with intake ratio
-    for crew_name, summary in sufficiency_map.items():
-        status = summary['status']
-        ratio = summary['intake_ratio']
-        cursor.execute("""
-            INSERT OR REPLACE INTO crew_sufficiency (
-                crew_name, sufficiency_status, intake_ratio
-            ) VALUES (?, ?, ?);
-        """, (
-            crew_name, status, ratio
-        ))
+    cursor.executemany("""
+        INSERT OR REPLACE INTO crew_sufficiency (
+            crew_name, sufficiency_status, intake_ratio
+        ) VALUES (?, ?, ?);
+    """, [
+        (crew_name, summary['status'], summary['intake_ratio'])
+        for crew_name, summary in sufficiency_map.items()
+    ])
+
+    conn.commit()
+    conn.close()
+
+
+def update_rationed_meals(db_path, meals, sufficiency_map: dict, chunk_size=None):
+    """
+    Write rationed food grams back onto the existing daily_meals rows (keyed by
+    crew_name, day, meal) and replace crew_sufficiency, in one transaction.
+    meals is a DataFrame with at least those key columns and food_grams.
+    """
+    conn = connect(db_path)
+    cursor = conn.cursor()
+
+    frame = meals[['food_grams', 'crew_name', 'day', 'meal']]
+    frame = frame.astype(object).where(frame.notna(), None)
+    executemany_chunked(cursor, """
+        UPDATE daily_meals SET food_grams = ?
+        WHERE crew_name = ? AND day = ? AND meal = ?;
+    """, frame.itertuples(index=False, name=None), chunk_size)
+
+    cursor.execute("DELETE FROM crew_sufficiency")
+    cursor.executemany("""
+        INSERT OR REPLACE INTO crew_sufficiency (
+            crew_name, sufficiency_status, intake_ratio
+        ) VALUES (?, ?, ?);
+    """, [
+        (crew_name, summary['status'], summary['intake_ratio'])
+        for crew_name, summary in sufficiency_map.items()
+    ])
 
     conn.commit()
     conn.close()
 
 
+def nutrition_rows(df, strip_names=False):
+    """
+    (rows, invalid) for a foods/beverages CSV frame. Missing optional columns
+    and blank cells become 0; rows with no name or non-numeric values are
+    counted in invalid and left out of rows.
+    """
+    names = df['name']
+    if strip_names:
+        names = names.map(lambda n: n.strip() if isinstance(n, str) else n)
+    valid = names.map(lambda n: isinstance(n, str))
+
+    values = {}
+    for col in NUTRITION_COLUMNS[1:]:
+        raw = df[col] if col in df.columns else pd.Series(0, index=df.index)
+        numeric = pd.to_numeric(raw, errors='coerce')
+        valid &= numeric.notna() | raw.isna()
+        values[col] = numeric if col == 'calories_per_gram' else numeric.fillna(0)
+    valid &= values['calories_per_gram'].notna()
+
+    columns = [names[valid].tolist()] + [values[col][valid].astype(float).tolist() for col in NUTRITION_COLUMNS[1:]]
+    return list(zip(*columns)), int((~valid).sum())
+
+
+def bulk_upsert_nutrition(db_path, table, df, strip_names=False, skip_invalid=False, chunk_size=None):
+    """
+    Upsert a foods or beverages DataFrame by name with executemany in one
+    transaction. Invalid rows are skipped when skip_invalid is set; otherwise
+    they reject the whole upload with ValueError. Returns rows written.
+    """
+    if table not in ('foods', 'beverages'):
+        raise ValueError(f"🛑 Unknown nutrition table '{table}'.")
+
+    rows, invalid = nutrition_rows(df, strip_names)
+    if invalid:
+        if not skip_invalid:
+            raise ValueError(f"🛑 {invalid} row(s) have a missing name or non-numeric values.")
+        log.warning("Skipping %d invalid row(s) in %s upload", invalid, table)
+
+    conn = connect(db_path)
+    cursor = conn.cursor()
+    written = executemany_chunked(cursor, f"""
+        INSERT INTO {table} ({', '.join(NUTRITION_COLUMNS)})
+        VALUES ({', '.join(['?'] * len(NUTRITION_COLUMNS))})
+        ON CONFLICT(name) DO UPDATE SET
+            calories_per_gram=excluded.calories_per_gram,
+            fat_per_gram=excluded.fat_per_gram,
+            sugar_per_gram=excluded.sugar_per_gram,
+            protein_per_gram=excluded.protein_per_gram;
+    """, rows, chunk_size)
+    conn.commit()
+    conn.close()
+    return written
 
 
 def get_latest_duration_from_gas_budget(db_path='gas_budget.db'):
-    conn = sqlite3.connect(db_path)
+    flush_gas_budget_writes(db_path)
+    conn = connect(db_path)
     cursor = conn.cursor()
     cursor.execute("SELECT duration FROM gas_masses ORDER BY timestamp DESC LIMIT 1")
     result = cursor.fetchone()
@@ -308,53 +569,9 @@ def insert_gas_budget(db_path, data: dict):
     Insert a new gas budget record into the gas_masses table.
     Creates the table if it doesn't exist.
     """
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cursor = conn.cursor()
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS gas_masses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            duration INTEGER,
-            crew_count INTEGER,
-            body_masses TEXT,
-            activity TEXT,
-            oxygen_tank_weight_per_kg REAL,
-            co2_generated REAL,
-            o2_required_kg REAL,
-            o2_reclaimed REAL,
-            o2_tank_mass REAL,
-            scrubber_mass REAL,
-            recycler_mass REAL,
-            total_gas_mass REAL,
-            use_scrubber BOOLEAN,
-            use_recycler BOOLEAN,
-            co2_scrubber_efficiency REAL,
-            scrubber_weight_per_kg REAL,
-            co2_recycler_efficiency REAL,
-            recycler_weight REAL,
-            within_limit BOOLEAN,
-            weight_limit REAL,
-
-            -- New fields
-            nitrogen_tank_weight_per_kg REAL,
-            n2_required_kg REAL,
-            n2_tank_mass REAL,
-            hygiene_water_per_day REAL,
-            water_hygiene_raw REAL,
-            water_excretion REAL,
-            water_recovered REAL,
-            water_net REAL,
-            use_water_recycler BOOLEAN,
-            water_recycler_efficiency REAL,
-            cumulative_meal_mass REAL,
-            combined_life_support_mass REAL,
-            'water_recycler_mass' REAL,
-            'total_life_support_mass' REAL,
-            base_weight_limit REAL
-        );
-    """)
-
     # Insert dynamic keys
     columns = ', '.join(data.keys())
     placeholders = ', '.join(['?'] * len(data))
@@ -363,59 +580,135 @@ def insert_gas_budget(db_path, data: dict):
     conn.commit()
     conn.close()
 
+class GasBudgetWriter:
+    """
+    Write-behind queue for gas_masses rows.
+
+    put() returns immediately. A daemon thread drains whatever has queued up and
+    writes it as one transaction, so a burst of budgets costs one connect/commit.
+    If that transaction fails, the batch is retried one row per transaction so a
+    bad row can't take the good ones with it. flush() blocks until everything
+    queued so far is settled, and raises ValueError for rows that failed since
+    the previous flush.
+    """
+
+    def __init__(self, db_path='gas_budget.db', max_batch=256):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.failed = []  # (row, error) pairs not yet reported by flush()
+        self.failed_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name=f"gas-writer:{db_path}", daemon=True)
+        self.thread.start()
+
+    def put(self, data: dict):
+        self.queue.put(dict(data))
+
+    def flush(self):
+        self.queue.join()
+        with self.failed_lock:
+            failed, self.failed = self.failed, []
+        if failed:
+            row, error = failed[0]
+            raise ValueError(
+                f"❌ {len(failed)} gas budget row(s) could not be written to {self.db_path}; "
+                f"first (timestamp {row.get('timestamp')}): {error}"
+            )
+
+    @staticmethod
+    def _insert(conn, row):
+        columns = ', '.join(row.keys())
+        placeholders = ', '.join(['?'] * len(row))
+        conn.execute(f"INSERT INTO gas_masses ({columns}) VALUES ({placeholders})", tuple(row.values()))
+
+    def _run(self):
+        conn = connect(self.db_path)
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(conn, batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write_batch(self, conn, batch):
+        try:
+            with conn:
+                for row in batch:
+                    self._insert(conn, row)
+            return
+        except Exception as e:
+            log.warning("⚠️ Gas budget write of %d rows failed (%s); retrying row by row", len(batch), e)
+
+        # 🔁 One transaction per row isolates the bad ones
+        for row in batch:
+            try:
+                with conn:
+                    self._insert(conn, row)
+            except Exception as e:
+                log.error("❌ Gas budget row (timestamp %s) failed: %s", row.get('timestamp'), e)
+                with self.failed_lock:
+                    self.failed.append((row, str(e)))
+
+
+_gas_writers = {}
+_gas_writers_lock = threading.Lock()
+
+
+def _gas_writer(db_path):
+    with _gas_writers_lock:
+        writer = _gas_writers.get(db_path)
+        if writer is None:
+            writer = _gas_writers[db_path] = GasBudgetWriter(db_path)
+        return writer
+
+
+def queue_gas_budget(db_path, data: dict):
+    """Same contract as insert_gas_budget, but the INSERT happens on the writer thread."""
+    if data.get("base_weight_limit") is None:
+        raise ValueError("🛑 Attempted to insert gas_mass record with NULL base_weight_limit.")
+    _gas_writer(db_path).put(data)
+
+
+def flush_gas_budget_writes(db_path=None):
+    """
+    Wait for queued gas_masses rows (for one database, or all) to be committed.
+    Raises ValueError if any queued row failed to write since the last flush.
+    """
+    with _gas_writers_lock:
+        writers = [w for path, w in _gas_writers.items() if db_path in (None, path)]
+    errors = []
+    for writer in writers:
+        try:
+            writer.flush()
+        except ValueError as e:
+            errors.append(str(e))
+    if errors:
+        raise ValueError(" ".join(errors))
+
+
+def _flush_gas_budget_writes_at_exit():
+    try:
+        flush_gas_budget_writes()
+    except ValueError as e:
+        log.error("%s", e)
+
+
+atexit.register(_flush_gas_budget_writes_at_exit)
+
+
 def get_latest_gas_budget_record(db_path='gas_budget.db'):
-    import sqlite3
+    flush_gas_budget_writes(db_path)
 
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
 
-    # Ensure the table exists
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS gas_masses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            duration INTEGER,
-            crew_count INTEGER,
-            body_masses TEXT,
-            activity TEXT,
-            oxygen_tank_weight_per_kg REAL,
-            co2_generated REAL,
-            o2_required_kg REAL,
-            o2_reclaimed REAL,
-            o2_tank_mass REAL,
-            scrubber_mass REAL,
-            recycler_mass REAL,
-            total_gas_mass REAL,
-            use_scrubber BOOLEAN,
-            use_recycler BOOLEAN,
-            co2_scrubber_efficiency REAL,
-            scrubber_weight_per_kg REAL,
-            co2_recycler_efficiency REAL,
-            recycler_weight REAL,
-            within_limit BOOLEAN,
-            weight_limit REAL,
-
-            -- New fields
-            nitrogen_tank_weight_per_kg REAL,
-            n2_required_kg REAL,
-            n2_tank_mass REAL,
-            hygiene_water_per_day REAL,
-            water_hygiene_raw REAL,
-            water_excretion REAL,
-            water_recovered REAL,
-            water_net REAL,
-            use_water_recycler BOOLEAN,
-            water_recycler_efficiency REAL,
-            cumulative_meal_mass REAL,
-            combined_life_support_mass REAL,
-            'water_recycler_mass' REAL,
-            'total_life_support_mass' REAL,
-            base_weight_limit REAL
-
-        );
-    """)
-
     # Try to fetch the most recent record
     cursor.execute("""
         SELECT * FROM gas_masses
@@ -427,15 +720,72 @@ def get_latest_gas_budget_record(db_path='gas_budget.db'):
     return dict(row) if row else None
 
 
-def get_cumulative_meal_mass(meal_db_path='meal_schedule.db'):
-    import sqlite3
+def get_cumulative_meal_mass(meal_db_path='meal_schedule.db', crew_name=None):
+    """
+    Total scheduled food + beverage mass in kg, for the whole crew or one member.
+    Reads the trigger-maintained meal_mass_totals row instead of summing daily_meals.
+    """
     try:
-        conn = sqlite3.connect(meal_db_path)
+        conn = connect(meal_db_path)
         cursor = conn.cursor()
-        cursor.execute("SELECT SUM(food_grams + beverage_grams) FROM daily_meals")
-        result = cursor.fetchone()[0]
+        cursor.execute("SELECT total_grams FROM meal_mass_totals WHERE scope = ?", (crew_name or '*',))
+        row = cursor.fetchone()
         conn.close()
-        return round(result / 1000.0, 2) if result else 0.0  # grams → kg
+        return round(row[0] / 1000.0, 2) if row and row[0] else 0.0  # grams → kg
     except Exception as e:
-        print(f"Error calculating cumulative meal mass: {e}")
+        log.warning("Error calculating cumulative meal mass: %s", e)
         return 0.0
+
+
+def plan_cache_key(*parts):
+    """
+    Content hash of everything a meal plan depends on. DataFrames are hashed by
+    their contents, so any change to an input table yields a new key.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            part = part.to_json(orient='split')
+        h.update(repr(part).encode('utf-8'))
+        h.update(b'\x1f')
+    return h.hexdigest()
+
+
+def get_cached_plan(key, db_path='meal_schedule.db'):
+    """
+    Return the cached plan payload for a key (marking it recently used), or None.
+    """
+    conn = connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT payload FROM plan_cache WHERE key = ?", (key,))
+    row = cursor.fetchone()
+    if row:
+        cursor.execute("UPDATE plan_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        conn.commit()
+    conn.close()
+    return json.loads(row[0]) if row else None
+
+
+def put_cached_plan(key, payload, db_path='meal_schedule.db', max_entries=64):
+    """
+    Store a plan payload under its content key and evict least recently used
+    entries beyond max_entries.
+    """
+    conn = connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT OR REPLACE INTO plan_cache (key, payload, created_at, last_used)
+        VALUES (?, ?, ?, ?);
+    """, (
+        key,
+        json.dumps(payload, default=lambda o: o.item() if hasattr(o, 'item') else str(o)),
+        datetime.utcnow().isoformat(),
+        time.time()
+    ))
+    cursor.execute("""
+        DELETE FROM plan_cache WHERE key NOT IN (
+            SELECT key FROM plan_cache ORDER BY last_used DESC LIMIT ?
+        );
+    """, (max_entries,))
+    conn.commit()
+    conn.close()
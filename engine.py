@@ -2,18 +2,148 @@ import collections
 import collections.abc
 collections.Mapping = collections.abc.Mapping
 from experta import *
+import logging
 from datetime import datetime
-from db_utils import insert_gas_budget
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from db_utils import queue_gas_budget
+from log_config import get_logger
+
+log = get_logger('engine')
 
 class LifeSupportFacts(Fact):
     """Holds all mission and crew parameters."""
     pass
 
+
+ACTIVITY_LEVELS = ('low', 'moderate', 'daily')
+O2_ACTIVITY_FACTOR = {'low': 1.0, 'moderate': 1.5, 'daily': 2.0}
+CO2_PER_DAY = {'low': 0.8, 'moderate': 1.4, 'daily': 2.2}
+
+RESULT_FIELDS = (
+    'o2_required_kg', 'o2_reclaimed', 'o2_tank_mass', 'scrubber_mass',
+    'recycler_mass', 'co2_generated', 'within_limit', 'n2_required_kg',
+    'n2_tank_mass', 'water_hygiene_raw', 'water_excretion', 'water_recovered',
+    'water_net', 'water_recycler_mass', 'total_life_support_mass'
+)
+
+
+def _activity_lookup(activity, table):
+    """Map activity names (or indexes into ACTIVITY_LEVELS) to per-level values."""
+    activity = np.asarray(activity)
+    values = np.array([table[level] for level in ACTIVITY_LEVELS])
+    if activity.dtype.kind in 'iu':
+        return values[activity]
+    if activity.ndim == 0:
+        return np.float64(table[activity.item()])
+    levels, inverse = np.unique(activity, return_inverse=True)
+    return np.array([table[level] for level in levels])[inverse.reshape(activity.shape)]
+
+
+def compute_life_support_arrays(duration, crew_count, body_mass_total, activity,
+                                oxygen_tank_weight_per_kg, weight_limit,
+                                use_scrubber, use_recycler, co2_scrubber_efficiency,
+                                scrubber_weight_per_kg, co2_recycler_efficiency,
+                                recycler_weight, nitrogen_tank_weight_per_kg,
+                                hygiene_water_per_day, use_water_recycler,
+                                water_recycler_efficiency, water_recycler_weight):
+    """
+    Life support mass model over arrays of scenarios (scalars broadcast).
+
+    Takes the same parameters as LifeSupportFacts except that body masses are
+    given as their per-scenario total. Returns a dict of unrounded NumPy arrays
+    keyed by RESULT_FIELDS. Where both use_scrubber and use_recycler are set the
+    scrubber wins; the engine rule rejects that combination before calling this.
+    """
+    duration = np.asarray(duration, dtype=float)
+    crew_count = np.asarray(crew_count, dtype=float)
+    use_scrubber = np.asarray(use_scrubber, dtype=bool)
+    use_recycler = np.asarray(use_recycler, dtype=bool) & ~use_scrubber
+    use_water_recycler = np.asarray(use_water_recycler, dtype=bool)
+
+    # === OXYGEN NEED ===
+    base_o2_per_day = 0.75
+    total_o2_required = (
+        duration * base_o2_per_day * _activity_lookup(activity, O2_ACTIVITY_FACTOR)
+        * (np.asarray(body_mass_total, dtype=float) / 70.0)
+    )
+
+    # === CO2 GENERATION ===
+    total_co2_generated = duration * _activity_lookup(activity, CO2_PER_DAY) * crew_count
+
+    # Efficiencies below 1.0 are taken as fractions rather than percentages
+    scrub_eff = np.asarray(co2_scrubber_efficiency, dtype=float)
+    scrub_eff = np.where(scrub_eff < 1.0, scrub_eff * 100.0, scrub_eff)
+    recyc_eff = np.asarray(co2_recycler_efficiency, dtype=float)
+    recyc_eff = np.where(recyc_eff < 1.0, recyc_eff * 100.0, recyc_eff)
+
+    co2_removed = total_co2_generated * (scrub_eff / 100.0)
+    scrubber_mass = np.where(use_scrubber, co2_removed * scrubber_weight_per_kg, 0.0)
+    recycler_mass = np.where(use_recycler, recycler_weight, 0.0)
+    o2_reclaimed = np.where(
+        use_scrubber,
+        co2_removed * 0.8,  # assume 80% of CO2 mass becomes O2
+        np.where(use_recycler, total_co2_generated * (recyc_eff / 100.0), 0.0)
+    )
+
+    o2_from_tanks = np.maximum(total_o2_required - o2_reclaimed, 0)
+    tank_mass = o2_from_tanks * (1 + np.asarray(oxygen_tank_weight_per_kg, dtype=float))
+    total_mass = tank_mass + scrubber_mass + recycler_mass
+
+    # === NITROGEN REQUIREMENT ===
+    n2_required = total_o2_required * 3.71
+    n2_tank_mass = n2_required * nitrogen_tank_weight_per_kg
+    total_mass = total_mass + n2_tank_mass
+
+    # === WATER: Hygiene + Excretion ===
+    hygiene_total = crew_count * duration * hygiene_water_per_day
+    excretion_total = crew_count * duration * 3 * 250
+    water_total_raw = hygiene_total + excretion_total
+
+    recovered_water = np.where(
+        use_water_recycler,
+        water_total_raw * (np.asarray(water_recycler_efficiency, dtype=float) / 100.0),
+        0.0
+    )
+    water_net = water_total_raw - recovered_water
+    water_recycler_weight = np.asarray(water_recycler_weight, dtype=float)
+    total_mass = total_mass + water_net / 1000 + water_recycler_weight
+
+    return {
+        'o2_required_kg': total_o2_required,
+        'o2_reclaimed': o2_reclaimed,
+        'o2_tank_mass': tank_mass,
+        'scrubber_mass': scrubber_mass,
+        'recycler_mass': recycler_mass,
+        'co2_generated': total_co2_generated,
+        'within_limit': total_mass <= weight_limit,
+        'n2_required_kg': n2_required,
+        'n2_tank_mass': n2_tank_mass,
+        'water_hygiene_raw': hygiene_total,
+        'water_excretion': excretion_total,
+        'water_recovered': recovered_water,
+        'water_net': water_net,
+        'water_recycler_mass': water_recycler_weight,
+        'total_life_support_mass': total_mass,
+    }
+
 class LifeSupportEngine(KnowledgeEngine):
-    def __init__(self):
+    def __init__(self, persist=False, db_path='gas_budget.db', base_weight_limit=None):
+        """
+        persist=True queues a gas_masses row for each computed budget on the
+        write-behind writer (see db_utils.queue_gas_budget). Off by default:
+        callers that store the budget themselves keep compute free of I/O.
+        """
         super().__init__()
-        print("🚧 Engine initialized")
+        log.debug("🚧 Engine initialized")
+        self.configure(persist=persist, db_path=db_path, base_weight_limit=base_weight_limit)
+
+    def configure(self, persist=False, db_path='gas_budget.db', base_weight_limit=None):
+        """Per-run settings; a pooled engine is re-configured instead of rebuilt."""
         self.results = {}
+        self.persist = persist
+        self.db_path = db_path
+        self.base_weight_limit = base_weight_limit
 
     @Rule(
         LifeSupportFacts(
@@ -44,123 +174,63 @@ class LifeSupportEngine(KnowledgeEngine):
                          hygiene_water_per_day, use_water_recycler,
                          water_recycler_efficiency, water_recycler_weight):
 
-        print("🚀 Rule matched. Searching for LifeSupportFacts...")
-        print("🚀 LifeSupportFacts bound:")
-        print(f"📅 Duration: {duration} days")
-        print(f"👥 Crew count: {crew_count} members")
-        print(f"⚖️ Body masses: {body_masses}")
-        print(f"🏃 Activity level: {activity}")
-        print(f"🫧 Hygiene water/day: {hygiene_water_per_day} g")
-        print(f"🟦 O₂ tank mass/kg: {oxygen_tank_weight_per_kg}")
-        print(f"🟨 N₂ tank mass/kg: {nitrogen_tank_weight_per_kg}")
-        print(f"💧 Use water recycler: {use_water_recycler} (efficiency: {water_recycler_efficiency}%, mass: {water_recycler_weight} kg)")
-        print(f"🧪 Use scrubber: {use_scrubber} (efficiency: {co2_scrubber_efficiency}%, kg CO₂/kg scrubber: {scrubber_weight_per_kg})")
-        print(f"🔁 Use CO₂ recycler: {use_recycler} (efficiency: {co2_recycler_efficiency}%, mass: {recycler_weight} kg)")
-        print(f"🚫 Weight limit: {weight_limit} kg")
-
-
-        # Grab the first matching LifeSupportFacts
-
-        for f in self.facts.values():
-            if isinstance(f, Fact) and all(k in f for k in ['duration', 'crew_count', 'body_masses']):
-                fact = f
-                break
-
-        else:
-            print("⚠️ No usable LifeSupportFacts found.")
-            return
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("🚀 Rule matched. LifeSupportFacts bound:")
+            log.debug("📅 Duration: %s days", duration)
+            log.debug("👥 Crew count: %s members", crew_count)
+            log.debug("⚖️ Body masses: %s", body_masses)
+            log.debug("🏃 Activity level: %s", activity)
+            log.debug("🫧 Hygiene water/day: %s g", hygiene_water_per_day)
+            log.debug("🟦 O₂ tank mass/kg: %s", oxygen_tank_weight_per_kg)
+            log.debug("🟨 N₂ tank mass/kg: %s", nitrogen_tank_weight_per_kg)
+            log.debug("💧 Use water recycler: %s (efficiency: %s%%, mass: %s kg)",
+                      use_water_recycler, water_recycler_efficiency, water_recycler_weight)
+            log.debug("🧪 Use scrubber: %s (efficiency: %s%%, kg CO₂/kg scrubber: %s)",
+                      use_scrubber, co2_scrubber_efficiency, scrubber_weight_per_kg)
+            log.debug("🔁 Use CO₂ recycler: %s (efficiency: %s%%, mass: %s kg)",
+                      use_recycler, co2_recycler_efficiency, recycler_weight)
+            log.debug("🚫 Weight limit: %s kg", weight_limit)
 
-        # === Unpack facts ===
-        duration = fact['duration']
-        crew_count = fact['crew_count']
-        body_masses = fact['body_masses']
-        activity = fact['activity']
-        oxygen_tank_weight_per_kg = fact['oxygen_tank_weight_per_kg']
-        weight_limit = fact['weight_limit']
-        use_scrubber = fact['use_scrubber']
-        use_recycler = fact['use_recycler']
-        co2_scrubber_efficiency = fact['co2_scrubber_efficiency']
-        scrubber_weight_per_kg = fact['scrubber_weight_per_kg']
-        co2_recycler_efficiency = fact['co2_recycler_efficiency']
-        recycler_weight = fact['recycler_weight']
-        nitrogen_tank_weight_per_kg = fact['nitrogen_tank_weight_per_kg']
-        hygiene_water_per_day = fact['hygiene_water_per_day']
-        use_water_recycler = fact['use_water_recycler']
-        water_recycler_efficiency = fact['water_recycler_efficiency']
-        water_recycler_weight = fact['water_recycler_weight']
-
-        # === OXYGEN NEED ===
-        base_o2_per_day = 0.75
-        activity_factor = {'low': 1.0, 'moderate': 1.5, 'daily': 2.0}
-        adjusted_factors = [mass / 70.0 for mass in body_masses]
-        total_o2_required = duration * base_o2_per_day * activity_factor[activity] * sum(adjusted_factors)
-
-        # === CO2 GENERATION ===
-        base_co2_per_day = {'low': 0.8, 'moderate': 1.4, 'daily': 2.2}
-        total_co2_generated = duration * base_co2_per_day[activity] * crew_count
 
         if use_scrubber and use_recycler:
             self.results['error'] = "Cannot use both scrubber and recycler. Choose only one."
             return
 
-        scrubber_mass = 0
-        recycler_mass = 0
-        o2_reclaimed = 0
-
-        if use_scrubber:
-            eff = co2_scrubber_efficiency
-            if eff < 1.0:
-                eff *= 100.0
-            co2_removed = total_co2_generated * (eff / 100.0)
-            scrubber_mass = co2_removed * scrubber_weight_per_kg
-            o2_reclaimed = co2_removed * 0.8  # assume 80% of CO2 mass becomes O2
-        elif use_recycler:
-            eff = co2_recycler_efficiency
-            if eff < 1.0:
-                eff *= 100.0
-            o2_reclaimed = total_co2_generated * (eff / 100.0)
-            recycler_mass = recycler_weight
-
-        o2_from_tanks = max(total_o2_required - o2_reclaimed, 0)
-        tank_mass = o2_from_tanks * (1 + oxygen_tank_weight_per_kg)
-        total_mass = tank_mass + scrubber_mass + recycler_mass
-
-        # === NITROGEN REQUIREMENT ===
-        n2_required = total_o2_required * 3.71
-        n2_tank_mass = n2_required * nitrogen_tank_weight_per_kg
-        total_mass += n2_tank_mass
-
-        # === WATER: Hygiene + Excretion ===
-        hygiene_total = crew_count * duration * hygiene_water_per_day
-        excretion_total = crew_count * duration * 3 * 250
-        water_total_raw = hygiene_total + excretion_total
-
-        recovered_water = water_total_raw * (water_recycler_efficiency / 100.0) if use_water_recycler else 0
-        water_net = water_total_raw - recovered_water
-        total_mass += water_net / 1000
-        total_mass += water_recycler_weight
+        out = compute_life_support_arrays(
+            duration=duration,
+            crew_count=crew_count,
+            body_mass_total=sum(body_masses),
+            activity=activity,
+            oxygen_tank_weight_per_kg=oxygen_tank_weight_per_kg,
+            weight_limit=weight_limit,
+            use_scrubber=use_scrubber,
+            use_recycler=use_recycler,
+            co2_scrubber_efficiency=co2_scrubber_efficiency,
+            scrubber_weight_per_kg=scrubber_weight_per_kg,
+            co2_recycler_efficiency=co2_recycler_efficiency,
+            recycler_weight=recycler_weight,
+            nitrogen_tank_weight_per_kg=nitrogen_tank_weight_per_kg,
+            hygiene_water_per_day=hygiene_water_per_day,
+            use_water_recycler=use_water_recycler,
+            water_recycler_efficiency=water_recycler_efficiency,
+            water_recycler_weight=water_recycler_weight
+        )
 
         # === Store Results ===
-        self.results['o2_required_kg'] = round(total_o2_required, 2)
-        self.results['o2_reclaimed'] = round(o2_reclaimed, 2)
-        self.results['o2_tank_mass'] = round(tank_mass, 2)
-        self.results['scrubber_mass'] = round(scrubber_mass, 2)
-        self.results['recycler_mass'] = round(recycler_mass, 2)
-        self.results['co2_generated'] = round(total_co2_generated, 2)
-        self.results['within_limit'] = total_mass <= weight_limit
-        self.results['n2_required_kg'] = round(n2_required, 2)
-        self.results['n2_tank_mass'] = round(n2_tank_mass, 2)
-        self.results['water_hygiene_raw'] = round(hygiene_total, 2)
-        self.results['water_excretion'] = round(excretion_total, 2)
-        self.results['water_recovered'] = round(recovered_water, 2)
-        self.results['water_net'] = round(water_net, 2)
-        self.results['water_recycler_mass'] = round(water_recycler_weight, 2)
-        self.results['total_life_support_mass'] = round(total_mass, 2)
-
-        # === Insert into DB ===
+        for key in RESULT_FIELDS:
+            if key == 'within_limit':
+                self.results[key] = bool(out[key])
+            else:
+                self.results[key] = round(float(out[key]), 2)
+
+        log.debug("✅ Engine Results: %s", self.results)
+        if not self.persist:
+            return
+
+        # === Queue the DB insert ===
         try:
-            insert_gas_budget(
-                db_path='gas_budget.db',
+            queue_gas_budget(
+                db_path=self.db_path,
                 data={
                     'timestamp': datetime.utcnow().isoformat(),
                     'duration': duration,
@@ -168,37 +238,157 @@ class LifeSupportEngine(KnowledgeEngine):
                     'body_masses': ','.join([str(x) for x in body_masses]),
                     'activity': activity,
                     'oxygen_tank_weight_per_kg': oxygen_tank_weight_per_kg,
-                    'co2_generated': round(total_co2_generated, 2),
-                    'o2_required_kg': round(total_o2_required, 2),
-                    'o2_reclaimed': round(o2_reclaimed, 2),
-                    'o2_tank_mass': round(tank_mass, 2),
-                    'scrubber_mass': round(scrubber_mass, 2),
-                    'recycler_mass': round(recycler_mass, 2),
-                    'total_gas_mass': round(total_mass, 2),
+                    'co2_generated': self.results['co2_generated'],
+                    'o2_required_kg': self.results['o2_required_kg'],
+                    'o2_reclaimed': self.results['o2_reclaimed'],
+                    'o2_tank_mass': self.results['o2_tank_mass'],
+                    'scrubber_mass': self.results['scrubber_mass'],
+                    'recycler_mass': self.results['recycler_mass'],
+                    'total_gas_mass': self.results['total_life_support_mass'],
                     'use_scrubber': use_scrubber,
                     'use_recycler': use_recycler,
                     'co2_scrubber_efficiency': co2_scrubber_efficiency,
                     'scrubber_weight_per_kg': scrubber_weight_per_kg,
                     'co2_recycler_efficiency': co2_recycler_efficiency,
                     'recycler_weight': recycler_weight,
-                    'within_limit': total_mass <= weight_limit,
+                    'within_limit': self.results['within_limit'],
                     'weight_limit': weight_limit,
-                    'n2_required_kg': round(n2_required, 2),
-                    'n2_tank_mass': round(n2_tank_mass, 2),
-                    'water_hygiene_raw': round(hygiene_total, 2),
-                    'water_excretion': round(excretion_total, 2),
-                    'water_recovered': round(recovered_water, 2),
-                    'water_net': round(water_net, 2),
+                    'n2_required_kg': self.results['n2_required_kg'],
+                    'n2_tank_mass': self.results['n2_tank_mass'],
+                    'water_hygiene_raw': self.results['water_hygiene_raw'],
+                    'water_excretion': self.results['water_excretion'],
+                    'water_recovered': self.results['water_recovered'],
+                    'water_net': self.results['water_net'],
                     'use_water_recycler': use_water_recycler,
                     'water_recycler_efficiency': water_recycler_efficiency,
                     'nitrogen_tank_weight_per_kg': nitrogen_tank_weight_per_kg,
                     'hygiene_water_per_day': hygiene_water_per_day,
-                    'water_recycler_mass': round(water_recycler_weight, 2),
-                    'total_life_support_mass': round(total_mass, 2)
+                    'water_recycler_mass': self.results['water_recycler_mass'],
+                    'total_life_support_mass': self.results['total_life_support_mass'],
+                    'base_weight_limit': self.base_weight_limit
                 }
             )
         except Exception as e:
-            print("⚠️ insert_gas_budget failed:", e)
+            log.warning("⚠️ queue_gas_budget failed: %s", e)
+
+
+# === Monte Carlo uncertainty mode ===
+
+def sample_parameter(rng, spec, n):
+    """
+    Draw n values for one parameter. A non-dict spec is a fixed value; a dict
+    names a distribution ('normal', 'uniform', 'triangular', 'lognormal' or
+    'choice') plus optional 'min'/'max' clip bounds.
+    """
+    if not isinstance(spec, dict):
+        return spec
+
+    dist = spec.get('dist', 'normal')
+    if dist == 'normal':
+        values = rng.normal(spec['mean'], spec['std'], n)
+    elif dist == 'uniform':
+        values = rng.uniform(spec['low'], spec['high'], n)
+    elif dist == 'triangular':
+        values = rng.triangular(spec['left'], spec['mode'], spec['right'], n)
+    elif dist == 'lognormal':
+        values = rng.lognormal(spec['mean'], spec['sigma'], n)
+    elif dist == 'choice':
+        values = rng.choice(np.asarray(spec['values']), n, p=spec.get('p'))
+    else:
+        raise ValueError(f"Unknown distribution '{dist}'.")
+
+    if 'min' in spec or 'max' in spec:
+        values = np.clip(values, spec.get('min', -np.inf), spec.get('max', np.inf))
+    return values
+
+
+def _monte_carlo_chunk(task):
+    """
+    Evaluate one chunk of samples; module-level so it can run in a worker process.
+    Returns the chunk's count, mean and sum of squared deviations, its
+    limit-exceeded count, and a uniform subsample of keep totals for percentiles.
+    """
+    base, distributions, size, seed_seq, keep = task
+    rng = np.random.default_rng(seed_seq)
+    params = dict(base)
+    for name, spec in distributions.items():
+        params[name] = sample_parameter(rng, spec, size)
+
+    out = compute_life_support_arrays(**params)
+    total = np.broadcast_to(out['total_life_support_mass'], size).astype(np.float64)
+    exceeded = int(np.count_nonzero(~np.broadcast_to(out['within_limit'], size)))
+    mean = float(total.mean())
+    m2 = float(((total - mean) ** 2).sum())
+    kept = total if keep >= size else rng.choice(total, keep, replace=False)
+    return size, mean, m2, exceeded, kept.astype(np.float32)
+
+
+def simulate_life_support_mass(facts, distributions, samples=100_000, chunk_size=20_000,
+                               seed=None, workers=0, percentiles=(5, 50, 95, 99),
+                               percentile_samples=20_000):
+    """
+    Monte Carlo estimate of total_life_support_mass under uncertain inputs.
+
+    facts holds the point estimates (the LifeSupportFacts fields, with body_masses
+    as a list); distributions maps any compute_life_support_arrays parameter to a
+    sample_parameter spec. Samples are drawn and evaluated chunk by chunk so only
+    one chunk of intermediate arrays is alive at a time, and each chunk has its own
+    child seed, so a seed gives the same answer with or without workers.
+
+    Chunks are folded in as they finish: mean, std and the exceed probability are
+    merged exactly, and percentiles come from a subsample of at most
+    percentile_samples totals drawn evenly from every chunk. Memory stays
+    O(chunk_size + percentile_samples) however many samples are run. With
+    samples <= percentile_samples the percentiles are exact.
+    """
+    body_masses = facts['body_masses']
+    base = {k: v for k, v in facts.items() if k != 'body_masses'}
+    base.setdefault('crew_count', len(body_masses))
+    base['body_mass_total'] = float(sum(body_masses))
+
+    unknown = set(distributions) - set(base)
+    if unknown:
+        raise ValueError(f"No point estimate for uncertain parameters: {sorted(unknown)}")
+
+    sizes = [min(chunk_size, samples - start) for start in range(0, samples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    # Each chunk's share of the percentile subsample is proportional to its size
+    keeps = [size if samples <= percentile_samples else max(1, size * percentile_samples // samples)
+             for size in sizes]
+    tasks = [(base, distributions, size, s, keep) for size, s, keep in zip(sizes, seeds, keeps)]
+
+    count, mean, m2, exceeded = 0, 0.0, 0.0, 0
+    kept = []
+
+    def fold(chunk):
+        # 🧮 Chan et al. pairwise update of the running mean and squared deviations
+        nonlocal count, mean, m2, exceeded
+        n, chunk_mean, chunk_m2, chunk_exceeded, chunk_kept = chunk
+        delta = chunk_mean - mean
+        merged = count + n
+        mean += delta * n / merged
+        m2 += chunk_m2 + delta * delta * count * n / merged
+        count = merged
+        exceeded += chunk_exceeded
+        kept.append(chunk_kept)
+
+    if workers and workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk in pool.map(_monte_carlo_chunk, tasks):
+                fold(chunk)
+    else:
+        for task in tasks:
+            fold(_monte_carlo_chunk(task))
 
-        print("✅ Engine Results:")
-        print(self.results)
\ No newline at end of file
+    kept = np.concatenate(kept)
+    return {
+        'samples': samples,
+        'mean_mass': round(mean, 2),
+        'std_mass': round(float(np.sqrt(m2 / count)), 2),
+        'percentiles': {
+            f"p{p}": round(float(v), 2)
+            for p, v in zip(percentiles, np.percentile(kept, percentiles))
+        },
+        'percentile_samples': int(kept.size),
+        'prob_exceed_limit': round(exceeded / samples, 4),
+    }
@@ -0,0 +1,91 @@
+# engine_pool.py
+"""
+Warm pools of experta engines, one pool per engine class.
+
+Building a KnowledgeEngine compiles its Rete network from the @Rule methods,
+which costs milliseconds for the medical and planner engines. A pool keeps
+built engines around. checkout() takes an idle one, or builds one if none is
+idle, and calls its configure() with the request's arguments. When the block
+exits, the engine is reset() and put back. Each engine is used by one thread
+at a time, so this is safe under a threaded Flask server.
+
+Pooled classes need a configure() that takes the constructor's arguments and
+sets every per-run attribute.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+from log_config import get_logger
+
+log = get_logger('engine')
+
+ENGINE_POOL_MAX_IDLE = int(os.getenv('ENGINE_POOL_MAX_IDLE', '8'))
+# ENGINE_POOL=0 builds a fresh engine for every checkout
+ENGINE_POOL_ENABLED = os.getenv('ENGINE_POOL', '1') != '0'
+
+
+class EnginePool:
+    def __init__(self, engine_cls, max_idle=ENGINE_POOL_MAX_IDLE):
+        self.engine_cls = engine_cls
+        self.max_idle = max_idle
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self, *args, **kwargs):
+        with self.lock:
+            engine = self.idle.pop() if self.idle else None
+        if engine is None:
+            return self.engine_cls(*args, **kwargs)
+        engine.configure(*args, **kwargs)
+        return engine
+
+    def release(self, engine):
+        # Drop the working memory now rather than holding it while idle
+        engine.reset()
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(engine)
+
+    def prewarm(self, count, *args, **kwargs):
+        """Build up to count idle engines ahead of the first request."""
+        engines = [self.engine_cls(*args, **kwargs) for _ in range(count)]
+        for engine in engines:
+            self.release(engine)
+
+    @contextmanager
+    def checkout(self, *args, **kwargs):
+        engine = self.acquire(*args, **kwargs)
+        try:
+            yield engine
+        except Exception:
+            # A run that blew up may have left the engine half-way; don't reuse it
+            log.debug("🗑️ Discarding %s after an error", self.engine_cls.__name__)
+            raise
+        else:
+            self.release(engine)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_engine_pool(engine_cls):
+    with _pools_lock:
+        pool = _pools.get(engine_cls)
+        if pool is None:
+            pool = _pools[engine_cls] = EnginePool(engine_cls)
+    return pool
+
+
+@contextmanager
+def checkout_engine(engine_cls, *args, **kwargs):
+    """
+    with checkout_engine(LifeSupportEngine) as engine: ...
+    Yields a configured engine from the class's pool (or a new one with ENGINE_POOL=0).
+    """
+    if not ENGINE_POOL_ENABLED:
+        yield engine_cls(*args, **kwargs)
+        return
+    with get_engine_pool(engine_cls).checkout(*args, **kwargs) as engine:
+        yield engine
@@ -0,0 +1,45 @@
+# log_config.py
+"""
+Logging setup shared by the app, engines and tools.
+
+Every subsystem logs under "lifesupport.<subsystem>". The per-evaluation detail
+(engine facts, each finalized meal, each rationed row, diagnosis steps) is at
+DEBUG, so with the default levels the hot paths emit nothing. Override levels
+with LOG_LEVEL (everything) or LOG_LEVEL_<SUBSYSTEM>, e.g. LOG_LEVEL_ENGINE=DEBUG.
+"""
+import logging
+import os
+
+LOGGER_ROOT = 'lifesupport'
+
+# Default level per subsystem
+SUBSYSTEM_LEVELS = {
+    'app': 'INFO',
+    'db': 'WARNING',
+    'engine': 'WARNING',
+    'planner': 'WARNING',
+    'ration': 'WARNING',
+    'medical': 'WARNING',
+}
+
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+
+
+def get_logger(subsystem):
+    return logging.getLogger(f"{LOGGER_ROOT}.{subsystem}")
+
+
+def configure_logging(stream=None):
+    """Attach one handler to the "lifesupport" logger and apply the subsystem levels."""
+    root = logging.getLogger(LOGGER_ROOT)
+    if not root.handlers:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+    root.propagate = False
+
+    default = os.getenv('LOG_LEVEL')
+    for subsystem, level in SUBSYSTEM_LEVELS.items():
+        level = os.getenv(f"LOG_LEVEL_{subsystem.upper()}", default or level)
+        get_logger(subsystem).setLevel(level.upper())
+    return root
@@ -1,12 +1,71 @@
 #medical_expert.py
 
+import collections
+import collections.abc
+collections.Mapping = collections.abc.Mapping
+import os
+from types import MappingProxyType
+
 from flask import Flask, request, jsonify
 from experta import Fact, KnowledgeEngine, Rule, DefFacts, OR, NOT
 
+from engine_pool import checkout_engine
+from rule_packs import RuleBook
+
+# ---------------------- RULE TABLE ----------------------
+# The recommendation text for every rule. SpaceMedicalExpertSystem and the
+# compiled lookup below both read from here.
+SYMPTOM_RECOMMENDATIONS = MappingProxyType({
+    ('muscle_pain', 'mild'): "🧮 Mild muscle pain: Light resistance exercises and hydration recommended.",
+    ('muscle_pain', 'moderate'): "🧮 Moderate muscle pain: Increase intensity of physical exercise and stretch frequently.",
+    ('muscle_pain', 'severe'): "🧮 Severe muscle pain: Consult mission medical officer and consider analgesics.",
+    ('vision_issue', 'mild'): "👁️ Mild vision issues: Limit screen exposure and stay hydrated.",
+    ('vision_issue', 'moderate'): "👁️ Moderate vision issues: Possible early SANS. Monitor closely and rest.",
+    ('vision_issue', 'severe'): "👁️ Severe vision change: Risk of SANS. Alert medical team immediately.",
+    ('stress', 'mild'): "🧘 Mild stress: Breathing exercises and music therapy suggested.",
+    ('stress', 'moderate'): "🧘 Moderate stress: Use mental health logs and talk with peers.",
+    ('stress', 'severe'): "🧘 Severe stress: Contact onboard psychological support immediately.",
+    ('back_pain', 'mild'): "🧐 Mild back pain: Try light stretching and adjust your sleeping posture.",
+    ('back_pain', 'moderate'): "🧐 Moderate back pain: Do core strengthening and posture correction exercises.",
+    ('back_pain', 'severe'): "🧐 Severe back pain: Possible spinal deconditioning. Consult a flight surgeon.",
+    ('insomnia', 'mild'): "🌙 Mild insomnia: Follow a strict sleep schedule and avoid caffeine.",
+    ('insomnia', 'moderate'): "🌙 Moderate insomnia: Use white noise and relaxation techniques before sleep.",
+    ('insomnia', 'severe'): "🌙 Severe insomnia: Report to mission medical. Sleep meds might be necessary.",
+    ('headache', 'mild'): "🧕 Mild headache: Drink water and avoid screen time.",
+    ('headache', 'moderate'): "🧕 Moderate headache: Check for CO₂ buildup. Rest and hydrate.",
+    ('headache', 'severe'): "🧕 Severe headache: Possible ICP elevation. Seek urgent care.",
+    ('dizziness', 'mild'): "🌀 Mild dizziness: Take slow movements and stay hydrated.",
+    ('dizziness', 'moderate'): "🌀 Moderate dizziness: Lie down briefly and monitor balance issues.",
+    ('dizziness', 'severe'): "🌀 Severe dizziness: Risk of vestibular dysfunction. Alert medical staff.",
+    ('appetite_loss', 'mild'): "🍽️ Mild appetite loss: Increase meal frequency with smaller portions.",
+    ('appetite_loss', 'moderate'): "🍽️ Moderate appetite loss: Nutritional monitoring required. Try favorite foods.",
+    ('appetite_loss', 'severe'): "🍽️ Severe appetite loss: Malnutrition risk. Consult onboard dietician.",
+    ('motion_sickness', 'mild'): "🚀 Mild motion sickness: Avoid quick head movements and sip water.",
+    ('motion_sickness', 'moderate'): "🚀 Moderate motion sickness: Take anti-nausea medication if available.",
+    ('motion_sickness', 'severe'): "🚀 Severe motion sickness: Rest in stable position and seek medical aid.",
+})
+
+PHASE_RECOMMENDATIONS = MappingProxyType({
+    'early': "🕒 You are in the early phase of the mission. Some symptoms may relate to initial adaptation.",
+    'mid': "🕒 Mid-mission phase: Watch for circulatory, vision, and sleep-related symptoms.",
+})
+
+# Any severity of these symptoms in a centrifugal habitat
+CORIOLIS_SYMPTOMS = frozenset({'motion_sickness', 'dizziness'})
+CORIOLIS_RECOMMENDATION = "🌀 Coriolis-induced vestibular disruption detected from centrifugal habitat. Take anti-nausea medication and relocate to a microgravity area temporarily."
+
+LATE_CENTRIFUGE_RECOMMENDATION = "🕒 Long-duration mission: Increased risk of immune suppression; possible slight risk of spaceflight associated neuro-ocular syndrome (SANS) and bone density loss, depending on centrifuge."
+LATE_STANDARD_RECOMMENDATION = "🕒 Long-duration mission: Increased risk of bone density loss, SANS, and immune suppression."
+
+
 # Define the Expert System (same as you already have)
 class SpaceMedicalExpertSystem(KnowledgeEngine):
     def __init__(self):
         super().__init__()
+        self.configure()
+
+    def configure(self):
+        """Clear the recommendations; a pooled engine is re-configured instead of rebuilt."""
         self.results = set()
         self._vestibular_notice_given = False  # Add flag
 
@@ -22,121 +81,121 @@ class SpaceMedicalExpertSystem(KnowledgeEngine):
 
     @Rule(Fact(action='start'), Fact(symptom='muscle_pain', severity='mild'))
     def muscle_pain_mild(self):
-        self.add_recommendation("🧮 Mild muscle pain: Light resistance exercises and hydration recommended.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('muscle_pain', 'mild')])
 
     @Rule(Fact(action='start'), Fact(symptom='muscle_pain', severity='moderate'))
     def muscle_pain_moderate(self):
-        self.add_recommendation("🧮 Moderate muscle pain: Increase intensity of physical exercise and stretch frequently.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('muscle_pain', 'moderate')])
 
     @Rule(Fact(action='start'), Fact(symptom='muscle_pain', severity='severe'))
     def muscle_pain_severe(self):
-        self.add_recommendation("🧮 Severe muscle pain: Consult mission medical officer and consider analgesics.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('muscle_pain', 'severe')])
 
     @Rule(Fact(action='start'), Fact(symptom='vision_issue', severity='mild'))
     def vision_mild(self):
-        self.add_recommendation("👁️ Mild vision issues: Limit screen exposure and stay hydrated.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('vision_issue', 'mild')])
 
     @Rule(Fact(action='start'), Fact(symptom='vision_issue', severity='moderate'))
     def vision_moderate(self):
-        self.add_recommendation("👁️ Moderate vision issues: Possible early SANS. Monitor closely and rest.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('vision_issue', 'moderate')])
 
     @Rule(Fact(action='start'), Fact(symptom='vision_issue', severity='severe'))
     def vision_severe(self):
-        self.add_recommendation("👁️ Severe vision change: Risk of SANS. Alert medical team immediately.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('vision_issue', 'severe')])
 
     @Rule(Fact(action='start'), Fact(symptom='stress', severity='mild'))
     def stress_mild(self):
-        self.add_recommendation("🧘 Mild stress: Breathing exercises and music therapy suggested.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('stress', 'mild')])
 
     @Rule(Fact(action='start'), Fact(symptom='stress', severity='moderate'))
     def stress_moderate(self):
-        self.add_recommendation("🧘 Moderate stress: Use mental health logs and talk with peers.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('stress', 'moderate')])
 
     @Rule(Fact(action='start'), Fact(symptom='stress', severity='severe'))
     def stress_severe(self):
-        self.add_recommendation("🧘 Severe stress: Contact onboard psychological support immediately.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('stress', 'severe')])
 
     @Rule(Fact(action='start'), Fact(symptom='back_pain', severity='mild'))
     def back_pain_mild(self):
-        self.add_recommendation("🧐 Mild back pain: Try light stretching and adjust your sleeping posture.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('back_pain', 'mild')])
 
     @Rule(Fact(action='start'), Fact(symptom='back_pain', severity='moderate'))
     def back_pain_moderate(self):
-        self.add_recommendation("🧐 Moderate back pain: Do core strengthening and posture correction exercises.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('back_pain', 'moderate')])
 
     @Rule(Fact(action='start'), Fact(symptom='back_pain', severity='severe'))
     def back_pain_severe(self):
-        self.add_recommendation("🧐 Severe back pain: Possible spinal deconditioning. Consult a flight surgeon.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('back_pain', 'severe')])
 
     @Rule(Fact(action='start'), Fact(symptom='insomnia', severity='mild'))
     def insomnia_mild(self):
-        self.add_recommendation("🌙 Mild insomnia: Follow a strict sleep schedule and avoid caffeine.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('insomnia', 'mild')])
 
     @Rule(Fact(action='start'), Fact(symptom='insomnia', severity='moderate'))
     def insomnia_moderate(self):
-        self.add_recommendation("🌙 Moderate insomnia: Use white noise and relaxation techniques before sleep.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('insomnia', 'moderate')])
 
     @Rule(Fact(action='start'), Fact(symptom='insomnia', severity='severe'))
     def insomnia_severe(self):
-        self.add_recommendation("🌙 Severe insomnia: Report to mission medical. Sleep meds might be necessary.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('insomnia', 'severe')])
 
     @Rule(Fact(action='start'), Fact(symptom='headache', severity='mild'))
     def headache_mild(self):
-        self.add_recommendation("🧕 Mild headache: Drink water and avoid screen time.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('headache', 'mild')])
 
     @Rule(Fact(action='start'), Fact(symptom='headache', severity='moderate'))
     def headache_moderate(self):
-        self.add_recommendation("🧕 Moderate headache: Check for CO₂ buildup. Rest and hydrate.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('headache', 'moderate')])
 
     @Rule(Fact(action='start'), Fact(symptom='headache', severity='severe'))
     def headache_severe(self):
-        self.add_recommendation("🧕 Severe headache: Possible ICP elevation. Seek urgent care.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('headache', 'severe')])
 
     @Rule(Fact(action='start'), Fact(symptom='dizziness', severity='mild'))
     def dizziness_mild(self):
-        self.add_recommendation("🌀 Mild dizziness: Take slow movements and stay hydrated.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('dizziness', 'mild')])
 
     @Rule(Fact(action='start'), Fact(symptom='dizziness', severity='moderate'))
     def dizziness_moderate(self):
-        self.add_recommendation("🌀 Moderate dizziness: Lie down briefly and monitor balance issues.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('dizziness', 'moderate')])
 
     @Rule(Fact(action='start'), Fact(symptom='dizziness', severity='severe'))
     def dizziness_severe(self):
-        self.add_recommendation("🌀 Severe dizziness: Risk of vestibular dysfunction. Alert medical staff.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('dizziness', 'severe')])
 
     @Rule(Fact(action='start'), Fact(symptom='appetite_loss', severity='mild'))
     def appetite_loss_mild(self):
-        self.add_recommendation("🍽️ Mild appetite loss: Increase meal frequency with smaller portions.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('appetite_loss', 'mild')])
 
     @Rule(Fact(action='start'), Fact(symptom='appetite_loss', severity='moderate'))
     def appetite_loss_moderate(self):
-        self.add_recommendation("🍽️ Moderate appetite loss: Nutritional monitoring required. Try favorite foods.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('appetite_loss', 'moderate')])
 
     @Rule(Fact(action='start'), Fact(symptom='appetite_loss', severity='severe'))
     def appetite_loss_severe(self):
-        self.add_recommendation("🍽️ Severe appetite loss: Malnutrition risk. Consult onboard dietician.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('appetite_loss', 'severe')])
 
     @Rule(Fact(action='start'), Fact(symptom='motion_sickness', severity='mild'))
     def motion_sickness_mild(self):
-        self.add_recommendation("🚀 Mild motion sickness: Avoid quick head movements and sip water.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('motion_sickness', 'mild')])
 
     @Rule(Fact(action='start'), Fact(symptom='motion_sickness', severity='moderate'))
     def motion_sickness_moderate(self):
-        self.add_recommendation("🚀 Moderate motion sickness: Take anti-nausea medication if available.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('motion_sickness', 'moderate')])
 
     @Rule(Fact(action='start'), Fact(symptom='motion_sickness', severity='severe'))
     def motion_sickness_severe(self):
-        self.add_recommendation("🚀 Severe motion sickness: Rest in stable position and seek medical aid.")
+        self.add_recommendation(SYMPTOM_RECOMMENDATIONS[('motion_sickness', 'severe')])
 
     # ---------------------- MISSION PHASE RULES ----------------------
 
     @Rule(Fact(action='start'), Fact(mission_phase='early'))
     def early_phase(self):
-        self.add_recommendation("🕒 You are in the early phase of the mission. Some symptoms may relate to initial adaptation.")
+        self.add_recommendation(PHASE_RECOMMENDATIONS['early'])
 
     @Rule(Fact(action='start'), Fact(mission_phase='mid'))
     def mid_phase(self):
-        self.add_recommendation("🕒 Mid-mission phase: Watch for circulatory, vision, and sleep-related symptoms.")
+        self.add_recommendation(PHASE_RECOMMENDATIONS['mid'])
 
     # ---------------------- CORIOLIS RULES ----------------------
 
@@ -146,16 +205,122 @@ class SpaceMedicalExpertSystem(KnowledgeEngine):
         Fact(centrifugal_habitat=True)
     )
     def centrifugal_vestibular_effect(self):
-        self.add_recommendation("🌀 Coriolis-induced vestibular disruption detected from centrifugal habitat. Take anti-nausea medication and relocate to a microgravity area temporarily.")
+        self.add_recommendation(CORIOLIS_RECOMMENDATION)
 
     @Rule(Fact(action='start'), Fact(mission_phase='late'), Fact(centrifugal_habitat=True))
     def late_phase_with_centrifuge(self):
-        self.add_recommendation("🕒 Long-duration mission: Increased risk of immune suppression; possible slight risk of spaceflight associated neuro-ocular syndrome (SANS) and bone density loss, depending on centrifuge.")
+        self.add_recommendation(LATE_CENTRIFUGE_RECOMMENDATION)
 
     @Rule(Fact(action='start'), Fact(mission_phase='late'), NOT(Fact(centrifugal_habitat=True)))
     def late_phase_standard(self):
-        self.add_recommendation("🕒 Long-duration mission: Increased risk of bone density loss, SANS, and immune suppression.")
+        self.add_recommendation(LATE_STANDARD_RECOMMENDATION)
 
     def get_results(self):
         return "\n".join(dict.fromkeys(self.results))  # preserves order but removes duplicates
 
+
+# ---------------------- COMPILED DIAGNOSIS ----------------------
+
+def mission_phase_for_day(mission_day):
+    if mission_day < 15:
+        return 'early'
+    if mission_day < 90:
+        return 'mid'
+    return 'late'
+
+
+def builtin_rules():
+    """The rule table above as rule-pack dicts (see rule_packs.py)."""
+    rules = [
+        {'symptom': symptom, 'severity': severity, 'recommendation': text}
+        for (symptom, severity), text in SYMPTOM_RECOMMENDATIONS.items()
+    ]
+    rules.append({'symptoms': sorted(CORIOLIS_SYMPTOMS), 'centrifugal_habitat': True,
+                  'recommendation': CORIOLIS_RECOMMENDATION})
+    rules.extend({'mission_phase': phase, 'recommendation': text} for phase, text in PHASE_RECOMMENDATIONS.items())
+    rules.append({'mission_phase': 'late', 'centrifugal_habitat': True, 'recommendation': LATE_CENTRIFUGE_RECOMMENDATION})
+    rules.append({'mission_phase': 'late', 'centrifugal_habitat': False, 'recommendation': LATE_STANDARD_RECOMMENDATION})
+    return rules
+
+
+# Built-in rules plus the pack at MEDICAL_RULES_PATH, reloaded when the file changes.
+# Pack rules only reach the compiled path; MEDICAL_BACKEND=experta stays built-in only.
+RULE_BOOK = RuleBook(os.getenv('MEDICAL_RULES_PATH'), base_rules=builtin_rules())
+
+
+def diagnose(symptoms, mission_phase=None, centrifugal_habitat=False, rules=None):
+    """
+    Same recommendations as SpaceMedicalExpertSystem (plus any rule pack), from
+    the compiled matcher instead of a fresh Rete network. symptoms is a list of
+    {'symptom', 'severity'}. rules defaults to the current RULE_BOOK matcher.
+    """
+    rules = rules or RULE_BOOK.current()
+    return rules.diagnose(symptoms, mission_phase, centrifugal_habitat)
+
+
+def validate_triage_records(records):
+    """
+    Check a batch of {'crew', 'mission_day', 'symptoms', 'centrifugal_habitat'}
+    records before any diagnosis runs. Raises ValueError naming the first bad record.
+    """
+    if not isinstance(records, list):
+        raise ValueError("❌ Triage records must be a list.")
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            raise ValueError(f"❌ Record {i} must be an object.")
+        day = record.get('mission_day')
+        if isinstance(day, bool) or not isinstance(day, int) or day < 0:
+            raise ValueError(f"❌ Record {i}: mission_day must be a non-negative integer.")
+        symptoms = record.get('symptoms', [])
+        if not isinstance(symptoms, list) or not all(
+            isinstance(entry, dict)
+            and isinstance(entry.get('symptom'), str)
+            and isinstance(entry.get('severity'), str)
+            for entry in symptoms
+        ):
+            raise ValueError(f"❌ Record {i}: symptoms must be a list of {{'symptom', 'severity'}} strings.")
+        if not isinstance(record.get('centrifugal_habitat', False), bool):
+            raise ValueError(f"❌ Record {i}: centrifugal_habitat must be true or false.")
+
+
+def triage_batch(records):
+    """
+    Diagnose validated triage records, yielding one result dict per record in
+    input order. Identical inputs (same symptoms, mission phase and centrifuge)
+    are diagnosed once, so a crew's repeated daily logs cost a dict lookup.
+    """
+    rules = RULE_BOOK.current()
+    diagnoses = {}
+    for record in records:
+        symptoms = record.get('symptoms', [])
+        phase = mission_phase_for_day(record['mission_day'])
+        centrifugal_habitat = record.get('centrifugal_habitat', False)
+
+        key = (tuple((entry['symptom'], entry['severity']) for entry in symptoms), phase, centrifugal_habitat)
+        recommendations = diagnoses.get(key)
+        if recommendations is None:
+            recommendations = diagnoses[key] = diagnose(symptoms, phase, centrifugal_habitat, rules)
+
+        yield {
+            'crew': record.get('crew'),
+            'mission_day': record['mission_day'],
+            'mission_phase': phase,
+            'recommendations': recommendations,
+        }
+
+
+def run_expert_system(symptoms, mission_phase=None, centrifugal_habitat=False):
+    """Run the experta engine on the same inputs as diagnose(). Returns the recommendation list."""
+    with checkout_engine(SpaceMedicalExpertSystem) as engine:
+        engine.reset()
+
+        for entry in symptoms:
+            engine.declare(Fact(symptom=entry['symptom'], severity=entry['severity']))
+        if mission_phase is not None:
+            engine.declare(Fact(mission_phase=mission_phase))
+        if centrifugal_habitat:
+            engine.declare(Fact(centrifugal_habitat=True))
+
+        engine.run()
+        return list(dict.fromkeys(engine.results))
+
@@ -0,0 +1,201 @@
+# medical_history.py
+"""
+Longitudinal medical history per crew member.
+
+record_diagnosis() appends each diagnosis to medical_log in medical.db. It
+then folds the reported symptoms into medical_trends with one primary-key read
+and write per symptom, so trends stay current without rescanning history.
+
+A symptom is escalating when its severity rises within MEDICAL_TREND_WINDOW_DAYS,
+e.g. vision_issue mild → moderate, the SANS progression the rules warn about.
+The run continues while the severity holds or keeps rising, as long as it
+spans at most the window from its first report. A report past the window
+restarts the run from the previous report. A drop in severity, or a longer
+gap, starts a new run. Back-dated reports are logged but leave the trend
+alone. get_medical_trends() stops counting a trend as escalating once the
+crew member's log has moved more than the window past its last report.
+"""
+import json
+import os
+from datetime import datetime
+
+from db_utils import connect
+
+MEDICAL_DB = 'medical.db'
+SEVERITY_RANK = {'mild': 1, 'moderate': 2, 'severe': 3}
+TREND_WINDOW_DAYS = int(os.getenv('MEDICAL_TREND_WINDOW_DAYS', '14'))
+TREND_FIELDS = ('since_day', 'since_severity', 'last_day', 'last_severity', 'escalating')
+
+
+def advance_trend(state, mission_day, severity, window=TREND_WINDOW_DAYS):
+    """
+    The (crew, symptom) trend state after a report of severity on mission_day.
+    state is the previous state dict (TREND_FIELDS) or None. Constant time.
+    """
+    rank = SEVERITY_RANK.get(severity)
+    fresh = {
+        'since_day': mission_day, 'since_severity': severity,
+        'last_day': mission_day, 'last_severity': severity,
+        'escalating': False,
+    }
+    if state is None:
+        return fresh
+    if rank is None or mission_day < state['last_day']:
+        return state  # unknown severity or back-dated report
+
+    last_rank = SEVERITY_RANK.get(state['last_severity'])
+    if last_rank is None or mission_day - state['last_day'] > window or rank < last_rank:
+        return fresh
+    if mission_day - state['since_day'] > window:
+        # 🔁 The run would outgrow the window; restart it from the previous report
+        state = {
+            'since_day': state['last_day'], 'since_severity': state['last_severity'],
+            'last_day': state['last_day'], 'last_severity': state['last_severity'],
+            'escalating': False,
+        }
+    if rank == last_rank:
+        return dict(state, last_day=mission_day)
+    return dict(state, last_day=mission_day, last_severity=severity, escalating=True)
+
+
+def describe_trend(symptom, trend):
+    return (f"📈 {symptom} escalating: {trend['since_severity']} (day {trend['since_day']}) "
+            f"→ {trend['last_severity']} (day {trend['last_day']})")
+
+
+def record_diagnosis(crew_name, mission_day, symptoms, recommendations,
+                     mission_phase=None, centrifugal_habitat=False, db_path=MEDICAL_DB):
+    """
+    Append one diagnosis to medical_log and update the crew member's symptom
+    trends in the same transaction. Returns the escalating trends among the
+    symptoms just reported, as {'symptom', **TREND_FIELDS} dicts.
+    """
+    if not isinstance(crew_name, str) or not crew_name.strip():
+        raise ValueError("❌ A crew member name is required to log a diagnosis.")
+    if isinstance(mission_day, bool) or not isinstance(mission_day, int):
+        raise ValueError("❌ mission_day must be an integer.")
+
+    # One severity per symptom: the worst reported
+    worst = {}
+    for entry in symptoms:
+        symptom, severity = entry['symptom'], entry['severity']
+        if symptom not in worst or SEVERITY_RANK.get(severity, 0) > SEVERITY_RANK.get(worst[symptom], 0):
+            worst[symptom] = severity
+
+    conn = connect(db_path)
+    cursor = conn.cursor()
+    # IMMEDIATE so two diagnoses for the same crew member can't interleave their trend updates
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute("""
+            INSERT INTO medical_log (
+                crew_name, mission_day, mission_phase, centrifugal_habitat,
+                symptoms, recommendations, logged_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?);
+        """, (
+            crew_name, mission_day, mission_phase, bool(centrifugal_habitat),
+            json.dumps(symptoms), json.dumps(recommendations), datetime.utcnow().isoformat()
+        ))
+
+        escalating = []
+        for symptom, severity in worst.items():
+            cursor.execute(f"""
+                SELECT {', '.join(TREND_FIELDS)} FROM medical_trends
+                WHERE crew_name = ? AND symptom = ?
+            """, (crew_name, symptom))
+            row = cursor.fetchone()
+            state = dict(zip(TREND_FIELDS, row)) if row else None
+            if state is not None:
+                state['escalating'] = bool(state['escalating'])
+
+            trend = advance_trend(state, mission_day, severity)
+            if trend is not state:
+                cursor.execute(f"""
+                    INSERT OR REPLACE INTO medical_trends (crew_name, symptom, {', '.join(TREND_FIELDS)})
+                    VALUES (?, ?, ?, ?, ?, ?, ?);
+                """, (crew_name, symptom, *(trend[field] for field in TREND_FIELDS)))
+            if trend['escalating']:
+                escalating.append({'symptom': symptom, **trend})
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return escalating
+
+
+def get_medical_timeline(crew_name, start_day=None, end_day=None, db_path=MEDICAL_DB):
+    """A crew member's logged diagnoses in mission-day order, optionally within [start_day, end_day]."""
+    query = """
+        SELECT mission_day, mission_phase, centrifugal_habitat, symptoms, recommendations, logged_at
+        FROM medical_log
+        WHERE crew_name = ?
+    """
+    params = [crew_name]
+    if start_day is not None:
+        query += " AND mission_day >= ?"
+        params.append(start_day)
+    if end_day is not None:
+        query += " AND mission_day <= ?"
+        params.append(end_day)
+    query += " ORDER BY mission_day, id"
+
+    conn = connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [
+        {
+            'mission_day': day,
+            'mission_phase': phase,
+            'centrifugal_habitat': bool(habitat),
+            'symptoms': json.loads(symptoms),
+            'recommendations': json.loads(recommendations),
+            'logged_at': logged_at,
+        }
+        for day, phase, habitat, symptoms, recommendations, logged_at in rows
+    ]
+
+
+def get_medical_trends(crew_name=None, escalating_only=True, window=TREND_WINDOW_DAYS, db_path=MEDICAL_DB):
+    """
+    Current symptom trends, for one crew member or everyone. A trend whose last
+    report is more than window days before the crew member's latest logged day
+    is stale and no longer counts as escalating.
+    """
+    fields = ', '.join(f't.{field}' for field in TREND_FIELDS if field != 'escalating')
+    # 🕒 Latest day per crew member comes off the (crew_name, mission_day) index
+    query = f"""
+        SELECT t.crew_name, t.symptom, {fields},
+               t.escalating AND t.last_day >= latest.day - ? AS escalating
+        FROM medical_trends t
+        JOIN (
+            SELECT crew_name, MAX(mission_day) AS day FROM medical_log GROUP BY crew_name
+        ) latest ON latest.crew_name = t.crew_name
+    """
+    clauses, params = [], [window]
+    if crew_name is not None:
+        clauses.append("t.crew_name = ?")
+        params.append(crew_name)
+    if escalating_only:
+        clauses.append("t.escalating AND t.last_day >= latest.day - ?")
+        params.append(window)
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY t.crew_name, t.symptom"
+
+    conn = connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    conn.close()
+
+    trends = []
+    for crew, symptom, *values in rows:
+        trend = dict(zip(TREND_FIELDS, values))
+        trend['escalating'] = bool(trend['escalating'])
+        trends.append({'crew_name': crew, 'symptom': symptom, **trend})
+    return trends
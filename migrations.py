@@ -0,0 +1,329 @@
+# migrations.py
+"""
+Versioned schema for every SQLite database the app uses.
+
+Each database has a list of (version, statements) migrations and a
+schema_version table recording what has been applied. migrate() runs whatever
+is pending in one transaction. It runs once per database per process (see
+db_utils.connect), so the read/write helpers only issue DML.
+
+Version 1 is the schema the app used to create ad hoc with CREATE TABLE IF NOT
+EXISTS, so existing databases adopt it without changes. Every statement must be
+idempotent: reset_db replays them all after dropping and recreating tables.
+"""
+import os
+from datetime import datetime
+
+GAS_MASSES_DDL = """
+    CREATE TABLE IF NOT EXISTS gas_masses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        duration INTEGER,
+        crew_count INTEGER,
+        body_masses TEXT,
+        activity TEXT,
+        oxygen_tank_weight_per_kg REAL,
+        co2_generated REAL,
+        o2_required_kg REAL,
+        o2_reclaimed REAL,
+        o2_tank_mass REAL,
+        scrubber_mass REAL,
+        recycler_mass REAL,
+        total_gas_mass REAL,
+        use_scrubber BOOLEAN,
+        use_recycler BOOLEAN,
+        co2_scrubber_efficiency REAL,
+        scrubber_weight_per_kg REAL,
+        co2_recycler_efficiency REAL,
+        recycler_weight REAL,
+        within_limit BOOLEAN,
+        weight_limit REAL,
+
+        -- New fields
+        nitrogen_tank_weight_per_kg REAL,
+        n2_required_kg REAL,
+        n2_tank_mass REAL,
+        hygiene_water_per_day REAL,
+        water_hygiene_raw REAL,
+        water_excretion REAL,
+        water_recovered REAL,
+        water_net REAL,
+        use_water_recycler BOOLEAN,
+        water_recycler_efficiency REAL,
+        cumulative_meal_mass REAL,
+        combined_life_support_mass REAL,
+        'water_recycler_mass' REAL,
+        'total_life_support_mass' REAL,
+        base_weight_limit REAL
+    );
+"""
+
+# Running meal mass, overall (scope '*') and per crew member, kept in step with
+# daily_meals by triggers so dashboard reads are one primary-key lookup.
+# INSERT OR REPLACE does not fire DELETE triggers (recursive_triggers is off), so
+# the BEFORE INSERT trigger takes out the row being replaced itself. That assumes
+# daily_meals is written with INSERT / INSERT OR REPLACE, never OR IGNORE.
+# Dropping daily_meals takes its triggers with it, so clear it through
+# db_utils.reset_db: the replay below reseeds the totals from the empty table.
+MEAL_MASS_TOTALS_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS meal_mass_totals (
+        scope TEXT PRIMARY KEY,
+        total_grams REAL NOT NULL DEFAULT 0,
+        meals INTEGER NOT NULL DEFAULT 0
+    );
+    """,
+    "DELETE FROM meal_mass_totals;",
+    """
+    INSERT INTO meal_mass_totals (scope, total_grams, meals)
+    SELECT '*', COALESCE(SUM(food_grams + beverage_grams), 0), COUNT(*) FROM daily_meals
+    UNION ALL
+    SELECT crew_name, COALESCE(SUM(food_grams + beverage_grams), 0), COUNT(*)
+    FROM daily_meals GROUP BY crew_name;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS daily_meals_replace_mass
+    BEFORE INSERT ON daily_meals
+    BEGIN
+        UPDATE meal_mass_totals
+        SET total_grams = total_grams - COALESCE(replaced.grams, 0), meals = meals - 1
+        FROM (
+            SELECT food_grams + beverage_grams AS grams FROM daily_meals
+            WHERE crew_name = NEW.crew_name AND day = NEW.day AND meal = NEW.meal
+        ) AS replaced
+        WHERE scope IN ('*', NEW.crew_name);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS daily_meals_insert_mass
+    AFTER INSERT ON daily_meals
+    BEGIN
+        INSERT INTO meal_mass_totals (scope, total_grams, meals)
+        VALUES ('*', COALESCE(NEW.food_grams + NEW.beverage_grams, 0), 1),
+               (NEW.crew_name, COALESCE(NEW.food_grams + NEW.beverage_grams, 0), 1)
+        ON CONFLICT(scope) DO UPDATE SET
+            total_grams = total_grams + excluded.total_grams,
+            meals = meals + 1;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS daily_meals_delete_mass
+    AFTER DELETE ON daily_meals
+    BEGIN
+        UPDATE meal_mass_totals
+        SET total_grams = total_grams - COALESCE(OLD.food_grams + OLD.beverage_grams, 0), meals = meals - 1
+        WHERE scope IN ('*', OLD.crew_name);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS daily_meals_update_mass
+    AFTER UPDATE OF crew_name, food_grams, beverage_grams ON daily_meals
+    BEGIN
+        UPDATE meal_mass_totals
+        SET total_grams = total_grams - COALESCE(OLD.food_grams + OLD.beverage_grams, 0), meals = meals - 1
+        WHERE scope IN ('*', OLD.crew_name);
+        INSERT INTO meal_mass_totals (scope, total_grams, meals)
+        VALUES ('*', COALESCE(NEW.food_grams + NEW.beverage_grams, 0), 1),
+               (NEW.crew_name, COALESCE(NEW.food_grams + NEW.beverage_grams, 0), 1)
+        ON CONFLICT(scope) DO UPDATE SET
+            total_grams = total_grams + excluded.total_grams,
+            meals = meals + 1;
+    END;
+    """,
+]
+
+# Every diagnosis, one row per (crew, mission day) call. Rows are never changed:
+# trends are derived incrementally into medical_trends as entries arrive.
+MEDICAL_LOG_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS medical_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        crew_name TEXT NOT NULL,
+        mission_day INTEGER NOT NULL,
+        mission_phase TEXT,
+        centrifugal_habitat BOOLEAN,
+        symptoms TEXT NOT NULL,
+        recommendations TEXT NOT NULL,
+        logged_at TEXT
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_medical_log_crew_day ON medical_log (crew_name, mission_day);",
+    """
+    CREATE TRIGGER IF NOT EXISTS medical_log_no_update
+    BEFORE UPDATE ON medical_log
+    BEGIN
+        SELECT RAISE(ABORT, 'medical_log is append-only');
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS medical_log_no_delete
+    BEFORE DELETE ON medical_log
+    BEGIN
+        SELECT RAISE(ABORT, 'medical_log is append-only');
+    END;
+    """,
+    # Latest state of each (crew, symptom): the escalation run it is in, if any
+    """
+    CREATE TABLE IF NOT EXISTS medical_trends (
+        crew_name TEXT,
+        symptom TEXT,
+        since_day INTEGER,
+        since_severity TEXT,
+        last_day INTEGER,
+        last_severity TEXT,
+        escalating BOOLEAN,
+        PRIMARY KEY (crew_name, symptom)
+    );
+    """,
+]
+
+# Keyed by database file name
+MIGRATIONS = {
+    'astronauts.db': [
+        (1, [
+            """
+            CREATE TABLE IF NOT EXISTS crew (
+                name TEXT,
+                mass TEXT,
+                PRIMARY KEY (name)
+            );
+            """,
+        ]),
+    ],
+    'nutrition.db': [
+        (1, [
+            """
+            CREATE TABLE IF NOT EXISTS foods (
+                name TEXT PRIMARY KEY,
+                calories_per_gram REAL NOT NULL,
+                fat_per_gram REAL DEFAULT 0,
+                sugar_per_gram REAL DEFAULT 0,
+                protein_per_gram REAL DEFAULT 0
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS food_ratings (
+                crew_name TEXT,
+                food_name TEXT,
+                rating INTEGER,
+                PRIMARY KEY (crew_name, food_name)
+            );
+            """,
+        ]),
+        # Ratings keep the name as submitted, so the rating join compares lower() on
+        # both sides; these expression indexes let either side drive it
+        (2, ["CREATE INDEX IF NOT EXISTS idx_foods_lower_name ON foods (lower(name));"]),
+        (3, ["CREATE INDEX IF NOT EXISTS idx_food_ratings_crew_lower_name ON food_ratings (crew_name, lower(food_name));"]),
+    ],
+    'beverage.db': [
+        (1, [
+            """
+            CREATE TABLE IF NOT EXISTS beverages (
+                name TEXT PRIMARY KEY,
+                calories_per_gram REAL NOT NULL,
+                fat_per_gram REAL DEFAULT 0,
+                sugar_per_gram REAL DEFAULT 0,
+                protein_per_gram REAL DEFAULT 0
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS beverage_ratings (
+                crew_name TEXT,
+                beverage_name TEXT,
+                rating INTEGER,
+                PRIMARY KEY (crew_name, beverage_name)
+            );
+            """,
+        ]),
+        (2, ["CREATE INDEX IF NOT EXISTS idx_beverages_lower_name ON beverages (lower(name));"]),
+        (3, ["CREATE INDEX IF NOT EXISTS idx_beverage_ratings_crew_lower_name ON beverage_ratings (crew_name, lower(beverage_name));"]),
+    ],
+    'meal_schedule.db': [
+        (1, [
+            """
+            CREATE TABLE IF NOT EXISTS daily_meals (
+                crew_name TEXT,
+                day INTEGER,
+                meal INTEGER,
+                food_name TEXT,
+                food_grams REAL,
+                food_rating TEXT,
+                beverage_name TEXT,
+                beverage_grams REAL,
+                beverage_rating TEXT,
+                PRIMARY KEY (crew_name, day, meal)
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS crew_sufficiency (
+                crew_name TEXT PRIMARY KEY,
+                sufficiency_status TEXT,
+                intake_ratio REAL
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS plan_cache (
+                key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                created_at TEXT,
+                last_used REAL
+            );
+            """,
+        ]),
+        (2, MEAL_MASS_TOTALS_DDL),
+    ],
+    'medical.db': [
+        (1, MEDICAL_LOG_DDL),
+    ],
+    'gas_budget.db': [
+        (1, [GAS_MASSES_DDL]),
+        (2, ["CREATE INDEX IF NOT EXISTS idx_gas_masses_timestamp ON gas_masses (timestamp);"]),
+    ],
+}
+
+
+def schema_version(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            applied_at TEXT
+        );
+    """)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn, db_path, replay=False):
+    """
+    Apply the pending migrations for db_path on an open connection.
+    Returns the list of versions applied (empty if already current).
+    replay=True re-runs every migration already recorded as well, which restores
+    indexes, triggers and derived tables after tables are dropped and recreated.
+    """
+    migrations = MIGRATIONS.get(os.path.basename(db_path), [])
+    if not migrations:
+        return []
+
+    # IMMEDIATE takes the write lock up front, so two processes starting together
+    # don't both apply the same version; the DDL is rolled back with the rest.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        current = schema_version(conn)
+        pending = [(version, statements) for version, statements in migrations if version > current]
+        if replay:
+            for version, statements in migrations:
+                if version <= current:
+                    for statement in statements:
+                        conn.execute(statement)
+        for version, statements in pending:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (version, datetime.utcnow().isoformat())
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return [version for version, _ in pending]
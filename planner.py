@@ -2,7 +2,17 @@ import collections
 import collections.abc
 collections.Mapping = collections.abc.Mapping
 from experta import *
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import random
+import time
+from engine_pool import checkout_engine
+from log_config import get_logger
+
+log = get_logger('planner')
+
+PLANNER_BACKENDS = ('experta', 'direct')
+PLAN_MODES = ('estimate', 'solve', 'bisect')
 
 class PlannerConfig(Fact):
     """Holds planning constants like per_meal_kcal."""
@@ -39,8 +49,18 @@ class SelectedBeverage(Fact):
 
 
 class MealPlanner(KnowledgeEngine):
-    def __init__(self, name, calorie_target, food_list, beverage_list, start_day, food_ratings, beverage_ratings, duration, water_per_meal=250, ration_fraction=1.0):
+    def __init__(self, name, calorie_target, food_list, beverage_list, start_day, food_ratings, beverage_ratings, duration, water_per_meal=250, ration_fraction=1.0, backend='experta', seed=None):
         super().__init__()
+        self.configure(name, calorie_target, food_list, beverage_list, start_day, food_ratings, beverage_ratings, duration,
+                       water_per_meal=water_per_meal, ration_fraction=ration_fraction, backend=backend, seed=seed)
+
+    def configure(self, name, calorie_target, food_list, beverage_list, start_day, food_ratings, beverage_ratings, duration, water_per_meal=250, ration_fraction=1.0, backend='experta', seed=None):
+        """Set every per-plan attribute; a pooled planner is re-configured instead of rebuilt."""
+        if backend not in PLANNER_BACKENDS:
+            raise ValueError(f"Unknown planner backend '{backend}'. Choose one of {PLANNER_BACKENDS}.")
+        self.backend = backend
+        # Per-planner RNG: the same seed and inputs give the same schedule
+        self.rng = random.Random(seed)
         self.name = name
         self.start_day = start_day
         self.calorie_target = calorie_target
@@ -96,17 +116,20 @@ class MealPlanner(KnowledgeEngine):
                     b['rating'] = rating
                     self.beverages.append(b)
 
+        # name → calories_per_gram, built once for intake scoring
+        self.food_cpg = {f['food_name']: f['calories_per_gram'] for f in self.foods}
+        self.bev_cpg = {b['beverage_name']: b['calories_per_gram'] for b in self.beverages}
+
     def setup(self):
         self.reset()
 
         # 🔁 Force re-calculate per-meal target (defensive)
         self.per_meal_kcal = (self.calorie_target * self.ration_fraction) / self.meals_per_day
 
-        # Declare all slots
-        for i in range(self.duration):
-            day = self.start_day + i
-            for meal in range(1, self.meals_per_day + 1):
-                self.declare(MealSlot(day=day, meal=meal, crew_name=self.name))
+        # Open the first slot; finalize_meal (or skip_slot) opens each next one,
+        # so slots are filled in day/meal order against up-to-date history
+        if self.duration > 0:
+            self.declare(MealSlot(day=self.start_day, meal=1, crew_name=self.name))
 
         for food in self.foods:
             cpg = food['calories_per_gram']
@@ -130,15 +153,41 @@ class MealPlanner(KnowledgeEngine):
 
 
 
+    def reset(self, **kwargs):
+        # (fact type, day, meal) for every SelectedFood/SelectedBeverage in working memory
+        self.assigned_slots = set()
+        super().reset(**kwargs)
+
+    def declare(self, *facts):
+        declared = super().declare(*facts)
+        for f in facts:
+            if isinstance(f, (SelectedFood, SelectedBeverage)):
+                self.assigned_slots.add((type(f), f['day'], f['meal']))
+        return declared
+
+    def retract(self, idx_or_declared_fact):
+        fact = idx_or_declared_fact
+        if isinstance(fact, int):
+            fact = self.facts.get(fact)
+        super().retract(idx_or_declared_fact)
+        if isinstance(fact, (SelectedFood, SelectedBeverage)):
+            self.assigned_slots.discard((type(fact), fact['day'], fact['meal']))
+
+    def open_next_slot(self, day, meal):
+        """Declare the MealSlot after (day, meal), if the mission has one."""
+        if meal < self.meals_per_day:
+            day, meal = day, meal + 1
+        else:
+            day, meal = day + 1, 1
+        if day < self.start_day + self.duration:
+            self.declare(MealSlot(day=day, meal=meal, crew_name=self.name))
+
     def slot_already_assigned(self, fact_type, day, meal):
-        return any(
-            isinstance(f, fact_type) and f['day'] == day and f['meal'] == meal
-            for f in self.facts.values()
-        )
+        return (fact_type, day, meal) in self.assigned_slots
     
     def weighted_choice(self, candidates, weight_key):
         total = sum(f[weight_key] for f in candidates)
-        r = random.uniform(0, total)
+        r = self.rng.uniform(0, total)
         upto = 0
         for f in candidates:
             if upto + f[weight_key] >= r:
@@ -172,29 +221,42 @@ class MealPlanner(KnowledgeEngine):
             return False
         return True
 
+    # ⏱️ Only one MealSlot is open at a time: food (salience 3), then beverage (2),
+    # then finalize_meal (1) records it and opens the next slot, the same order
+    # run_direct uses. Every pick therefore sees the no-repeat history of all
+    # earlier meals. No rule joins MealHistory: finalize_meal modifies it once per
+    # meal, and a join would rebuild activations each time. The no-repeat state
+    # lives on self instead.
     @Rule(
         MealSlot(day=MATCH.day, meal=MATCH.meal, crew_name=MATCH.name),
-        AS.history << MealHistory(crew_name=MATCH.name, last_food=MATCH.last_food, last_bev=MATCH.last_bev),
         AS.food << FoodOption(
             food_name=MATCH.fname,
             calories_per_gram=MATCH.cpg,
             rating=MATCH.rating
         ),
-        TEST(lambda fname, last_food: last_food is None or fname != last_food),
-        salience=2
+        salience=3
     )
-    def assign_food(self, food, fname, cpg, rating, day, meal, name, last_food, last_bev):
+    def assign_food(self, food, fname, cpg, rating, day, meal, name):
         if self.slot_already_assigned(SelectedFood, day, meal):
             return
 
-        if not self.is_food_allowed(fname, day, meal):
+        # Sample among every allowed food, rating-weighted like assign_beverage
+        # (and run_direct); the matched FoodOption only triggers the choice.
+        candidates = [
+            f for f in self.foods
+            if self.is_food_allowed(f['food_name'], day, meal)
+        ]
+
+        if not candidates:
             return
 
+        chosen = self.weighted_choice(candidates, 'rating')
+        cpg = chosen['calories_per_gram']
         grams = round(self.per_meal_kcal / cpg, 2) if cpg > 0 else 0
 
-        self.last_food = fname
+        self.last_food = chosen['food_name']
         self.declare(SelectedFood(
-            food=fname,
+            food=chosen['food_name'],
             food_grams=grams,
             day=day,
             meal=meal
@@ -212,12 +274,10 @@ class MealPlanner(KnowledgeEngine):
 
     @Rule(
         MealSlot(day=MATCH.day, meal=MATCH.meal, crew_name=MATCH.name),
-        AS.history << MealHistory(crew_name=MATCH.name, last_food=MATCH.last_food, last_bev=MATCH.last_bev),
         AS.bev << BeverageOption(beverage_name=MATCH.bname, calories_per_gram=MATCH.cpb, rating=MATCH.rating),
-        TEST(lambda bname, last_bev: last_bev is None or bname != last_bev),
         salience=2
     )
-    def assign_beverage(self, bev, bname, cpb, rating, day, meal, name, last_food, last_bev):
+    def assign_beverage(self, bev, bname, cpb, rating, day, meal, name):
         if self.slot_already_assigned(SelectedBeverage, day, meal):
             return
 
@@ -246,11 +306,31 @@ class MealPlanner(KnowledgeEngine):
         AS.food_f << SelectedFood(day=MATCH.day, meal=MATCH.meal, food=MATCH.food, food_grams=MATCH.fg),
         AS.bev_f << SelectedBeverage(day=MATCH.day, meal=MATCH.meal, beverage=MATCH.bev, beverage_grams=MATCH.bg),
         AS.slot << MealSlot(day=MATCH.day, meal=MATCH.meal, crew_name=MATCH.name),
-        AS.history << MealHistory(crew_name=MATCH.name, last_food=MATCH.last_food, last_bev=MATCH.last_bev),
         salience=1
     )
-    def finalize_meal(self, food_f, bev_f, slot, day, meal, name, food, fg, bev, bg, history):
-        print(f"✅ Finalizing Day {day}, Meal {meal} for {name}: {food} + {bev}")
+    def finalize_meal(self, food_f, bev_f, slot, day, meal, name, food, fg, bev, bg):
+        log.debug("✅ Finalizing Day %s, Meal %s for %s: %s + %s", day, meal, name, food, bev)
+        self.record_meal(day, meal, food, fg, bev, bg)
+        self.meal_history_fact = self.modify(self.meal_history_fact, last_food=food, last_bev=bev)
+        self.declare(MealAssigned(crew_name=name, day=day, meal=meal))
+
+        self.retract(food_f)
+        self.retract(bev_f)
+        self.retract(slot)
+        self.open_next_slot(day, meal)
+
+    @Rule(
+        AS.slot << MealSlot(day=MATCH.day, meal=MATCH.meal, crew_name=MATCH.name),
+        salience=0
+    )
+    def skip_slot(self, slot, day, meal, name):
+        # 🚫 Nothing allowed for this slot (finalize_meal would have retracted it); move on
+        log.debug("⚠️ No allowed food/beverage for Day %s, Meal %s for %s", day, meal, name)
+        self.retract(slot)
+        self.open_next_slot(day, meal)
+        
+    def record_meal(self, day, meal, food, fg, bev, bg):
+        """Append a finalized meal and update the no-repeat history."""
         self.schedule.append({
             'day': day,
             'meal': meal,
@@ -259,8 +339,6 @@ class MealPlanner(KnowledgeEngine):
             'beverage': bev,
             'beverage_grams': bg
         })
-        self.modify(history, last_food=food, last_bev=bev)
-        self.declare(MealAssigned(crew_name=name, day=day, meal=meal))
 
         # Record for full schedule history
         self.history_by_slot[(day, meal)] = (food, bev)
@@ -271,26 +349,71 @@ class MealPlanner(KnowledgeEngine):
         if len(self.last_6_items) > 12:  # 6 meals × 2 items
             self.last_6_items = self.last_6_items[-12:]
 
-        self.retract(food_f)
-        self.retract(bev_f)
-        self.retract(slot)
-        
-    def plan_within_mass_budget(self, mass_budget):
+    def run_direct(self):
+        """
+        Fill every slot in day/meal order without building the Rete network.
+        Makes the same draws in the same order as the experta rules (food, then
+        beverage, then record, slot by slot), so a seed gives the same schedule on
+        either backend; this just skips the slots × (foods + beverages) activations.
+        """
+        # 🔁 Same defensive per-meal target as setup()
+        self.per_meal_kcal = (self.calorie_target * self.ration_fraction) / self.meals_per_day
+
+        for i in range(self.duration):
+            day = self.start_day + i
+            for meal in range(1, self.meals_per_day + 1):
+                food_candidates = [
+                    f for f in self.foods
+                    if self.is_food_allowed(f['food_name'], day, meal)
+                ]
+                if not food_candidates:
+                    continue
+
+                food = self.weighted_choice(food_candidates, 'rating')
+                cpg = food['calories_per_gram']
+                grams = round(self.per_meal_kcal / cpg, 2) if cpg > 0 else 0
+                self.last_food = food['food_name']
+
+                bev_candidates = [
+                    b for b in self.beverages
+                    if self.is_bev_allowed(b['beverage_name'], day, meal)
+                ]
+                if not bev_candidates:
+                    continue
+
+                bev = self.weighted_choice(bev_candidates, 'rating')
+                self.last_bev = bev['beverage_name']
+
+                self.record_meal(day, meal, food['food_name'], grams, bev['beverage_name'], self.water_per_meal)
+
+    def plan_within_mass_budget(self, mass_budget, seed=None, mode='estimate', tolerance=1e-3, max_iterations=30):
         """
         Estimate a safe ration_fraction using actual food and beverage densities,
         then plan meals once using that fraction. Enforces mass budget strictly.
+        Passing a seed reseeds the planner's RNG before planning.
+        mode='solve' hands off to solve_within_mass_budget and mode='bisect' to
+        bisect_within_mass_budget (which uses tolerance and max_iterations).
         """
+        if mode not in PLAN_MODES:
+            raise ValueError(f"Unknown plan mode '{mode}'. Choose one of {PLAN_MODES}.")
+        if seed is not None:
+            self.rng.seed(seed)
+        if mode == 'solve':
+            return self.solve_within_mass_budget(mass_budget)
+        if mode == 'bisect':
+            return self.bisect_within_mass_budget(mass_budget, tolerance, max_iterations)
+
         self.daily_target = self.original_target / self.duration  # kcal/day
         expected_meals = self.duration * self.meals_per_day
 
         # 🧠 Estimate average kcal/g for eligible foods and beverages
         avg_food_cpg = (
-            sum(f['calories_per_gram'] for f in self.foods) / len(self.foods)
-            if self.foods else 1.5
+            sum(self.food_cpg.values()) / len(self.food_cpg)
+            if self.food_cpg else 1.5
         )
         avg_bev_cpg = (
-            sum(b['calories_per_gram'] for b in self.beverages) / len(self.beverages)
-            if self.beverages else 0.4
+            sum(self.bev_cpg.values()) / len(self.bev_cpg)
+            if self.bev_cpg else 0.4
         )
 
         # 🔍 Estimate average grams per meal
@@ -324,29 +447,174 @@ class MealPlanner(KnowledgeEngine):
 
         return result
 
+    def solve_within_mass_budget(self, mass_budget, min_fraction=0.0):
+        """
+        Pick foods and gram amounts that maximize rating-weighted kcal while the
+        whole plan (food + beverages) stays within mass_budget kg.
+
+        Each slot takes the allowed food/beverage with the highest rating × kcal/g
+        under the usual no-repeat checks. Food grams are then allocated as a bounded
+        fractional knapsack: every meal gets min_fraction of its full ration, and the
+        rest of the budget goes to the meals with the best rating-weighted kcal per
+        gram, up to a full ration each. For a fixed assignment this greedy fill is
+        the exact LP optimum, so the plan fits the budget in one pass.
+        """
+        start = time.perf_counter()
+        self.daily_target = self.original_target / self.duration  # kcal/day
+        self.calorie_target = self.daily_target
+        self.per_meal_kcal = self.daily_target / self.meals_per_day
+        expected_meals = self.duration * self.meals_per_day
+        self.schedule.clear()
+
+        # 🍽️ Assign the best allowed item to every slot, in day/meal order
+        for i in range(self.duration):
+            day = self.start_day + i
+            for meal in range(1, self.meals_per_day + 1):
+                foods = [f for f in self.foods if self.is_food_allowed(f['food_name'], day, meal)]
+                bevs = [b for b in self.beverages if self.is_bev_allowed(b['beverage_name'], day, meal)]
+                if not foods or not bevs:
+                    continue
+
+                food = max(foods, key=lambda f: f['rating'] * f['calories_per_gram'])
+                bev = max(bevs, key=lambda b: b['rating'] * b['calories_per_gram'])
+                cpg = food['calories_per_gram']
+                full_grams = self.per_meal_kcal / cpg if cpg > 0 else 0
+
+                self.last_food = food['food_name']
+                self.last_bev = bev['beverage_name']
+                self.record_meal(day, meal, food['food_name'], full_grams, bev['beverage_name'], self.water_per_meal)
+
+        # 🎒 Bounded fractional knapsack over food grams
+        full = np.array([x['food_grams'] for x in self.schedule], dtype=float)
+        value = np.array([
+            self.food_cpg[x['food']] * self.food_ratings.get(x['food'].lower(), 0)
+            for x in self.schedule
+        ], dtype=float)
+        bev_total = sum(x['beverage_grams'] for x in self.schedule)
+        available = max(mass_budget * 1000.0 - bev_total, 0.0)
+
+        grams = np.minimum(full, full * min_fraction)
+        if grams.sum() > available:
+            grams *= available / grams.sum()
+        remaining = available - grams.sum()
+
+        order = np.argsort(-value, kind='stable')
+        room = (full - grams)[order]
+        already = np.cumsum(room) - room
+        grams[order] += np.clip(remaining - already, 0, room)
+
+        # Round down so rounding never pushes the plan over budget
+        grams = np.floor(grams * 100) / 100
+        for meal, g in zip(self.schedule, grams):
+            meal['food_grams'] = float(g)
+
+        result = self.summarize_schedule()
+        result['ration_fraction'] = round(float(grams.sum() / full.sum()), 3) if full.sum() > 0 else 0.0
+        result['solver'] = 'knapsack'
+        result['solve_time_ms'] = round((time.perf_counter() - start) * 1000, 3)
+
+        if len(result['schedule']) < expected_meals:
+            result['warning'] = "⚠️ Partial schedule generated — not all meals assigned."
+
+        if bev_total > mass_budget * 1000.0:
+            result['warning'] = f"⚠️ Beverages alone exceed budget: {round(bev_total / 1000.0, 2)} kg > {mass_budget} kg"
+
+        return result
+
+    def bisect_within_mass_budget(self, mass_budget, tolerance=1e-3, max_iterations=30):
+        """
+        Find the largest ration_fraction whose planned mass fits mass_budget kg.
+
+        Which food lands in which slot does not depend on the ration fraction, only
+        the grams do, so the planner runs once at a full ration and every bisection
+        step re-derives the rounded gram amounts for that same schedule and measures
+        its actual mass. Stops when the bracket is narrower than tolerance or after
+        max_iterations steps; 'iterations' in the result counts the mass evaluations.
+        """
+        self.daily_target = self.original_target / self.duration  # kcal/day
+        expected_meals = self.duration * self.meals_per_day
+
+        # 🧪 One planning pass at a full ration
+        self.ration_fraction = 1.0
+        self.calorie_target = self.daily_target
+        self.per_meal_kcal = self.calorie_target / self.meals_per_day
+        self.schedule.clear()
+        if self.backend == 'direct':
+            self.run_direct()
+        else:
+            self.setup()
+            self.run()
+
+        cpg = np.array([self.food_cpg.get(x['food'], 0) for x in self.schedule], dtype=float)
+        bev_total = sum(x['beverage_grams'] for x in self.schedule)
+        budget_grams = mass_budget * 1000.0
+
+        def grams_at(fraction):
+            per_meal = self.daily_target * fraction / self.meals_per_day
+            with np.errstate(divide='ignore'):
+                return np.where(cpg > 0, np.round(per_meal / cpg, 2), 0.0)
+
+        def fits(fraction):
+            return grams_at(fraction).sum() + bev_total <= budget_grams
+
+        # ✂️ Early exits, then bisect on the actual planned mass
+        iterations = 1
+        if fits(1.0):
+            fraction = 1.0
+        else:
+            iterations += 1
+            lo, hi = 0.0, 1.0
+            if not fits(lo):
+                hi = lo
+            while hi - lo > tolerance and iterations < max_iterations:
+                mid = (lo + hi) / 2
+                iterations += 1
+                if fits(mid):
+                    lo = mid
+                else:
+                    hi = mid
+            fraction = lo
+
+        for meal, g in zip(self.schedule, grams_at(fraction)):
+            meal['food_grams'] = float(g)
+
+        self.ration_fraction = fraction
+        self.calorie_target = self.daily_target * fraction
+        self.per_meal_kcal = self.calorie_target / self.meals_per_day
+
+        result = self.summarize_schedule()
+        result['ration_fraction'] = round(fraction, 3)
+        result['iterations'] = iterations
 
+        if len(result['schedule']) < expected_meals:
+            result['warning'] = "⚠️ Partial schedule generated — not all meals assigned."
 
+        if bev_total > budget_grams:
+            result['warning'] = f"⚠️ Beverages alone exceed budget: {round(bev_total / 1000.0, 2)} kg > {mass_budget} kg"
 
+        return result
 
     def run_planner(self):
-        self.setup()
-        self.run()
+        if self.backend == 'direct':
+            self.run_direct()
+        else:
+            self.setup()
+            self.run()
 
-        total_food_mass = round(sum(x['food_grams'] for x in self.schedule), 2)
-        total_bev_mass = round(sum(x['beverage_grams'] for x in self.schedule), 2)
+        return self.summarize_schedule()
 
-        # 🔁 Actual intake calculation
-        total_intake_kcal = 0.0
-        for meal in self.schedule:
-            food_name = meal['food']
-            food_grams = meal['food_grams']
-            bev_name = meal['beverage']
-            bev_grams = meal['beverage_grams']
+    def summarize_schedule(self):
+        """Masses, intake and sufficiency for the current schedule."""
+        food_grams = np.array([x['food_grams'] for x in self.schedule], dtype=float)
+        bev_grams = np.array([x['beverage_grams'] for x in self.schedule], dtype=float)
 
-            food_cpg = next((f['calories_per_gram'] for f in self.foods if f['food_name'] == food_name), 0)
-            bev_cpg = next((b['calories_per_gram'] for b in self.beverages if b['beverage_name'] == bev_name), 0)
+        total_food_mass = round(float(food_grams.sum()), 2)
+        total_bev_mass = round(float(bev_grams.sum()), 2)
 
-            total_intake_kcal += food_grams * food_cpg + bev_grams * bev_cpg
+        # 🔁 Actual intake calculation
+        food_cpg = np.array([self.food_cpg.get(x['food'], 0) for x in self.schedule], dtype=float)
+        bev_cpg = np.array([self.bev_cpg.get(x['beverage'], 0) for x in self.schedule], dtype=float)
+        total_intake_kcal = float(food_grams @ food_cpg + bev_grams @ bev_cpg)
 
         # ✅ Use original calorie target to define sufficiency
         intake_ratio = total_intake_kcal / self.original_target if self.original_target > 0 else 0
@@ -370,3 +638,49 @@ class MealPlanner(KnowledgeEngine):
             'sufficiency_status': sufficiency
         }
 
+
+def plan_meal_chunk(task):
+    """
+    Plan one crew member's block of days from a picklable task dict and return
+    the planner result with its schedule converted to daily_meals rows.
+    Module-level so it can run in a worker process.
+    """
+    seed = task.get('seed')
+    if seed is not None:
+        seed = f"{seed}:{task['name']}:{task['start_day']}"
+
+    with checkout_engine(
+        MealPlanner,
+        name=task['name'],
+        calorie_target=task['calorie_target'],
+        food_list=[dict(f) for f in task['food_list']],
+        beverage_list=[dict(b) for b in task['beverage_list']],
+        food_ratings=task['food_ratings'],
+        beverage_ratings=task['beverage_ratings'],
+        duration=task['duration'],
+        start_day=task['start_day'],
+        backend=task.get('backend', 'experta'),
+        seed=seed
+    ) as planner:
+        result = planner.plan_within_mass_budget(task['mass_budget'], mode=task.get('mode', 'estimate'))
+
+        for meal in result['schedule']:
+            meal['crew_name'] = planner.name
+            meal['food_name'] = meal.pop('food')
+            meal['beverage_name'] = meal.pop('beverage')
+            meal['food_rating'] = planner.food_ratings.get(meal['food_name'].lower(), '–')
+            meal['beverage_rating'] = planner.beverage_ratings.get(meal['beverage_name'].lower(), '–')
+
+    return result
+
+
+def plan_meal_chunks(tasks, max_workers=0):
+    """
+    Run plan_meal_chunk over every task and return the results in task order.
+    Chunks share no state, so with max_workers > 1 they are fanned out to a
+    process pool; otherwise they run in-process one after another.
+    """
+    if max_workers and max_workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(plan_meal_chunk, tasks))
+    return [plan_meal_chunk(task) for task in tasks]
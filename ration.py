@@ -0,0 +1,95 @@
+# ration.py
+"""
+Vectorized rationing of the meal schedule.
+
+Every crew member's food grams are scaled by one ratio so their food plus
+beverage mass fits an equal share of the remaining mass budget. Beverages are
+left alone. The scaled kcal then gives each crew member's sufficiency status.
+Everything is column operations on the daily_meals frame: one groupby for the
+per-crew totals, mapped calorie densities, no per-row Python.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from log_config import get_logger
+
+log = get_logger('ration')
+
+WATER_MASS_PER_DAY = 3 * 250 / 1000  # 750g
+MIN_DAILY_KCAL = 1200  # 400×3
+
+
+def calorie_density_map(catalog):
+    """Lower-cased, stripped name → calories_per_gram (last duplicate wins, like a dict)."""
+    names = catalog['name'].astype(str).str.strip().str.lower()
+    return dict(zip(names, catalog['calories_per_gram']))
+
+
+def sufficiency_status(intake_ratio):
+    return np.select(
+        [intake_ratio < 0.85, intake_ratio < 0.95],
+        ['insufficient', 'moderate'],
+        default='sufficient'
+    )
+
+
+def ration_schedule(meals, food_df, beverage_df, crew_mass_map, total_budget):
+    """
+    Scale food grams in a daily_meals frame to fit total_budget (kg).
+    Returns the rationed frame (same rows and columns) and the sufficiency map
+    {crew_name: {'status', 'intake_ratio'}} for insert into crew_sufficiency.
+    """
+    food_cpg_map = calorie_density_map(food_df)
+    bev_cpg_map = calorie_density_map(beverage_df)
+    rationed = meals.copy()
+    if rationed.empty:
+        return rationed, {}
+
+    crew = rationed.groupby('crew_name', sort=False).agg(
+        food_mass=('food_grams', 'sum'),
+        bev_mass=('beverage_grams', 'sum'),
+        days=('day', 'nunique'),
+    )
+    per_crew_budget = total_budget / len(crew)
+
+    # 🔍 One scaling ratio per crew member; nothing to scale without food
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = (per_crew_budget - crew['bev_mass'] / 1000.0) / (crew['food_mass'] / 1000.0)
+    crew['scaling_ratio'] = np.where(crew['food_mass'] > 0, np.minimum(1.0, ratio), 1.0)
+
+    rationed['food_grams'] = (
+        rationed['food_grams'] * rationed['crew_name'].map(crew['scaling_ratio'])
+    ).round(2)
+    food_cpg = (
+        rationed['food_name'].astype(str).str.strip().str.lower()
+        .map(food_cpg_map).fillna(0).astype(float)
+    )
+    crew['scaled_kcal'] = (rationed['food_grams'] * food_cpg).groupby(rationed['crew_name'], sort=False).sum()
+
+    # 🔁 Sufficiency against the same kcal target /meal_log plans for
+    avg_food_cpg = sum(food_cpg_map.values()) / len(food_cpg_map) if food_cpg_map else 1.5
+    avg_bev_cpg = sum(bev_cpg_map.values()) / len(bev_cpg_map) if bev_cpg_map else 0.5
+    avg_kcal_per_gram = (avg_food_cpg + avg_bev_cpg) / 2
+    food_mass_limit = max(per_crew_budget - WATER_MASS_PER_DAY, 0.01)
+    estimated_max_kcal = food_mass_limit * avg_kcal_per_gram
+
+    body_mass = pd.Series([float(crew_mass_map[name]) for name in crew.index], index=crew.index)
+    adjusted_target = np.maximum(np.minimum(body_mass * 40, estimated_max_kcal), MIN_DAILY_KCAL)
+    target_kcal = adjusted_target * crew['days']
+    crew['intake_ratio'] = np.where(target_kcal > 0, crew['scaled_kcal'] / target_kcal, 0.0)
+    crew['status'] = sufficiency_status(crew['intake_ratio'].to_numpy())
+
+    if log.isEnabledFor(logging.DEBUG):
+        for name, row in crew.iterrows():
+            log.debug("📊 %s — Food Mass: %.1fg, Bev Mass: %.1fg, Budget: %.2fkg, Scaling Ratio: %.3f "
+                      "| intake = %.1f kcal | ratio = %.3f → %s",
+                      name, row['food_mass'], row['bev_mass'], per_crew_budget, row['scaling_ratio'],
+                      row['scaled_kcal'], row['intake_ratio'], row['status'])
+
+    sufficiency_map = {
+        name: {'status': status, 'intake_ratio': round(float(intake_ratio), 3)}
+        for name, status, intake_ratio in zip(crew.index, crew['status'], crew['intake_ratio'])
+    }
+    return rationed, sufficiency_map
@@ -0,0 +1,217 @@
+# rule_packs.py
+"""
+Data-driven medical rules.
+
+A rule pack is a JSON or TOML file with a list of rules:
+
+    {"rules": [
+        {"symptom": "nosebleed", "severity": "mild", "recommendation": "🩸 ..."},
+        {"symptoms": ["dizziness", "motion_sickness"], "centrifugal_habitat": true, "recommendation": "🌀 ..."},
+        {"mission_phase": "late", "centrifugal_habitat": false, "recommendation": "🕒 ..."}
+    ]}
+
+or in TOML, one [[rules]] table per rule. Conditions are ANDed. A list value
+means any of its entries. A condition left out matches anything: a symptom
+rule without a severity fires for every severity.
+
+compile_rules() indexes the rules by symptom and then severity, and the
+phase-only rules by mission phase. A diagnosis costs one dict lookup per
+reported symptom however many rules there are. RuleBook watches the pack
+file's mtime and swaps in a freshly compiled matcher. Diagnoses already
+running keep the matcher they started with. Replace pack files by writing a
+temp file and renaming it over the old one; a half-written file fails to parse
+and is skipped until the next change.
+"""
+import json
+import os
+import threading
+import time
+
+try:
+    import tomllib  # Python 3.11+
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+from log_config import get_logger
+
+log = get_logger('medical')
+
+RULE_FIELDS = ('symptom', 'symptoms', 'severity', 'mission_phase', 'centrifugal_habitat', 'recommendation')
+# How often a RuleBook stats its pack file
+RULE_PACK_CHECK_SECONDS = float(os.getenv('MEDICAL_RULES_CHECK_SECONDS', '1.0'))
+
+
+def load_rule_pack(path):
+    """Read the rule list from a .json or .toml pack file."""
+    if path.endswith('.toml'):
+        if tomllib is None:
+            raise ValueError("❌ TOML rule packs need Python 3.11+ or the tomli package.")
+        with open(path, 'rb') as f:
+            pack = tomllib.load(f)
+    else:
+        with open(path, encoding='utf-8') as f:
+            pack = json.load(f)
+    rules = pack.get('rules') if isinstance(pack, dict) else pack
+    if not isinstance(rules, list):
+        raise ValueError(f"❌ Rule pack {path} must hold a list of rules.")
+    return rules
+
+
+def _as_tuple(rule, i, key):
+    value = rule.get(key)
+    if value is None:
+        return None
+    values = value if isinstance(value, list) else [value]
+    if not values or not all(isinstance(v, str) for v in values):
+        raise ValueError(f"❌ Rule {i}: {key} must be a string or a list of strings.")
+    return tuple(values)
+
+
+class CompiledRules:
+    """Immutable matcher built from a list of rule dicts; see the module docstring."""
+
+    def __init__(self, rules):
+        by_symptom = {}   # symptom -> {severity or None: [(text, phases, habitat)]}
+        by_phase = {}     # phase or None -> [(text, habitat)]
+        severities = {}
+
+        for i, rule in enumerate(rules):
+            if not isinstance(rule, dict):
+                raise ValueError(f"❌ Rule {i} must be an object.")
+            unknown = set(rule) - set(RULE_FIELDS)
+            if unknown:
+                raise ValueError(f"❌ Rule {i}: unknown fields {sorted(unknown)}.")
+            text = rule.get('recommendation')
+            if not isinstance(text, str) or not text:
+                raise ValueError(f"❌ Rule {i}: recommendation must be a non-empty string.")
+            habitat = rule.get('centrifugal_habitat')
+            if habitat is not None and not isinstance(habitat, bool):
+                raise ValueError(f"❌ Rule {i}: centrifugal_habitat must be true or false.")
+
+            symptoms = _as_tuple(rule, i, 'symptom') or _as_tuple(rule, i, 'symptoms')
+            rule_severities = _as_tuple(rule, i, 'severity')
+            phases = _as_tuple(rule, i, 'mission_phase')
+            if symptoms is None and rule_severities is not None:
+                raise ValueError(f"❌ Rule {i}: severity needs a symptom.")
+            if symptoms is None and phases is None and habitat is None:
+                raise ValueError(f"❌ Rule {i} has no conditions.")
+
+            if symptoms is None:
+                for phase in phases or (None,):
+                    by_phase.setdefault(phase, []).append((text, habitat))
+                continue
+            for symptom in symptoms:
+                for severity in rule_severities or (None,):
+                    by_symptom.setdefault(symptom, {}).setdefault(severity, []).append((text, phases, habitat))
+                    if severity is not None:
+                        severities[severity] = None
+
+        # Tuples so a published matcher can't be changed under a running diagnosis
+        self.by_symptom = {
+            symptom: {severity: tuple(matches) for severity, matches in by_severity.items()}
+            for symptom, by_severity in by_symptom.items()
+        }
+        self.by_phase = {phase: tuple(matches) for phase, matches in by_phase.items()}
+        self.symptoms = tuple(self.by_symptom)
+        self.severities = tuple(severities)
+        self.rule_count = len(rules)
+
+    def diagnose(self, symptoms, mission_phase=None, centrifugal_habitat=False):
+        """Recommendations for the reported symptoms, in input order, then the phase rules."""
+        results = {}
+        for entry in symptoms:
+            by_severity = self.by_symptom.get(entry['symptom'])
+            if not by_severity:
+                continue
+            for severity in (entry['severity'], None):
+                for text, phases, habitat in by_severity.get(severity, ()):
+                    if (phases is None or mission_phase in phases) and (habitat is None or habitat == centrifugal_habitat):
+                        results[text] = None
+
+        for phase in (mission_phase, None):
+            for text, habitat in self.by_phase.get(phase, ()):
+                if habitat is None or habitat == centrifugal_habitat:
+                    results[text] = None
+        return list(results)
+
+
+def compile_rules(rules):
+    return CompiledRules(rules)
+
+
+class RuleBook:
+    """
+    The active matcher: base_rules plus the rules in the pack at path (if any).
+    current() returns the published matcher after at most one mtime check per
+    RULE_PACK_CHECK_SECONDS. When the file has changed, one caller recompiles
+    and swaps the reference; everyone else keeps using the old matcher meanwhile.
+    A pack that fails to load is logged and the previous matcher stays in use.
+    """
+
+    def __init__(self, path=None, base_rules=(), check_seconds=RULE_PACK_CHECK_SECONDS):
+        self.path = path
+        self.base_rules = list(base_rules)
+        self.check_seconds = check_seconds
+        self.lock = threading.Lock()
+        self.signature = None
+        self.next_check = 0.0
+        self.error = None
+        self.matcher = compile_rules(self.base_rules)
+        if path:
+            self.reload()
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload(self):
+        """Recompile if the pack file changed since the last load. Returns True if swapped."""
+        if not self.lock.acquire(blocking=False):
+            return False  # another thread is already reloading
+        try:
+            signature = self._file_signature()
+            if signature == self.signature:
+                return False
+            self.signature = signature
+
+            pack_rules = []
+            if signature is not None:
+                try:
+                    pack_rules = load_rule_pack(self.path)
+                    matcher = compile_rules(self.base_rules + pack_rules)
+                except (OSError, ValueError) as e:
+                    self.error = str(e)
+                    log.warning("⚠️ Keeping the current medical rules; %s failed to load: %s", self.path, e)
+                    return False
+            else:
+                matcher = compile_rules(self.base_rules)
+
+            self.matcher = matcher
+            self.error = None
+            log.info("📚 Loaded %d medical rules (%d from %s)", matcher.rule_count, len(pack_rules), self.path)
+            return True
+        finally:
+            self.lock.release()
+
+    def current(self):
+        if self.path:
+            now = time.monotonic()
+            if now >= self.next_check:
+                self.next_check = now + self.check_seconds
+                self.reload()
+        return self.matcher
+
+    def status(self):
+        matcher = self.matcher
+        return {
+            'path': self.path,
+            'rule_count': matcher.rule_count,
+            'symptoms': len(matcher.symptoms),
+            'error': self.error,
+        }
@@ -0,0 +1,11 @@
+# tests/catalog.py
+"""Synthetic food/beverage catalogs for planner tests."""
+
+
+def synthetic_catalog(n_foods=12, n_beverages=8):
+    """Food/beverage lists and ratings shaped like the nutrition.db rows."""
+    foods = [{'name': f'food_{i}', 'calories_per_gram': 1.0 + (i % 10) * 0.25} for i in range(n_foods)]
+    beverages = [{'name': f'bev_{i}', 'calories_per_gram': 0.1 + (i % 5) * 0.1} for i in range(n_beverages)]
+    food_ratings = {f['name']: 2 + i % 4 for i, f in enumerate(foods)}
+    beverage_ratings = {b['name']: 2 + i % 4 for i, b in enumerate(beverages)}
+    return foods, beverages, food_ratings, beverage_ratings
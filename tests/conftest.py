@@ -0,0 +1,27 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('OPENAI_API_KEY', 'test')  # app.py builds an OpenAI client at import
+
+
+def _forget_databases():
+    import db_utils
+    db_utils.flush_gas_budget_writes()
+    db_utils.close_all_pools()
+    db_utils._pools.clear()
+    db_utils._migrated.clear()
+    db_utils._gas_writers.clear()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory so every relative *.db path starts fresh."""
+    _forget_databases()
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    _forget_databases()
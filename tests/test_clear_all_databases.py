@@ -0,0 +1,46 @@
+# tests/test_clear_all_databases.py
+from db_utils import connect
+
+
+def table_schema(db_path, table):
+    conn = connect(db_path)
+    columns = [(name, col_type, pk) for _, name, col_type, _, _, pk in conn.execute(f"PRAGMA table_info({table})")]
+    conn.close()
+    return columns
+
+
+def test_ratings_work_after_clearing_all_databases(workdir):
+    import app
+
+    client = app.app.test_client()
+    expected = {
+        ('nutrition.db', 'food_ratings'): table_schema('nutrition.db', 'food_ratings'),
+        ('beverage.db', 'beverage_ratings'): table_schema('beverage.db', 'beverage_ratings'),
+        ('astronauts.db', 'crew'): table_schema('astronauts.db', 'crew'),
+    }
+    assert client.post('/rate_food', data={'crew_name': 'Ana', 'food_name': 'Oats', 'rating': '3'}).status_code == 302
+
+    assert client.post('/clear_all_databases').status_code == 302
+
+    # Same schema as a fresh migration, including the ratings primary keys
+    for (db_path, table), columns in expected.items():
+        assert table_schema(db_path, table) == columns
+
+    for rating in ('4', '5'):
+        response = client.post('/rate_food', data={'crew_name': 'Ana', 'food_name': 'Oats', 'rating': rating})
+        assert response.status_code == 302
+    assert client.post('/rate_beverage', data={'crew_name': 'Ana', 'beverage_name': 'Tea', 'rating': '4'}).status_code == 302
+
+    conn = connect('nutrition.db')
+    assert conn.execute("SELECT crew_name, food_name, rating FROM food_ratings").fetchall() == [('Ana', 'Oats', 5)]
+    conn.close()
+
+
+def test_clear_all_databases_keeps_migrated_indexes(workdir):
+    import app
+
+    app.app.test_client().post('/clear_all_databases')
+    conn = connect('nutrition.db')
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(food_ratings)")}
+    conn.close()
+    assert 'idx_food_ratings_crew_lower_name' in indexes
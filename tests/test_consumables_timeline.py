@@ -0,0 +1,63 @@
+# tests/test_consumables_timeline.py
+from datetime import datetime
+
+import pytest
+
+from db_utils import connect
+
+GAS_RECORD = {
+    'duration': 30, 'crew_count': 2, 'body_masses': '70,80', 'activity': 'moderate',
+    'oxygen_tank_weight_per_kg': 1.5, 'weight_limit': 2000, 'base_weight_limit': 2000,
+    'use_scrubber': 1, 'use_recycler': 0, 'co2_scrubber_efficiency': 0.9,
+    'scrubber_weight_per_kg': 1.2, 'co2_recycler_efficiency': 0, 'recycler_weight': 0,
+    'nitrogen_tank_weight_per_kg': 1.5, 'hygiene_water_per_day': 2.0,
+    'use_water_recycler': 0, 'water_recycler_efficiency': 0, 'water_recycler_mass': 0,
+    'total_gas_mass': 300,
+}
+
+
+@pytest.fixture
+def client(workdir):
+    import app
+
+    conn = connect('gas_budget.db')
+    columns = ['timestamp', *GAS_RECORD]
+    conn.execute(
+        f"INSERT INTO gas_masses ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})",
+        (datetime.utcnow().isoformat(), *GAS_RECORD.values())
+    )
+    conn.commit()
+    conn.close()
+    return app.app.test_client()
+
+
+def test_timeline_is_not_written_unless_asked(client, workdir):
+    body = client.get('/consumables_timeline').get_json()
+    assert body['duration'] == 30
+    assert 'saved_to' not in body
+    assert not list(workdir.glob('*.npz'))
+
+
+def test_timeline_saves_to_configured_path(client, workdir, monkeypatch):
+    import app
+
+    path = str(workdir / 'timelines' / 'latest.npz')
+    (workdir / 'timelines').mkdir()
+    monkeypatch.setattr(app, 'CONSUMABLES_TIMELINE_PATH', path)
+
+    body = client.get('/consumables_timeline?save=1').get_json()
+    assert body['saved_to'] == path
+    assert (workdir / 'timelines' / 'latest.npz').exists()
+
+
+def test_timeline_uses_stocks_from_request(client):
+    provisioned = client.get('/consumables_timeline').get_json()
+    assert provisioned['stocks'] == {}
+    assert provisioned['margins']['o2_tank_kg']['first_negative_day'] is None
+
+    short = client.get('/consumables_timeline?o2_tank_kg=1&water_tank_kg=1000').get_json()
+    assert short['stocks'] == {'o2_tank_kg': 1.0, 'water_tank_kg': 1000.0}
+    assert short['margins']['o2_tank_kg']['first_negative_day'] is not None
+    assert short['margins']['water_tank_kg']['final'] > provisioned['margins']['water_tank_kg']['final']
+
+    assert client.get('/consumables_timeline?o2_tank_kg=lots').status_code == 400
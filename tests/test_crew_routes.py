@@ -0,0 +1,19 @@
+# tests/test_crew_routes.py
+from db_utils import connect, fetch_all_records
+
+
+def test_clear_crew_empties_the_roster(workdir):
+    import app
+
+    conn = connect('astronauts.db')
+    conn.executemany("INSERT INTO crew (name, mass) VALUES (?, ?)", [('Ana', '60'), ('Ben', '80')])
+    conn.commit()
+    conn.close()
+
+    client = app.app.test_client()
+    assert client.post('/clear_crew').status_code == 302
+    assert fetch_all_records('astronauts.db', 'crew').empty
+
+    # The pooled connection is still usable afterwards
+    assert client.post('/add_or_edit_crew', data={'name': 'Cy', 'mass': '72'}).status_code == 302
+    assert fetch_all_records('astronauts.db', 'crew')['name'].tolist() == ['Cy']
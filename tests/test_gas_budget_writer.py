@@ -0,0 +1,49 @@
+# tests/test_gas_budget_writer.py
+import pytest
+
+from db_utils import GasBudgetWriter, connect, flush_gas_budget_writes, queue_gas_budget, reset_db
+
+
+def budget(i, **extra):
+    return {'timestamp': f'2026-01-01T00:00:{i:02d}', 'base_weight_limit': 1000.0, 'total_gas_mass': 10.0 + i, **extra}
+
+
+def stored_timestamps(db_path='gas_budget.db'):
+    conn = connect(db_path)
+    rows = [row[0] for row in conn.execute("SELECT timestamp FROM gas_masses ORDER BY timestamp")]
+    conn.close()
+    return rows
+
+
+def test_bad_row_does_not_drop_its_batch(workdir):
+    writer = GasBudgetWriter('gas_budget.db')
+    conn = connect('gas_budget.db')
+    writer._write_batch(conn, [budget(1), budget(2, no_such_column=1), budget(3)])
+    conn.close()
+
+    assert stored_timestamps() == [budget(1)['timestamp'], budget(3)['timestamp']]
+    with pytest.raises(ValueError, match="1 gas budget row"):
+        writer.flush()
+
+    # Reported once; later writes flush cleanly
+    writer.put(budget(4))
+    writer.flush()
+    assert len(stored_timestamps()) == 3
+
+
+def test_failures_surface_at_next_flush(workdir):
+    queue_gas_budget('gas_budget.db', budget(1))
+    queue_gas_budget('gas_budget.db', budget(2, no_such_column=1))
+
+    with pytest.raises(ValueError, match="could not be written"):
+        flush_gas_budget_writes()
+    flush_gas_budget_writes()
+    assert stored_timestamps() == [budget(1)['timestamp']]
+
+
+def test_reset_discards_pending_failures(workdir):
+    queue_gas_budget('gas_budget.db', budget(1, no_such_column=1))
+
+    reset_db('gas_budget.db', ["DELETE FROM gas_masses;"])
+    flush_gas_budget_writes()
+    assert stored_timestamps() == []
@@ -0,0 +1,66 @@
+# tests/test_meal_calendar.py
+from datetime import datetime
+
+from db_utils import connect
+
+
+def seed_mission():
+    conn = connect('astronauts.db')
+    conn.executemany("INSERT INTO crew (name, mass) VALUES (?, ?)", [('Ana', '60'), ('Ben', '80')])
+    conn.commit()
+    conn.close()
+
+    for db_path, catalog, ratings, item, rows in (
+        # Enough of each that the no-repeat rules can fill every slot
+        ('nutrition.db', 'foods', 'food_ratings', 'food_name',
+         [('Oats', 3.8), ('Rice', 3.6), ('Lentils', 3.5), ('Pasta', 3.7),
+          ('Granola', 4.5), ('Couscous', 3.6), ('Dried Mango', 3.2), ('Almonds', 5.8)]),
+        ('beverage.db', 'beverages', 'beverage_ratings', 'beverage_name',
+         [('Tea', 0.1), ('Cocoa', 0.8), ('Coffee', 0.1), ('Orange Drink', 0.4),
+          ('Lemonade', 0.4), ('Apple Cider', 0.5), ('Milk', 0.6), ('Broth', 0.2)]),
+    ):
+        conn = connect(db_path)
+        conn.executemany(f"INSERT INTO {catalog} (name, calories_per_gram) VALUES (?, ?)", rows)
+        conn.executemany(f"INSERT INTO {ratings} (crew_name, {item}, rating) VALUES (?, ?, ?)", [
+            (crew, name, 4) for crew in ('Ana', 'Ben') for name, _ in rows
+        ])
+        conn.commit()
+        conn.close()
+
+    conn = connect('gas_budget.db')
+    conn.execute(
+        "INSERT INTO gas_masses (timestamp, base_weight_limit, total_gas_mass) VALUES (?, ?, ?)",
+        (datetime.utcnow().isoformat(), 100.0, 20.0)
+    )
+    conn.commit()
+    conn.close()
+
+
+def stored_meals():
+    conn = connect('meal_schedule.db')
+    rows = conn.execute(
+        "SELECT crew_name, day, meal, food_name, beverage_name FROM daily_meals ORDER BY crew_name, day, meal"
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def test_cached_calendar_restores_daily_meals(workdir, monkeypatch):
+    import app
+
+    seed_mission()
+    client = app.app.test_client()
+    assert client.get('/meal_calendar?seed=3').status_code == 200
+    planned = stored_meals()
+    assert len(planned) == 2 * 7 * 3
+
+    assert client.post('/clear_meals').status_code == 302
+    assert stored_meals() == []
+
+    # The second view must come from the cache, not a new planning run
+    def no_planning(*args, **kwargs):
+        raise AssertionError("meal_calendar re-planned instead of using the cache")
+    monkeypatch.setattr(app, 'checkout_engine', no_planning)
+
+    assert client.get('/meal_calendar?seed=3').status_code == 200
+    assert stored_meals() == planned
@@ -0,0 +1,69 @@
+# tests/test_meal_mass_totals.py
+import pytest
+
+from db_utils import connect, get_cumulative_meal_mass, insert_daily_meals, reset_db
+
+
+def meal(crew, day, meal_no, food_grams, beverage_grams=250.0):
+    return {
+        'crew_name': crew, 'day': day, 'meal': meal_no,
+        'food_name': 'Oats', 'food_grams': food_grams, 'food_rating': '3',
+        'beverage_name': 'Tea', 'beverage_grams': beverage_grams, 'beverage_rating': '3',
+    }
+
+
+def summed_kg(crew=None):
+    conn = connect('meal_schedule.db')
+    query = "SELECT COALESCE(SUM(food_grams + beverage_grams), 0) FROM daily_meals"
+    params = ()
+    if crew:
+        query += " WHERE crew_name = ?"
+        params = (crew,)
+    total = conn.execute(query, params).fetchone()[0]
+    conn.close()
+    return round(total / 1000.0, 2)
+
+
+def test_totals_follow_inserts_replaces_updates_and_deletes(workdir):
+    insert_daily_meals('meal_schedule.db', [meal('Ana', 1, 1, 300), meal('Ana', 1, 2, 400), meal('Ben', 1, 1, 500)], {})
+    assert get_cumulative_meal_mass() == summed_kg() == 1.95
+    assert get_cumulative_meal_mass(crew_name='Ana') == summed_kg('Ana')
+
+    # INSERT OR REPLACE of an existing slot
+    insert_daily_meals('meal_schedule.db', [meal('Ana', 1, 1, 100)], {})
+    assert get_cumulative_meal_mass() == summed_kg() == 1.75
+
+    conn = connect('meal_schedule.db')
+    conn.execute("UPDATE daily_meals SET food_grams = food_grams / 2")
+    conn.execute("DELETE FROM daily_meals WHERE crew_name = 'Ben'")
+    conn.commit()
+    conn.close()
+    assert get_cumulative_meal_mass() == summed_kg()
+    assert get_cumulative_meal_mass(crew_name='Ben') == 0.0
+
+
+@pytest.mark.parametrize('commands', [
+    ["DROP TABLE IF EXISTS daily_meals;", "DROP TABLE IF EXISTS crew_sufficiency;"],
+    ["DELETE FROM daily_meals;"],
+])
+def test_clearing_meals_resets_total(workdir, commands):
+    insert_daily_meals('meal_schedule.db', [meal('Ana', d, 1, 800) for d in range(1, 31)], {})
+    assert get_cumulative_meal_mass() > 0
+
+    reset_db('meal_schedule.db', commands)
+    assert get_cumulative_meal_mass() == 0.0
+    assert get_cumulative_meal_mass(crew_name='Ana') == 0.0
+
+    # The triggers are back after the reset
+    insert_daily_meals('meal_schedule.db', [meal('Ana', 1, 1, 750)], {})
+    assert get_cumulative_meal_mass() == 1.0
+
+
+def test_clear_meals_route_resets_total(workdir):
+    import app
+
+    insert_daily_meals('meal_schedule.db', [meal('Ana', d, 1, 800) for d in range(1, 31)], {})
+    client = app.app.test_client()
+    assert client.post('/clear_meals').status_code == 302
+    assert get_cumulative_meal_mass() == 0.0
+    assert summed_kg() == 0.0
@@ -0,0 +1,48 @@
+# tests/test_meal_preferences.py
+from db_utils import connect, connect_unified, get_crew_meal_preferences
+from planner import MealPlanner
+
+
+def seed(db_path, catalog, ratings, item, rows, rated):
+    conn = connect(db_path)
+    conn.executemany(f"INSERT INTO {catalog} (name, calories_per_gram) VALUES (?, ?)", rows)
+    conn.executemany(f"INSERT INTO {ratings} (crew_name, {item}, rating) VALUES (?, ?, ?)", rated)
+    conn.commit()
+    conn.close()
+
+
+def test_ratings_match_catalog_regardless_of_case(workdir):
+    # Ratings keep the case they were submitted in, like the /rate_* forms store them
+    seed('nutrition.db', 'foods', 'food_ratings', 'food_name',
+         [('Oats', 2.0), ('Dried Mango', 3.0), ('Spinach', 0.5)],
+         [('Ana', 'Oats', 3), ('Ana', 'dried mango', 4), ('Ana', 'SPINACH', 1)])
+    seed('beverage.db', 'beverages', 'beverage_ratings', 'beverage_name',
+         [('Green Tea', 0.2), ('Cocoa', 0.8)],
+         [('Ana', 'Green Tea', 5), ('Ana', 'cocoa', 2)])
+
+    prefs = get_crew_meal_preferences(['Ana', 'Ben'])
+
+    assert prefs['Ana']['avg_food_cpg'] == 2.5  # Spinach is rated 1, so not eligible
+    assert prefs['Ana']['avg_bev_cpg'] == 0.5
+    assert prefs['Ben']['avg_food_cpg'] is None
+
+    # The rating maps still line up with the catalog in the planner
+    planner = MealPlanner(
+        'Ana', 2400,
+        [{'name': 'Oats', 'calories_per_gram': 2.0}, {'name': 'Dried Mango', 'calories_per_gram': 3.0},
+         {'name': 'Spinach', 'calories_per_gram': 0.5}],
+        [{'name': 'Green Tea', 'calories_per_gram': 0.2}, {'name': 'Cocoa', 'calories_per_gram': 0.8}],
+        1, prefs['Ana']['food_ratings'], prefs['Ana']['beverage_ratings'], 1, backend='direct', seed=0,
+    )
+    assert [f['food_name'] for f in planner.foods] == ['Oats', 'Dried Mango']
+    assert [b['beverage_name'] for b in planner.beverages] == ['Green Tea', 'Cocoa']
+
+
+def test_rating_join_uses_lower_name_indexes(workdir):
+    conn = connect_unified()
+    for table, index in (('food_ratings', 'idx_food_ratings_crew_lower_name'),
+                         ('beverage_ratings', 'idx_beverage_ratings_crew_lower_name')):
+        schema = 'nutrition' if table == 'food_ratings' else 'beverage'
+        indexes = {row[1] for row in conn.execute(f"PRAGMA {schema}.index_list({table})")}
+        assert index in indexes
+    conn.close()
@@ -0,0 +1,52 @@
+# tests/test_medical_expert.py
+from itertools import combinations
+
+import pytest
+
+from medical_expert import SYMPTOM_RECOMMENDATIONS, builtin_rules, diagnose, run_expert_system
+from rule_packs import compile_rules
+
+SEVERITIES = sorted({severity for _, severity in SYMPTOM_RECOMMENDATIONS}) + ['unknown']
+SYMPTOMS = sorted({symptom for symptom, _ in SYMPTOM_RECOMMENDATIONS})
+FACTS = [{'symptom': s, 'severity': sev} for s in SYMPTOMS for sev in SEVERITIES]
+PHASES = (None, 'early', 'mid', 'late', 'unknown')
+RULES = compile_rules(builtin_rules())
+
+
+def mismatches(symptom_sets):
+    """Inputs where the compiled table and the experta engine recommend different things."""
+    found = []
+    for symptoms in symptom_sets:
+        for phase in PHASES:
+            for centrifuge in (False, True):
+                compiled = diagnose(symptoms, phase, centrifuge, RULES)
+                expected = run_expert_system(symptoms, phase, centrifuge)
+                if len(compiled) != len(expected) or set(compiled) != set(expected):
+                    found.append((symptoms, phase, centrifuge))
+    return found
+
+
+def test_compiled_rules_match_experta_without_symptoms():
+    assert mismatches([[]]) == []
+
+
+@pytest.mark.parametrize('symptom', SYMPTOMS)
+def test_compiled_rules_match_experta_for_every_severity(symptom):
+    facts = [f for f in FACTS if f['symptom'] == symptom]
+    assert mismatches([[f] for f in facts]) == []
+
+
+@pytest.mark.parametrize('symptom', SYMPTOMS)
+def test_compiled_rules_match_experta_for_symptom_pairs(symptom):
+    # Each pair is checked once, under the alphabetically first of its symptoms
+    pairs = [list(pair) for pair in combinations(FACTS, 2) if pair[0]['symptom'] == symptom]
+    assert mismatches(pairs) == []
+
+
+def test_compiled_rules_match_experta_for_all_symptoms_at_once():
+    assert mismatches([FACTS]) == []
+
+
+def test_compiled_rules_cover_every_symptom_and_severity():
+    for symptom, severity in SYMPTOM_RECOMMENDATIONS:
+        assert diagnose([{'symptom': symptom, 'severity': severity}], rules=RULES)
@@ -0,0 +1,78 @@
+# tests/test_medical_history.py
+from medical_history import advance_trend, get_medical_trends, record_diagnosis
+
+
+def replay(reports, window=14):
+    state = None
+    for day, severity in reports:
+        state = advance_trend(state, day, severity, window)
+    return state
+
+
+def test_rise_within_window_escalates():
+    trend = replay([(1, 'mild'), (5, 'moderate'), (9, 'severe')])
+    assert trend == {
+        'since_day': 1, 'since_severity': 'mild',
+        'last_day': 9, 'last_severity': 'severe',
+        'escalating': True,
+    }
+
+
+def test_holding_severity_keeps_the_run():
+    assert replay([(1, 'mild'), (3, 'mild')])['escalating'] is False
+    trend = replay([(1, 'mild'), (3, 'moderate'), (6, 'moderate')])
+    assert trend['escalating'] is True
+    assert (trend['since_day'], trend['last_day']) == (1, 6)
+
+
+def test_drop_in_severity_resets():
+    trend = replay([(1, 'mild'), (3, 'severe'), (4, 'moderate')])
+    assert trend == {
+        'since_day': 4, 'since_severity': 'moderate',
+        'last_day': 4, 'last_severity': 'moderate',
+        'escalating': False,
+    }
+
+
+def test_gap_longer_than_window_resets():
+    trend = replay([(1, 'mild'), (20, 'moderate')])
+    assert trend['escalating'] is False
+    assert trend['since_day'] == 20
+
+
+def test_run_never_spans_more_than_the_window():
+    # Each gap is short, but mild (day 1) → moderate (day 20) is 19 days apart
+    trend = replay([(1, 'mild'), (8, 'mild'), (15, 'mild'), (20, 'moderate')])
+    assert trend['escalating'] is True
+    assert (trend['since_day'], trend['since_severity']) == (15, 'mild')
+
+    # Holding a severity past the window ends the escalation
+    trend = replay([(1, 'mild'), (5, 'moderate'), (12, 'moderate'), (18, 'moderate')])
+    assert trend['escalating'] is False
+    assert (trend['since_day'], trend['last_day']) == (12, 18)
+
+
+def test_back_dated_and_unknown_reports_leave_the_trend():
+    state = replay([(1, 'mild'), (5, 'moderate')])
+    assert advance_trend(state, 3, 'severe') is state
+    assert advance_trend(state, 6, 'unknown') is state
+
+
+def test_stale_escalations_age_out(workdir):
+    def report(day, symptom, severity):
+        return record_diagnosis('Ana', day, [{'symptom': symptom, 'severity': severity}], [])
+
+    report(1, 'vision_issue', 'mild')
+    escalating = report(5, 'vision_issue', 'moderate')
+    assert [t['symptom'] for t in escalating] == ['vision_issue']
+    assert [t['symptom'] for t in get_medical_trends('Ana')] == ['vision_issue']
+
+    # Later reports of other symptoms move the crew member's log past the window
+    report(19, 'headache', 'mild')
+    assert [t['symptom'] for t in get_medical_trends('Ana')] == ['vision_issue']
+    report(20, 'headache', 'mild')
+    assert get_medical_trends('Ana') == []
+
+    all_trends = {t['symptom']: t for t in get_medical_trends('Ana', escalating_only=False)}
+    assert all_trends['vision_issue']['escalating'] is False
+    assert all_trends['vision_issue']['last_day'] == 5
@@ -0,0 +1,64 @@
+# tests/test_monte_carlo.py
+import numpy as np
+import pytest
+
+from engine import _monte_carlo_chunk, simulate_life_support_mass
+
+FACTS = {
+    'duration': 180, 'body_masses': [70, 82, 65, 90], 'activity': 'moderate',
+    'oxygen_tank_weight_per_kg': 1.2, 'weight_limit': 5500,
+    'use_scrubber': False, 'use_recycler': True,
+    'co2_scrubber_efficiency': 0, 'scrubber_weight_per_kg': 0,
+    'co2_recycler_efficiency': 70, 'recycler_weight': 400,
+    'nitrogen_tank_weight_per_kg': 1.2, 'hygiene_water_per_day': 1500,
+    'use_water_recycler': True, 'water_recycler_efficiency': 85, 'water_recycler_weight': 450,
+}
+DISTRIBUTIONS = {
+    'co2_recycler_efficiency': {'dist': 'normal', 'mean': 70, 'std': 8, 'min': 0, 'max': 100},
+    'water_recycler_efficiency': {'dist': 'triangular', 'left': 70, 'mode': 85, 'right': 93},
+    'hygiene_water_per_day': {'dist': 'uniform', 'low': 1000, 'high': 2500},
+    'activity': {'dist': 'choice', 'values': ['low', 'moderate', 'daily'], 'p': [0.2, 0.6, 0.2]},
+}
+
+
+def all_totals(samples, chunk_size, seed):
+    """Every sampled total, drawn with the same chunking and seeds as the simulator."""
+    base = {k: v for k, v in FACTS.items() if k != 'body_masses'}
+    base['crew_count'] = len(FACTS['body_masses'])
+    base['body_mass_total'] = float(sum(FACTS['body_masses']))
+    sizes = [min(chunk_size, samples - start) for start in range(0, samples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    chunks = [_monte_carlo_chunk((base, DISTRIBUTIONS, size, s, size)) for size, s in zip(sizes, seeds)]
+    return np.concatenate([kept.astype(np.float64) for *_, kept in chunks]), sum(c[3] for c in chunks)
+
+
+def test_streaming_summary_matches_full_sample():
+    totals, exceeded = all_totals(50_000, 7_000, seed=3)
+    result = simulate_life_support_mass(FACTS, DISTRIBUTIONS, samples=50_000, chunk_size=7_000,
+                                        seed=3, percentile_samples=5_000)
+
+    assert result['mean_mass'] == pytest.approx(totals.mean(), abs=0.01)
+    assert result['std_mass'] == pytest.approx(totals.std(), abs=0.01)
+    assert result['prob_exceed_limit'] == round(exceeded / 50_000, 4)
+    assert 0 < result['prob_exceed_limit'] < 1
+
+    # Percentiles from the bounded subsample land close to the full-sample ones
+    assert result['percentile_samples'] <= 5_000
+    spread = np.percentile(totals, 99) - np.percentile(totals, 1)
+    for p in (5, 50, 95):
+        assert result['percentiles'][f'p{p}'] == pytest.approx(np.percentile(totals, p), abs=0.02 * spread)
+
+
+def test_small_runs_keep_exact_percentiles():
+    totals, _ = all_totals(4_000, 1_500, seed=5)
+    result = simulate_life_support_mass(FACTS, DISTRIBUTIONS, samples=4_000, chunk_size=1_500, seed=5)
+
+    assert result['percentile_samples'] == 4_000
+    for p in (5, 50, 95, 99):
+        assert result['percentiles'][f'p{p}'] == round(float(np.percentile(totals.astype(np.float32), p)), 2)
+
+
+def test_seed_gives_same_answer_with_workers():
+    kwargs = dict(samples=30_000, chunk_size=10_000, seed=11, percentile_samples=3_000)
+    assert simulate_life_support_mass(FACTS, DISTRIBUTIONS, workers=2, **kwargs) == \
+        simulate_life_support_mass(FACTS, DISTRIBUTIONS, **kwargs)
@@ -0,0 +1,90 @@
+# tests/test_rule_packs.py
+import json
+import os
+
+from rule_packs import RuleBook
+
+BASE_RULES = [{'symptom': 'headache', 'severity': 'mild', 'recommendation': '💊 Base headache advice'}]
+
+
+def write_pack(path, rules):
+    # Write then rename, as the module docstring asks of pack files
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'rules': rules}, f)
+    os.replace(tmp, path)
+
+
+def recommend(book, symptom, severity='mild'):
+    return book.current().diagnose([{'symptom': symptom, 'severity': severity}])
+
+
+def bump_mtime(path):
+    # Some filesystems have coarse mtimes; make sure the signature changes
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_rulebook_hot_reloads_changed_pack(tmp_path):
+    path = str(tmp_path / 'rules.json')
+    write_pack(path, [{'symptom': 'nosebleed', 'recommendation': '🩸 Pinch and lean forward'}])
+    book = RuleBook(path, BASE_RULES, check_seconds=0)
+
+    assert recommend(book, 'nosebleed') == ['🩸 Pinch and lean forward']
+    assert recommend(book, 'headache') == ['💊 Base headache advice']
+    before = book.current()
+
+    write_pack(path, [{'symptom': 'nosebleed', 'severity': 'severe', 'recommendation': '🚨 Call the flight surgeon'}])
+    bump_mtime(path)
+
+    assert recommend(book, 'nosebleed') == []
+    assert recommend(book, 'nosebleed', 'severe') == ['🚨 Call the flight surgeon']
+    assert recommend(book, 'headache') == ['💊 Base headache advice']
+    # A matcher already handed out keeps the old rules
+    assert before.diagnose([{'symptom': 'nosebleed', 'severity': 'mild'}]) == ['🩸 Pinch and lean forward']
+    assert book.status()['rule_count'] == 2
+
+
+def test_rulebook_keeps_rules_when_pack_breaks(tmp_path):
+    path = str(tmp_path / 'rules.json')
+    write_pack(path, [{'symptom': 'nosebleed', 'recommendation': '🩸 Pinch and lean forward'}])
+    book = RuleBook(path, BASE_RULES, check_seconds=0)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"rules": [')
+    bump_mtime(path)
+
+    assert recommend(book, 'nosebleed') == ['🩸 Pinch and lean forward']
+    assert book.status()['error']
+
+    write_pack(path, [{'symptom': 'insomnia', 'recommendation': '🌙 Keep a fixed sleep window'}])
+    bump_mtime(path)
+
+    assert recommend(book, 'insomnia') == ['🌙 Keep a fixed sleep window']
+    assert recommend(book, 'nosebleed') == []
+    assert book.status()['error'] is None
+
+
+def test_rulebook_falls_back_to_base_rules_when_pack_removed(tmp_path):
+    path = str(tmp_path / 'rules.json')
+    write_pack(path, [{'symptom': 'nosebleed', 'recommendation': '🩸 Pinch and lean forward'}])
+    book = RuleBook(path, BASE_RULES, check_seconds=0)
+
+    os.remove(path)
+
+    assert recommend(book, 'nosebleed') == []
+    assert recommend(book, 'headache') == ['💊 Base headache advice']
+
+
+def test_rulebook_waits_for_check_interval(tmp_path):
+    path = str(tmp_path / 'rules.json')
+    write_pack(path, [{'symptom': 'nosebleed', 'recommendation': '🩸 Pinch and lean forward'}])
+    book = RuleBook(path, BASE_RULES, check_seconds=3600)
+    book.current()  # uses up the first check
+
+    write_pack(path, [])
+    bump_mtime(path)
+
+    assert recommend(book, 'nosebleed') == ['🩸 Pinch and lean forward']
+    assert book.reload() is True
+    assert recommend(book, 'nosebleed') == []
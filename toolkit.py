@@ -1,18 +1,18 @@
 # toolkit.py
 
 import requests
-import sqlite3
 import pandas as pd
 from db_utils import (
+    connect,
     insert_or_update,
     fetch_all_records,
     get_latest_gas_budget_record,
     get_cumulative_meal_mass,
-    insert_gas_budget,
     get_latest_remaining_mass_budget
 )
 import re
 from tavily_search import tavily_search
+from log_config import get_logger
 
 # === Static tools the LLM can call directly ===
 
@@ -207,8 +207,9 @@ def database_reset(db_name):
     else:
         return f"⚠️ Reset not implemented for `{db_name}`."
 
-from db_utils import insert_gas_budget, get_cumulative_meal_mass
+from db_utils import queue_gas_budget, get_cumulative_meal_mass
 from engine import LifeSupportEngine, LifeSupportFacts
+from engine_pool import checkout_engine
 from datetime import datetime
 def parse_body_masses(raw_list):
     masses = []
@@ -296,29 +297,29 @@ def generate_gas_budget(
         raise ValueError("No valid crew body masses provided.")
 
     # === Life support engine run
-    engine = LifeSupportEngine()
-    engine.reset()
-    engine.declare(LifeSupportFacts(
-        duration=duration,
-        crew_count=len(body_masses),
-        body_masses=body_masses,
-        activity=activity,
-        oxygen_tank_weight_per_kg=oxygen_tank_weight_per_kg,
-        weight_limit=weight_limit,
-        use_scrubber=use_scrubber,
-        use_recycler=use_recycler,
-        co2_scrubber_efficiency=co2_scrubber_efficiency,
-        scrubber_weight_per_kg=scrubber_weight_per_kg,
-        co2_recycler_efficiency=co2_recycler_efficiency,
-        recycler_weight=recycler_weight,
-        nitrogen_tank_weight_per_kg=nitrogen_tank_weight_per_kg,
-        hygiene_water_per_day=hygiene_water_per_day,
-        use_water_recycler=use_water_recycler,
-        water_recycler_efficiency=water_recycler_efficiency,
-        water_recycler_weight=water_recycler_weight
-    ))
-    engine.run()
-    results = engine.results
+    with checkout_engine(LifeSupportEngine) as engine:
+        engine.reset()
+        engine.declare(LifeSupportFacts(
+            duration=duration,
+            crew_count=len(body_masses),
+            body_masses=body_masses,
+            activity=activity,
+            oxygen_tank_weight_per_kg=oxygen_tank_weight_per_kg,
+            weight_limit=weight_limit,
+            use_scrubber=use_scrubber,
+            use_recycler=use_recycler,
+            co2_scrubber_efficiency=co2_scrubber_efficiency,
+            scrubber_weight_per_kg=scrubber_weight_per_kg,
+            co2_recycler_efficiency=co2_recycler_efficiency,
+            recycler_weight=recycler_weight,
+            nitrogen_tank_weight_per_kg=nitrogen_tank_weight_per_kg,
+            hygiene_water_per_day=hygiene_water_per_day,
+            use_water_recycler=use_water_recycler,
+            water_recycler_efficiency=water_recycler_efficiency,
+            water_recycler_weight=water_recycler_weight
+        ))
+        engine.run()
+        results = engine.results
 
     # Compute combined mass manually
     meal_mass = get_cumulative_meal_mass()
@@ -339,8 +340,8 @@ def generate_gas_budget(
     if missing:
         raise ValueError(f"🚨 Life support engine failed to generate required keys: {missing}")
 
-    # === Insert into DB
-    insert_gas_budget("gas_budget.db", {
+    # === Queue the DB insert (written behind on the gas budget writer thread)
+    queue_gas_budget("gas_budget.db", {
         'timestamp': datetime.now().isoformat(),
         'duration': duration,
         'crew_count': len(body_masses),
@@ -390,10 +391,8 @@ def generate_gas_budget(
     }
 
 
-import sqlite3
-
 def insert_food(name, calories_per_gram, fat_per_gram=0, sugar_per_gram=0, protein_per_gram=0):
-    conn = sqlite3.connect("nutrition.db")
+    conn = connect("nutrition.db")
     cursor = conn.cursor()
     cursor.execute("""
         INSERT INTO foods (name, calories_per_gram, fat_per_gram, sugar_per_gram, protein_per_gram)
@@ -409,7 +408,7 @@ def insert_food(name, calories_per_gram, fat_per_gram=0, sugar_per_gram=0, prote
     return f"✅ Food '{name}' added or updated."
 
 def insert_beverage(name, calories_per_gram, fat_per_gram=0, sugar_per_gram=0, protein_per_gram=0):
-    conn = sqlite3.connect("beverage.db")
+    conn = connect("beverage.db")
     cursor = conn.cursor()
     cursor.execute("""
         INSERT INTO beverages (name, calories_per_gram, fat_per_gram, sugar_per_gram, protein_per_gram)
@@ -425,7 +424,7 @@ def insert_beverage(name, calories_per_gram, fat_per_gram=0, sugar_per_gram=0, p
     return f"✅ Beverage '{name}' added or updated."
 
 def insert_food_rating(crew_name, food_name, rating):
-    conn = sqlite3.connect("nutrition.db")
+    conn = connect("nutrition.db")
     cursor = conn.cursor()
     cursor.execute("""
         INSERT INTO food_ratings (crew_name, food_name, rating)
@@ -438,7 +437,7 @@ def insert_food_rating(crew_name, food_name, rating):
     return f"✅ Rating set: {crew_name} → {food_name} = {rating}"
 
 def insert_beverage_rating(crew_name, beverage_name, rating):
-    conn = sqlite3.connect("beverage.db")
+    conn = connect("beverage.db")
     cursor = conn.cursor()
     cursor.execute("""
         INSERT INTO beverage_ratings (crew_name, beverage_name, rating)
@@ -458,7 +457,7 @@ def insert_meal_schedule(meals, sufficiency_map=None):
 
 
 def insert_food_ratings(ratings: list):
-    conn = sqlite3.connect("nutrition.db")
+    conn = connect("nutrition.db")
     cursor = conn.cursor()
 
     for r in ratings:
@@ -480,55 +479,52 @@ def insert_food_ratings(ratings: list):
 def start_medical_interview():
     return {
         "status": "🩺 Interview started.",
-        "instructions": "Please list any symptoms from the list, their severity, whether they are on a centrifuge and current mission day. def run_medical_diagnosis(symptoms: list, mission_day: int, centrifugal_habitat: bool = False)"
+        "instructions": "Please list any symptoms from the list, their severity, whether they are on a centrifuge, current mission day and which crew member this is for. def run_medical_diagnosis(symptoms: list, mission_day: int, centrifugal_habitat: bool = False, crew_name: str = None)"
     }
 
 # Real execution tool
-def run_medical_diagnosis(symptoms: list, mission_day: int, centrifugal_habitat: bool = False):
-    from experta import Fact
-    from medical_expert import SpaceMedicalExpertSystem  # Ensure this import is correct
-    import sys
-
-    print("🧠 [DIAGNOSIS STARTED]", file=sys.stderr, flush=True)
-    print(f"📅 Mission day: {mission_day}", file=sys.stderr, flush=True)
-    print(f"🌀 Centrifugal habitat: {centrifugal_habitat}", file=sys.stderr, flush=True)
-    print(f"🧾 Symptoms: {symptoms}", file=sys.stderr, flush=True)
+def run_medical_diagnosis(symptoms: list, mission_day: int, centrifugal_habitat: bool = False, crew_name: str = None):
+    from medical_expert import diagnose, mission_phase_for_day
+    from medical_history import record_diagnosis, describe_trend
 
-    expert = SpaceMedicalExpertSystem()
-    expert.reset()
+    log = get_logger('medical')
+    log.debug("🧠 [DIAGNOSIS STARTED] day=%s centrifugal_habitat=%s symptoms=%s",
+              mission_day, centrifugal_habitat, symptoms)
 
     # Determine mission phase
-    if mission_day < 15:
-        phase = 'early'
-    elif mission_day < 90:
-        phase = 'mid'
-    else:
-        phase = 'late'
+    phase = mission_phase_for_day(mission_day)
+    log.debug("🕒 Mission phase: %s", phase)
 
-    print(f"🕒 Declaring mission phase: {phase}", file=sys.stderr, flush=True)
-    expert.declare(Fact(mission_phase=phase))
+    results = diagnose(symptoms, phase, bool(centrifugal_habitat))
+    log.debug("✅ Diagnosis complete. Recommendations: %s", results)
 
-    # Declare symptoms
-    for entry in symptoms:
-        print(f"➕ Declaring symptom: {entry['symptom']}, severity: {entry['severity']}", file=sys.stderr, flush=True)
-        expert.declare(Fact(symptom=entry['symptom'], severity=entry['severity']))
+    # Log it to the crew member's history and surface any escalating symptoms
+    if crew_name:
+        trends = record_diagnosis(crew_name, mission_day, symptoms, results,
+                                  mission_phase=phase, centrifugal_habitat=bool(centrifugal_habitat))
+        results = results + [describe_trend(trend['symptom'], trend) for trend in trends]
 
-    # Optional: centrifugal environment
-    if centrifugal_habitat:
-        print("🌪️ Declaring centrifugal_habitat=True", file=sys.stderr, flush=True)
-        expert.declare(Fact(centrifugal_habitat=True))
+    return results
 
-    expert.run()
 
-    results = expert.get_results().split('\n')
-    print("✅ Diagnosis complete. Recommendations:", file=sys.stderr, flush=True)
-    for r in results:
-        print("   •", r, file=sys.stderr, flush=True)
 
-    return results
 
+def run_trade_study(ranges: dict, body_masses="current", limit: int = 20):
+    from trade_study import sweep_pareto_front, front_records
 
+    if isinstance(body_masses, str) and body_masses.strip().lower() == "current":
+        body_masses = fetch_all_records("astronauts.db", "crew")["mass"].tolist()
+    body_masses = [float(m) for m in body_masses]
+    if not body_masses:
+        raise ValueError("No valid crew body masses provided.")
 
+    front, grid_size = sweep_pareto_front(ranges, body_masses)
+    records = list(front_records(front))
+    return {
+        "grid_size": grid_size,
+        "front_size": len(records),
+        "pareto_front": records[:limit]
+    }
 
 
 # === Tool registry the LLM agent will have access to ===
@@ -555,5 +551,6 @@ tools = {
     "search_facts": tavily_search,
     "insert_food_ratings": insert_food_ratings,
     "start_medical_interview": start_medical_interview,
-    "run_medical_diagnosis": run_medical_diagnosis
+    "run_medical_diagnosis": run_medical_diagnosis,
+    "run_trade_study": run_trade_study
 }
\ No newline at end of file
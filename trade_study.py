@@ -0,0 +1,158 @@
+# trade_study.py
+"""
+Grid sweeps over the life support mass model.
+
+A study is a dict of parameter ranges. Each range is a list of values, a
+{"start", "stop", "num"} linspace, or a single scalar. Any parameter left out
+takes its value from STUDY_DEFAULTS. The grid is evaluated in chunks with
+compute_life_support_arrays. Only the running Pareto front of total mass
+(minimized) against reclaimed O2 and recovered water (maximized) is kept.
+"""
+import json
+
+import numpy as np
+
+from engine import ACTIVITY_LEVELS, RESULT_FIELDS, compute_life_support_arrays
+
+CO2_SYSTEMS = ('scrubber', 'recycler', 'none')
+
+STUDY_DEFAULTS = {
+    'duration': 7,
+    'activity': 'moderate',
+    'co2_system': 'scrubber',
+    'oxygen_tank_weight_per_kg': 1.2,
+    'nitrogen_tank_weight_per_kg': 1.2,
+    'co2_scrubber_efficiency': 98,
+    'scrubber_weight_per_kg': 0.4,
+    'co2_recycler_efficiency': 0,
+    'recycler_weight': 0,
+    'hygiene_water_per_day': 1500,
+    'use_water_recycler': True,
+    'water_recycler_efficiency': 85,
+    'water_recycler_weight': 450,
+    'weight_limit': 850,
+}
+
+
+def expand_range(spec):
+    """Turn one range spec into a 1-D array of values."""
+    if isinstance(spec, dict):
+        return np.linspace(float(spec['start']), float(spec['stop']), int(spec.get('num', 10)))
+    if isinstance(spec, (list, tuple)):
+        return np.asarray(spec)
+    return np.asarray([spec])
+
+
+def study_axes(ranges):
+    """(name, values) for every study parameter, categorical axes encoded as indexes."""
+    unknown = set(ranges) - set(STUDY_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown trade study parameters: {sorted(unknown)}")
+
+    axes = []
+    for name, default in STUDY_DEFAULTS.items():
+        values = expand_range(ranges.get(name, default))
+        if name in ('activity', 'co2_system'):
+            choices = ACTIVITY_LEVELS if name == 'activity' else CO2_SYSTEMS
+            invalid = [str(v) for v in values if v not in choices]
+            if invalid:
+                raise ValueError(f"Invalid {name} values {invalid}. Choose from {choices}.")
+            values = np.array([choices.index(v) for v in values])
+        elif name == 'use_water_recycler':
+            values = values.astype(bool)
+        axes.append((name, values))
+    return axes
+
+
+def pareto_mask(mass, o2, water):
+    """
+    Boolean mask of points not dominated on (min mass, max o2, max water).
+    Exact duplicates keep a single representative.
+    """
+    # The lightest remaining candidate (best o2, then water, on ties) is always on
+    # the front; drop everything it dominates and repeat. Cost is O(n × front size).
+    candidates = np.lexsort((-water, -o2, mass))
+    keep = np.zeros(len(mass), dtype=bool)
+    while candidates.size:
+        best = candidates[0]
+        keep[best] = True
+        rest = candidates[1:]
+        dominated = (o2[rest] <= o2[best]) & (water[rest] <= water[best])
+        candidates = rest[~dominated]
+    return keep
+
+
+def sweep_pareto_front(ranges, body_masses, chunk_size=50_000):
+    """
+    Evaluate every grid point for a fixed crew and return the Pareto front as a
+    dict of arrays (parameters plus RESULT_FIELDS) and the grid size.
+    """
+    axes = study_axes(ranges)
+    names = [name for name, _ in axes]
+    shape = tuple(len(values) for _, values in axes)
+    grid_size = int(np.prod(shape))
+    crew_count = len(body_masses)
+    body_mass_total = float(sum(body_masses))
+
+    front = None
+    for start in range(0, grid_size, chunk_size):
+        coords = np.unravel_index(np.arange(start, min(start + chunk_size, grid_size)), shape)
+        params = {name: values[c] for (name, values), c in zip(axes, coords)}
+
+        co2_system = params['co2_system']
+        out = compute_life_support_arrays(
+            duration=params['duration'],
+            crew_count=crew_count,
+            body_mass_total=body_mass_total,
+            activity=params['activity'],
+            oxygen_tank_weight_per_kg=params['oxygen_tank_weight_per_kg'],
+            weight_limit=params['weight_limit'],
+            use_scrubber=co2_system == CO2_SYSTEMS.index('scrubber'),
+            use_recycler=co2_system == CO2_SYSTEMS.index('recycler'),
+            co2_scrubber_efficiency=params['co2_scrubber_efficiency'],
+            scrubber_weight_per_kg=params['scrubber_weight_per_kg'],
+            co2_recycler_efficiency=params['co2_recycler_efficiency'],
+            recycler_weight=params['recycler_weight'],
+            nitrogen_tank_weight_per_kg=params['nitrogen_tank_weight_per_kg'],
+            hygiene_water_per_day=params['hygiene_water_per_day'],
+            use_water_recycler=params['use_water_recycler'],
+            water_recycler_efficiency=params['water_recycler_efficiency'],
+            water_recycler_weight=params['water_recycler_weight']
+        )
+
+        n = len(coords[0])
+        chunk = {name: np.broadcast_to(params[name], n) for name in names}
+        chunk.update({key: np.broadcast_to(out[key], n) for key in RESULT_FIELDS})
+
+        # Merge with the running front, then keep only the non-dominated points
+        if front is not None:
+            chunk = {key: np.concatenate([front[key], chunk[key]]) for key in chunk}
+        mask = pareto_mask(chunk['total_life_support_mass'], chunk['o2_reclaimed'], chunk['water_recovered'])
+        front = {key: values[mask] for key, values in chunk.items()}
+
+    return front, grid_size
+
+
+def front_records(front):
+    """Pareto front arrays as JSON-ready dicts, lightest configuration first."""
+    if not front:
+        return
+    order = np.argsort(front['total_life_support_mass'], kind='stable')
+    for i in order:
+        record = {}
+        for key, values in front.items():
+            value = values[i].item()
+            if key == 'activity':
+                value = ACTIVITY_LEVELS[value]
+            elif key == 'co2_system':
+                value = CO2_SYSTEMS[value]
+            elif isinstance(value, float):
+                value = round(value, 2)
+            record[key] = value
+        yield record
+
+
+def iter_ndjson(records):
+    """One JSON document per line."""
+    for record in records:
+        yield json.dumps(record) + '\n'